@@ -1,2 +1,20 @@
 from .base_analyzator import AnalyzerSignals, BaseAnalyzer
-from .rohde_schwarz import RohdeSchwarzAnalyzer, RohdeSchwarzEmulator
+from .s_matrix import SMatrix
+from .buffer_pool import SweepBufferPool
+from .analyzator_parameters import AnalyzatorType
+from .registry import create_analyzer, analyzer_class, register_analyzer
+from .averaging import HostAveraging, AveragedSMatrix, StreamingMean
+from .ifbw import calibrate_ifbw, IfbwCalibration, IfbwChoice, STANDARD_BANDWIDTHS
+
+# драйверы с необязательными зависимостями импортируются при первом обращении
+_LAZY = {
+    'RohdeSchwarzAnalyzer': '.rohde_schwarz',
+    'RohdeSchwarzEmulator': '.rohde_schwarz',
+}
+
+
+def __getattr__(name: str):
+    if (module := _LAZY.get(name)) is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    import importlib
+    return getattr(importlib.import_module(module, __name__), name)
@@ -1,6 +1,7 @@
 from enum import Enum, unique
+from functools import cached_property, lru_cache
 from itertools import product
-from typing import List
+from typing import Dict, Sequence, Tuple
 from dataclasses import dataclass
 
 
@@ -42,13 +43,28 @@ class ResultsFormatType(Enum):
 
 
 class SParameters:
-    def __init__(self, ports: List = [1, 2]):
-        self.ports = ports
+    def __init__(self, ports: Sequence = (1, 2)):
+        self.ports = list(ports)
         self.repeat, self.prefix = 2, 'S'
         self.parameters = [f'{self.prefix}{p1}{p2}' for (p1, p2)
-                           in product(ports, repeat=self.repeat)]
+                           in product(self.ports, repeat=self.repeat)]
 
-    @property
+    @classmethod
+    def for_ports(cls, ports: Sequence) -> 'SParameters':
+        """
+        Общий экземпляр для набора портов, чтобы не строить индекс и Enum заново
+        """
+        return _s_parameters(tuple(ports))
+
+    @cached_property
+    def index(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Индексы (i, j) параметра в S матрице по его названию
+        """
+        n = len(self.ports)
+        return {p: divmod(k, n) for k, p in enumerate(self.parameters)}
+
+    @cached_property
     def enum(self):
         return Enum('SParameters', {p: p for p in self.parameters})
 
@@ -57,6 +73,11 @@ class SParameters:
         return type(self.enum)
 
 
+@lru_cache(maxsize=None)
+def _s_parameters(ports: Tuple) -> SParameters:
+    return SParameters(ports)
+
+
 if __name__ == "__main__":
     params = SParameters().enum
     print(params.S11._value)
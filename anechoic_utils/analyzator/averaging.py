@@ -0,0 +1,159 @@
+"""
+Усреднение на компьютере: развертки повторяются, пока шум среднего не станет меньше заданного
+"""
+from contextlib import AsyncExitStack, ExitStack
+from dataclasses import dataclass
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from .base_analyzator import BaseAnalyzer
+from .s_matrix import SMatrix
+
+import logging
+logger = logging.getLogger('analyzator.averaging')
+
+
+class StreamingMean:
+    """
+    Потоковые среднее и дисперсия комплексных данных по каждому элементу (алгоритм Уэлфорда)
+    """
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = np.zeros(shape, dtype=np.complex128)
+        self._m2 = np.zeros(shape)
+        self._delta = np.empty(shape, dtype=np.complex128)
+
+    def update(self, data: np.ndarray) -> None:
+        self.count += 1
+        np.subtract(data, self.mean, out=self._delta)
+        self.mean += self._delta / self.count
+        # |x - mean_old| * |x - mean_new| -- несмещенная сумма квадратов для комплексных данных
+        self._m2 += (self._delta * np.conj(data - self.mean)).real
+
+    @property
+    def variance(self) -> np.ndarray:
+        """
+        Дисперсия одной развертки E|x - mean|^2, для одной развертки -- бесконечность
+        """
+        if self.count < 2:
+            return np.full(self._m2.shape, np.inf)
+        return self._m2 / (self.count - 1)
+
+    def noise(self, sweep_noise: Union[float, np.ndarray] = None) -> np.ndarray:
+        """
+        Стандартная ошибка комплексного среднего
+
+        :param sweep_noise: известный шум одной развертки, иначе оценивается по разбросу
+        """
+        variance = self.variance if sweep_noise is None else np.square(sweep_noise)
+        return np.sqrt(variance / max(self.count, 1))
+
+    def snr(self, sweep_noise: Union[float, np.ndarray] = None) -> np.ndarray:
+        """
+        Отношение модуля среднего к его шуму в дБ
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 20 * np.log10(np.abs(self.mean) / self.noise(sweep_noise))
+
+
+class AveragedSMatrix(SMatrix):
+    """
+    Результат усреднения: среднее, число разверток и достигнутое отношение сигнал/шум
+    """
+    count: int = 1
+    snr: np.ndarray = None  # дБ, та же форма, что у data
+
+    def snr_of(self, key) -> np.ndarray:
+        """
+        Отношение сигнал/шум параметра по частотам в дБ
+        """
+        return self.snr[self.index(key)]
+
+    @property
+    def min_snr(self) -> float:
+        """
+        Худшее отношение сигнал/шум по измеренным параметрам и частотам в дБ
+        """
+        return float(self.snr[self.measured].min())
+
+
+@dataclass
+class HostAveraging:
+    """
+    Развертки повторяются, пока у доли частот не меньше 1 - quantile отношение модуля среднего
+    к его шуму не станет больше target_snr, но не больше max_count раз. Шум одной развертки оценивается
+    по разбросу, поэтому нужно хотя бы две развертки; если шум известен заранее (sweep_noise),
+    достаточно одной. Перед каждым чтением запускается отдельная развертка (trigger_sweep),
+    иначе при непрерывных развертках можно прочитать одни и те же данные дважды. Непрерывные развертки
+    выключаются на время усреднения (single_sweeps) и после него включаются снова, а трассы
+    параметров определяются до первой развертки.
+    """
+    target_snr: float = 40.  # дБ
+    max_count: int = 10
+    min_count: int = 2
+    quantile: float = 0.1  # доля частот, которым разрешено не достичь target_snr (провалы диаграммы)
+    sweep_noise: Optional[Union[float, np.ndarray]] = None
+    trigger: bool = True
+
+    def _done(self, acc: StreamingMean, measured: np.ndarray) -> bool:
+        if acc.count >= self.max_count:
+            return True
+        if acc.count < (self.min_count if self.sweep_noise is None else 1):
+            return False
+        return bool(np.quantile(acc.snr(self.sweep_noise)[measured], self.quantile) >= self.target_snr)
+
+    @staticmethod
+    def _accumulate(acc: Optional[StreamingMean], result: SMatrix) -> StreamingMean:
+        if acc is None:
+            acc = StreamingMean(result.data.shape)
+        acc.update(result.data)
+        return acc
+
+    @staticmethod
+    def _template(result: SMatrix) -> AveragedSMatrix:
+        res = AveragedSMatrix(result.ports, np.array(result.frequencies))
+        res.measured[...] = result.measured
+        return res
+
+    def _result(self, acc: StreamingMean, res: AveragedSMatrix) -> AveragedSMatrix:
+        res.fill(acc.mean)
+        res.count = acc.count
+        res.snr = acc.snr(self.sweep_noise)
+        logger.debug('%d sweeps, min SNR %.1f dB', res.count, res.min_snr)
+        return res
+
+    def _triggered(self, analyzer: BaseAnalyzer) -> bool:
+        return self.trigger and hasattr(analyzer, 'trigger_sweep')
+
+    def measure(self, analyzer: BaseAnalyzer, parameters: Sequence[str]) -> AveragedSMatrix:
+        """
+        Усредненное измерение блокирующим драйвером
+        """
+        acc, res = None, None
+        with ExitStack() as stack:
+            if self._triggered(analyzer) and hasattr(analyzer, 'single_sweeps'):
+                stack.enter_context(analyzer.single_sweeps(parameters))
+            while acc is None or not self._done(acc, res.measured):
+                if self._triggered(analyzer):
+                    analyzer.trigger_sweep()
+                with analyzer.get_scattering_parameters(parameters) as result:
+                    acc = self._accumulate(acc, result)
+                    res = res if res is not None else self._template(result)
+        return self._result(acc, res)
+
+    async def measure_async(self, analyzer: BaseAnalyzer, parameters: Sequence[str]) -> AveragedSMatrix:
+        """
+        Усредненное измерение асинхронным драйвером
+        """
+        acc, res = None, None
+        async with AsyncExitStack() as stack:
+            if self._triggered(analyzer) and hasattr(analyzer, 'single_sweeps'):
+                await stack.enter_async_context(analyzer.single_sweeps(parameters))
+            while acc is None or not self._done(acc, res.measured):
+                if self._triggered(analyzer):
+                    await analyzer.trigger_sweep()
+                with await analyzer.get_scattering_parameters(parameters) as result:
+                    acc = self._accumulate(acc, result)
+                    res = res if res is not None else self._template(result)
+        return self._result(acc, res)
@@ -1,7 +1,11 @@
 import abc
-from typing import List
+from typing import List, Sequence
+import numpy as np
 from .analyzator_parameters import SParameters, FrequencyParameters, AnalyzatorType, ResultsFormatType
-from ..utils import EmptySignal
+from .s_matrix import SMatrix
+from .buffer_pool import SweepBufferPool
+from ..utils import Signal
+from ..session import SessionRecorder
 
 
 class AnalyzerConnectionError(Exception):
@@ -19,14 +23,14 @@ class AnalyzerSignals(metaclass=abc.ABCMeta):
 
     @property
     @abc.abstractmethod
-    def data(self) -> EmptySignal:
+    def data(self) -> Signal:
         """
         Сигнал с данными анализатора
         """
 
     @property
     @abc.abstractmethod
-    def is_connected(self) -> EmptySignal:
+    def is_connected(self) -> Signal:
         """
         Сигнал с состоянием анализатора
         """
@@ -36,6 +40,33 @@ class BaseAnalyzer(abc.ABC):
     """
     Базовый класс анализатора
     """
+    buffer_pool: SweepBufferPool = None
+    # если задан, каждый обмен с прибором пишется в запись сессии
+    recorder: SessionRecorder = None
+
+    def _acquire_result(self, parameters: Sequence[str], frequencies: np.ndarray) -> SMatrix:
+        """
+        Контейнер под результат свипа: буфер из пула, если он задан, иначе новая SMatrix
+
+        :param parameters: названия S параметров
+        :param frequencies: частоты в Гц
+        :return: контейнер для записи результатов
+        """
+        if self.buffer_pool is None:
+            return SMatrix.for_parameters(parameters, frequencies)
+        res = self.buffer_pool.acquire(parameters, len(frequencies))
+        res['f'] = frequencies
+        return res
+
+    @staticmethod
+    def _finalize_result(res: SMatrix) -> SMatrix:
+        """
+        Буферы из пула после заполнения отдаются только для чтения
+        """
+        if res.pooled:
+            res.freeze()
+        return res
+
     @abc.abstractmethod
     def connect(self) -> bool:
         """
@@ -52,9 +83,12 @@ class BaseAnalyzer(abc.ABC):
     def get_scattering_parameters(
             self,
             parameters: List[str],
-    ) -> dict[str: List[float]]:
+    ) -> SMatrix:
         """
         Получить S параметры
+
+        :param parameters: названия S параметров, например ['S11', 'S21']
+        :return: S матрица, с которой можно работать как со словарем {'S21': ..., 'f': ...}
         """
 
     @abc.abstractmethod
@@ -0,0 +1,85 @@
+"""
+Пул переиспользуемых буферов под результаты свипа
+"""
+import threading
+from collections import deque
+from typing import Deque, List, Sequence, Tuple
+
+from .s_matrix import SMatrix, ports_of
+
+import logging
+logger = logging.getLogger('analyzator.buffer_pool')
+
+
+class SweepBufferPool:
+    """
+    Кольцо заранее выделенных SMatrix одинакового размера.
+
+    Анализатор декодирует ответ прямо в свободный буфер и отдает его только для чтения.
+    Получатель обязан вернуть буфер вызовом res.release() (или через with), после чего
+    буфер будет использован для следующего свипа. При длинном скане память не растет
+    и не нагружается сборщик мусора.
+    Если изменился набор портов или число частот, пул выделяет буферы заново.
+    """
+    def __init__(self, size: int = 4, timeout: float = 10.):
+        """
+
+        :param size: число буферов в кольце
+        :param timeout: сколько ждать освобождения буфера в секундах, после этого acquire бросает TimeoutError.
+            None -- ждать бесконечно: если получатель не вызывает release(), свип зависнет навсегда
+        """
+        if size < 1:
+            raise ValueError('Pool size must be positive')
+        self.size = size
+        self.timeout = timeout
+        self._shape: Tuple = None
+        self._free: Deque[SMatrix] = deque()
+        self._buffers: List[SMatrix] = []
+        self._condition = threading.Condition()
+
+    def _allocate(self, ports: List[int], n_freq: int) -> None:
+        self._shape = (tuple(ports), n_freq)
+        self._buffers = [SMatrix(ports, n_freq) for _ in range(self.size)]
+        for buffer in self._buffers:
+            buffer._pool = self
+        self._free = deque(self._buffers)
+
+    def acquire(self, parameters: Sequence[str], n_freq: int) -> SMatrix:
+        """
+        Свободный буфер под параметры и число частот. Буфер доступен для записи до вызова freeze().
+
+        :param parameters: названия S параметров
+        :param n_freq: число частот
+        :return: буфер
+        """
+        ports = ports_of(parameters)
+        with self._condition:
+            if self._shape != (tuple(ports), n_freq):
+                # буферы старого размера, которые еще не вернули, просто не попадут обратно в пул
+                self._allocate(ports, n_freq)
+            if not self._free:
+                logger.warning(f'All {self.size} sweep buffers are in use, waiting for release()')
+            if not self._condition.wait_for(lambda: self._free, self.timeout):
+                raise TimeoutError(f'All {self.size} sweep buffers are in use, release the results')
+            buffer = self._free.popleft()
+        buffer._reset()
+        return buffer
+
+    def release(self, buffer: SMatrix) -> None:
+        """
+        Вернуть буфер в пул
+
+        :param buffer: буфер, полученный из acquire
+        """
+        with self._condition:
+            if any(buffer is b for b in self._buffers) and not any(buffer is b for b in self._free):
+                self._free.append(buffer)
+                self._condition.notify()
+
+    @property
+    def free(self) -> int:
+        """
+        Число свободных буферов
+        """
+        with self._condition:
+            return len(self._free)
@@ -0,0 +1,185 @@
+"""
+Выбор полосы ПЧ (IFBW): самая широкая полоса, при которой достигается нужное отношение сигнал/шум.
+Время развертки примерно обратно пропорционально полосе, поэтому полоса определяет скорость скана
+"""
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+
+from .averaging import StreamingMean
+from .base_analyzator import BaseAnalyzer
+
+import logging
+logger = logging.getLogger('analyzator.ifbw')
+
+# ряд 1-2-5 от 10 Гц до 1 МГц, такие полосы есть у большинства анализаторов
+STANDARD_BANDWIDTHS = tuple(float(m * 10 ** e) for e in range(1, 6) for m in (1, 2, 5)) + (1e6, )
+# если цель недостижима, берется самая широкая полоса не хуже лучшей больше чем на столько дБ
+UNREACHABLE_MARGIN = 1.
+
+
+@dataclass
+class IfbwChoice:
+    """
+    Выбранная полоса для каждого участка частот
+    """
+    bandwidths: List[float]
+    edges: List[Tuple[float, float]]  # границы участков в Гц
+    snr: List[float]  # предсказанное отношение сигнал/шум участка в дБ (квантиль по частотам)
+    sweep_time: float  # предсказанное время развертки в секундах
+
+    @property
+    def bandwidth(self) -> float:
+        """
+        Одна полоса на весь диапазон -- самая узкая из полос участков
+        """
+        return min(self.bandwidths)
+
+    def apply(self, analyzer: BaseAnalyzer) -> None:
+        """
+        Установить одну полосу на весь диапазон, остальные настройки анализатора не меняются
+        """
+        analyzer.set_bandwidth(self.bandwidth)
+
+
+@dataclass
+class IfbwCalibration:
+    """
+    Сигнал и шум одной развертки, измеренные при нескольких полосах в опорной точке.
+    Мощность шума в каждой частоте описывается моделью noise^2 = a * IFBW + b: тепловой шум
+    приемника растет с полосой, а b -- не зависящий от полосы остаток (фазовый шум, дрейф)
+    """
+    bandwidths: np.ndarray  # (n_bw, )
+    frequencies: np.ndarray  # (n_freq, )
+    signal: np.ndarray  # модуль среднего, (n_bw, n_parameters, n_freq)
+    noise: np.ndarray  # СКО одной развертки, (n_bw, n_parameters, n_freq)
+    sweep_times: np.ndarray = None  # (n_bw, ), nan -- неизвестно
+    _fit: Tuple[np.ndarray, np.ndarray] = field(default=None, init=False, repr=False)
+
+    def fit(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Коэффициенты a и b модели шума для каждой частоты, формы (n_parameters, n_freq)
+        """
+        if self._fit is None:
+            x = np.stack([self.bandwidths, np.ones_like(self.bandwidths)], axis=1)
+            y = np.square(self.noise).reshape(len(self.bandwidths), -1)
+            (a, b), *_ = np.linalg.lstsq(x, y, rcond=None)
+            shape = self.noise.shape[1:]
+            self._fit = np.clip(a, 0, None).reshape(shape), np.clip(b, 0, None).reshape(shape)
+        return self._fit
+
+    def snr(self, bandwidth: float, averages: int = 1) -> np.ndarray:
+        """
+        Предсказанное отношение сигнал/шум в дБ при полосе bandwidth, формы (n_parameters, n_freq)
+
+        :param bandwidth: полоса в Гц
+        :param averages: число усредняемых разверток
+        """
+        a, b = self.fit()
+        signal = np.median(self.signal, axis=0)
+        with np.errstate(divide='ignore'):
+            return 20 * np.log10(signal / np.sqrt((a * bandwidth + b) / averages))
+
+    def sweep_time(self, bandwidths: Union[float, np.ndarray], fractions: Sequence[float] = (1., )) -> float:
+        """
+        Предсказанное время развертки по модели t = c / IFBW + d, подобранной по измеренным временам.
+        Без измеренных времен -- число частот / IFBW.
+
+        :param bandwidths: полосы участков
+        :param fractions: доли частот в участках
+        """
+        bandwidths = np.broadcast_to(np.asarray(bandwidths, dtype=float), np.shape(fractions))
+        times = self.sweep_times
+        if times is not None and np.isfinite(times).sum() >= 2:
+            ok = np.isfinite(times)
+            x = np.stack([1 / self.bandwidths[ok], np.ones(ok.sum())], axis=1)
+            (c, d), *_ = np.linalg.lstsq(x, times[ok], rcond=None)
+        else:
+            c, d = len(self.frequencies), 0.
+        return float(np.sum(np.asarray(fractions) * c / bandwidths) + d)
+
+    def choose(self, target_snr: float, candidates: Sequence[float] = STANDARD_BANDWIDTHS,
+               quantile: float = 0.1, segments: Union[int, Sequence[float]] = 1,
+               averages: int = 1) -> IfbwChoice:
+        """
+        Самая широкая полоса из candidates, при которой у доли частот не меньше 1 - quantile
+        отношение сигнал/шум не меньше target_snr. Если цель недостижима, -- самая широкая полоса,
+        которая уступает лучшей не больше UNREACHABLE_MARGIN дБ
+
+        :param target_snr: нужное отношение сигнал/шум в дБ
+        :param candidates: доступные полосы анализатора
+        :param quantile: доля частот, которым разрешено не достичь target_snr
+        :param segments: число одинаковых участков частот или границы участков в Гц,
+            для каждого участка полоса выбирается отдельно
+        :param averages: число усредняемых разверток
+        :return: выбор
+        """
+        candidates = np.sort(np.asarray(candidates, dtype=float))[::-1]
+        # (n_candidates, n_parameters, n_freq)
+        snr = np.stack([self.snr(bandwidth, averages) for bandwidth in candidates])
+        if isinstance(segments, int):
+            bounds = np.linspace(0, len(self.frequencies), segments + 1).round().astype(int)
+        else:
+            bounds = np.searchsorted(self.frequencies, np.asarray(segments, dtype=float))
+            bounds = np.unique(np.concatenate([[0], bounds, [len(self.frequencies)]]))
+        bandwidths, edges, achieved, fractions = [], [], [], []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if stop <= start:
+                continue
+            level = np.quantile(snr[:, :, start:stop].reshape(len(candidates), -1), quantile, axis=1)
+            passed = np.nonzero(level >= target_snr)[0]
+            if len(passed):
+                k = passed[0]
+            else:
+                # сужение полосы ниже уровня остаточного шума b только замедляет развертку
+                k = np.nonzero(level >= level.max() - UNREACHABLE_MARGIN)[0][0]
+                logger.warning(f'{target_snr} dB is not reachable in {self.frequencies[start]:.0f}-'
+                               f'{self.frequencies[stop - 1]:.0f} Hz, {candidates[k]:g} Hz gives {level[k]:.1f} dB')
+            bandwidths.append(float(candidates[k]))
+            edges.append((float(self.frequencies[start]), float(self.frequencies[stop - 1])))
+            achieved.append(float(level[k]))
+            fractions.append((stop - start) / len(self.frequencies))
+        return IfbwChoice(bandwidths, edges, achieved, self.sweep_time(bandwidths, fractions))
+
+
+def calibrate_ifbw(analyzer: BaseAnalyzer, parameters: Sequence[str] = ('S21', ),
+                   bandwidths: Sequence[float] = (1e3, 1e4, 1e5), sweeps: int = 5) -> IfbwCalibration:
+    """
+    Измерить сигнал и шум при нескольких полосах. Сканер должен стоять в опорной точке
+    с типичным (или самым слабым) сигналом. Меняется только полоса, частоты и остальные настройки
+    анализатора остаются пользовательскими. После калибровки восстанавливаются прежние полоса и режим разверток.
+
+    :param analyzer: блокирующий драйвер анализатора с методами bandwidth и set_bandwidth (SocketAnalyzer)
+    :param parameters: S параметры
+    :param bandwidths: полосы для измерения, лучше с разницей на порядок
+    :param sweeps: число разверток на полосу для оценки шума, не меньше 2
+    :return: калибровка
+    """
+    if sweeps < 2:
+        raise ValueError('At least 2 sweeps per bandwidth are needed to estimate noise')
+    signal, noise, times, frequencies = [], [], [], None
+    previous = analyzer.bandwidth()
+    with ExitStack() as stack:
+        stack.callback(analyzer.set_bandwidth, previous)
+        if hasattr(analyzer, 'single_sweeps'):
+            stack.enter_context(analyzer.single_sweeps(parameters))
+        for bandwidth in bandwidths:
+            analyzer.set_bandwidth(bandwidth)
+            times.append(analyzer.sweep_time() if hasattr(analyzer, 'sweep_time') else np.nan)
+            acc, measured = None, None
+            for _ in range(sweeps):
+                if hasattr(analyzer, 'trigger_sweep'):
+                    analyzer.trigger_sweep()
+                with analyzer.get_scattering_parameters(list(parameters)) as result:
+                    if acc is None:
+                        acc, measured = StreamingMean(result.data.shape), result.measured.copy()
+                        frequencies = np.array(result.frequencies)
+                    acc.update(result.data)
+            signal.append(np.abs(acc.mean[measured]))
+            noise.append(np.sqrt(acc.variance[measured]))
+            logger.info(f'IFBW {bandwidth:g} Hz: median noise {np.median(noise[-1]):.3g}')
+    return IfbwCalibration(
+        np.asarray(bandwidths, dtype=float), frequencies, np.stack(signal), np.stack(noise), np.asarray(times)
+    )
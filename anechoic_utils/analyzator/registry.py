@@ -0,0 +1,89 @@
+"""
+Реестр драйверов анализаторов по AnalyzatorType. Модуль драйвера импортируется при первом обращении,
+поэтому необязательные зависимости (RsInstrument и VISA) нужны только тем, кто их использует
+"""
+import importlib
+import threading
+from typing import Dict, Tuple, Type
+
+from .analyzator_parameters import AnalyzatorType
+from .base_analyzator import BaseAnalyzer
+
+# тип -> (синхронный драйвер, асинхронный драйвер) в виде 'модуль:класс', None -- драйвера нет
+_DRIVERS: Dict[AnalyzatorType, Tuple[str, str]] = {
+    AnalyzatorType.ROHDE_SCHWARZ: ('anechoic_utils.analyzator.rohde_schwarz:RohdeSchwarzAnalyzer', None),
+    # Ceyear и Planar управляются SCPI командами через сокет, как SocketAnalyzer
+    AnalyzatorType.CEYEAR: (
+        'anechoic_utils.analyzator.socket_analyzer:SocketAnalyzer',
+        'anechoic_utils.analyzator.socket_analyzer:AsyncSocketAnalyzer',
+    ),
+    AnalyzatorType.PLANAR: (
+        'anechoic_utils.analyzator.socket_analyzer:SocketAnalyzer',
+        'anechoic_utils.analyzator.socket_analyzer:AsyncSocketAnalyzer',
+    ),
+    AnalyzatorType.SOCKET: (
+        'anechoic_utils.analyzator.socket_analyzer:SocketAnalyzer',
+        'anechoic_utils.analyzator.socket_analyzer:AsyncSocketAnalyzer',
+    ),
+}
+# модуль верхнего уровня необязательной зависимости -> пакет для установки
+_OPTIONAL_DEPENDENCIES = {'RsInstrument': 'RsInstrument', 'pyvisa': 'pyvisa'}
+
+_loaded: Dict[str, Type[BaseAnalyzer]] = {}
+_lock = threading.Lock()
+
+
+def register_analyzer(analyzer_type: AnalyzatorType, driver: str, async_driver: str = None) -> None:
+    """
+    Зарегистрировать или заменить драйвер
+
+    :param analyzer_type: тип анализатора
+    :param driver: синхронный драйвер 'модуль:класс'
+    :param async_driver: асинхронный драйвер 'модуль:класс'
+    """
+    with _lock:
+        _DRIVERS[AnalyzatorType(analyzer_type)] = (driver, async_driver)
+
+
+def _load(path: str) -> Type[BaseAnalyzer]:
+    if (cls := _loaded.get(path)) is not None:
+        return cls
+    module_name, class_name = path.split(':')
+    try:
+        module = importlib.import_module(module_name)
+    except ModuleNotFoundError as e:
+        if (package := _OPTIONAL_DEPENDENCIES.get((e.name or '').split('.')[0])) is None:
+            raise
+        raise ImportError(f'{path} requires the optional dependency {package}: pip install {package}') from e
+    with _lock:
+        cls = _loaded[path] = getattr(module, class_name)
+    return cls
+
+
+def analyzer_class(analyzer_type: AnalyzatorType, asynchronous: bool = False) -> Type[BaseAnalyzer]:
+    """
+    Класс драйвера, модуль драйвера импортируется при первом вызове
+
+    :param analyzer_type: тип анализатора или его название, например 'SOCKET'
+    :param asynchronous: асинхронный драйвер
+    :return: класс драйвера
+    """
+    analyzer_type = AnalyzatorType(analyzer_type)
+    driver, async_driver = _DRIVERS[analyzer_type]
+    path = async_driver if asynchronous else driver
+    if path is None:
+        raise ValueError(f'There is no {"asynchronous " if asynchronous else ""}driver for {analyzer_type.value}')
+    return _load(path)
+
+
+def create_analyzer(analyzer_type: AnalyzatorType, *args, asynchronous: bool = False, **kwargs) -> BaseAnalyzer:
+    """
+    Создать драйвер: create_analyzer(AnalyzatorType.SOCKET, '192.168.0.2', 5025)
+
+    :param analyzer_type: тип анализатора или его название
+    :param args: аргументы конструктора драйвера
+    :param asynchronous: асинхронный драйвер
+    :param kwargs: аргументы конструктора драйвера
+    :return: драйвер
+    """
+    return analyzer_class(analyzer_type, asynchronous)(*args, **kwargs)
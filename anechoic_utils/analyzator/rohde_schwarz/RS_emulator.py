@@ -1,5 +1,6 @@
 from typing import List, Union
 from .rohde_schwarz import RohdeSchwarzAnalyzer
+from ..s_matrix import SMatrix
 import numpy as np
 from time import sleep
 
@@ -37,19 +38,19 @@ class RohdeSchwarzEmulator(RohdeSchwarzAnalyzer):
     def get_scattering_parameters(
             self,
             parameters: List[str]
-    ) -> dict[str: List[float]]:
-
-        res = {}
+    ) -> SMatrix:
 
         if not self.is_connected:
             return
 
-        res[f'f'] = np.linspace(self.freq_start, self.freq_stop, int(self.freq_num))
+        res = self._acquire_result(parameters, np.linspace(self.freq_start, self.freq_stop, int(self.freq_num)))
 
         for num, S_param in enumerate(parameters):
             trace_tup = np.linspace(0, 4*np.pi, int(self.freq_num))
-            res[f'{S_param}'] = np.sin(trace_tup) + np.random.normal(0, 0.1, int(self.freq_num))
+            noise = np.random.normal(0, 0.1, (2, int(self.freq_num)))
+            res[S_param] = np.sin(trace_tup) * np.exp(1j * trace_tup) + noise[0] + 1j * noise[1]
 
+        self._finalize_result(res)
         self._signals.data.emit(res)
         sleep(0.9)
         return res
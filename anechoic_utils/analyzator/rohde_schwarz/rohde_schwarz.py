@@ -2,14 +2,16 @@ import socket
 
 from typing import List, Union
 from ..base_analyzator import BaseAnalyzer, AnalyzerSignals, AnalyzerConnectionError
-from ...utils import EmptySignal
+from ..s_matrix import SMatrix
+from ..buffer_pool import SweepBufferPool
+from ...utils import InstanceSignal
 import RsInstrument
 import numpy as np
 
 
 class RohdeSchwarzAnalyzatorSignals(AnalyzerSignals):
-    data = EmptySignal()
-    is_connected = EmptySignal()
+    data = InstanceSignal()
+    is_connected = InstanceSignal()
 
 
 class RohdeSchwarzAnalyzer(BaseAnalyzer):
@@ -19,7 +21,8 @@ class RohdeSchwarzAnalyzer(BaseAnalyzer):
             port: Union[str, int],
             bufsize: int = 1024,
             maxbufs: int = 1024,
-            signals: AnalyzerSignals = None
+            signals: AnalyzerSignals = None,
+            buffer_pool: SweepBufferPool = None,
     ):
         """
 
@@ -27,12 +30,14 @@ class RohdeSchwarzAnalyzer(BaseAnalyzer):
         :param port: порт анализатора
         :param bufsize: размер чанка сообщения в байтах
         :param maxbufs: максимальное число чанков
+        :param buffer_pool: пул буферов под результаты, если задан -- результаты нужно возвращать через release()
         """
         self.ip, self.port, self.conn = ip, port, socket.socket()
         self.bufsize, self.maxbufs = bufsize, maxbufs
         self._is_connected = False
         self.instrument = None
         self.channel = 1
+        self.buffer_pool = buffer_pool
 
         if signals is None:
             self._signals = RohdeSchwarzAnalyzatorSignals()
@@ -85,27 +90,25 @@ class RohdeSchwarzAnalyzer(BaseAnalyzer):
     def get_scattering_parameters(
             self,
             parameters: List[str]
-    ) -> dict[str: List[float]]:
-
-        res = {}
+    ) -> SMatrix:
 
         if not self.is_connected:
             raise AnalyzerConnectionError
 
         channel = 1
 
+        freq_list = self._send_cmd(f'CALC{channel}:DATA:STIM?')
+        res = self._acquire_result(parameters, np.fromstring(freq_list, sep=','))
+
         for num, S_param in enumerate(parameters):
             num += 1
             self._send_cmd(f'CALC{channel}:PAR:SDEF "Trc{num}", "{S_param}"')
-            trace_data = self._send_cmd(f'CALC{channel}:DATA? FDAT')
-            trace_tup = tuple(map(str, trace_data.split(',')))
-            res[f'{S_param}'] = np.array(trace_tup).astype(float)
-
-        freq_list = self._send_cmd(f'CALC{channel}:DATA:STIM?')
-        freq_tup = tuple(map(str, freq_list.split(',')))
-        res[f'f'] = np.array(freq_tup).astype(float)
+            # всегда забираем комплексные данные, форматирование делается на хосте: res.format(...)
+            trace_data = self._send_cmd(f'CALC{channel}:DATA? SDAT')
+            res.set_interleaved(S_param, trace_data)
 
-        self._signals.data.emit((res['f'], *(res[f'{S_param}'] for S_param in parameters)), )
+        self._finalize_result(res)
+        self._signals.data.emit((res['f'], *(res[S_param] for S_param in parameters)), )
         return res
 
     def is_connected(self) -> bool:
@@ -0,0 +1,341 @@
+"""
+Контейнер результатов измерения S параметров
+"""
+import re
+from collections.abc import Mapping
+from typing import Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from .analyzator_parameters import SParameters, ResultsFormatType
+
+S_PARAMETER_PATTERN = re.compile(r'^S(?:(\d)(\d)|(\d+)_(\d+))$', re.IGNORECASE)
+FREQUENCY_KEY = 'f'
+
+
+def parse_s_parameter(name: str) -> Tuple[int, int]:
+    """
+    Переводит название S параметра в пару портов: 'S21' -> (2, 1), 'S10_2' -> (10, 2)
+
+    :param name: название S параметра
+    :return: (порт приемника, порт источника)
+    """
+    match = S_PARAMETER_PATTERN.match(name.strip())
+    if match is None:
+        raise KeyError(f'{name} is not an S parameter')
+    groups = [g for g in match.groups() if g is not None]
+    return int(groups[0]), int(groups[1])
+
+
+def s_parameter_name(out_port: int, in_port: int) -> str:
+    """
+    Название S параметра по паре портов
+
+    :param out_port: порт приемника
+    :param in_port: порт источника
+    :return: название, например 'S21'
+    """
+    if out_port > 9 or in_port > 9:
+        return f'S{out_port}_{in_port}'
+    return f'S{out_port}{in_port}'
+
+
+def _db(data: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore'):
+        return 20 * np.log10(np.abs(data))
+
+
+def _phase(data: np.ndarray) -> np.ndarray:
+    return np.degrees(np.unwrap(np.angle(data), axis=-1))
+
+
+FORMATTERS = {
+    ResultsFormatType.DB: _db,
+    ResultsFormatType.LIN: np.abs,
+    ResultsFormatType.PHASE: _phase,
+    ResultsFormatType.REAL: np.real,
+    ResultsFormatType.IMAG: np.imag,
+    ResultsFormatType.SMITH: np.asarray,
+    ResultsFormatType.POLAR: np.asarray,
+}
+
+
+def ports_of(parameters: Sequence[str]) -> List[int]:
+    """
+    Отсортированный список портов, участвующих в измерении параметров
+
+    :param parameters: названия S параметров
+    :return: порты
+    """
+    return sorted({p for name in parameters for p in parse_s_parameter(name)})
+
+
+class SMatrix(Mapping):
+    """
+    Результат измерения S параметров на N-портовом анализаторе.
+
+    Данные лежат в одном комплексном массиве формы (n_ports, n_ports, n_freq),
+    частотная ось общая для всех параметров. Обращение по паре портов
+    `res[2, 1]` и по названию `res['S21']` возвращает view без копирования.
+    Массив data и его view доступны только для чтения, данные меняются через res[key] = value,
+    set_interleaved и fill, иначе запомненные форматы (дБ, фаза) разошлись бы с данными.
+    Для совместимости объект ведет себя как словарь {'S21': ..., 'f': ...},
+    в котором есть только измеренные параметры.
+    """
+    def __init__(
+            self,
+            ports: Sequence[int],
+            frequencies: Union[np.ndarray, int],
+            dtype=np.complex128,
+    ):
+        """
+
+        :param ports: номера портов
+        :param frequencies: частоты в Гц или их количество
+        :param dtype: тип данных
+        """
+        self.ports = list(ports)
+        self._port_index = {port: i for i, port in enumerate(self.ports)}
+        self.s_parameters = SParameters.for_ports(self.ports)
+        if isinstance(frequencies, (int, np.integer)):
+            self.frequencies = np.zeros(int(frequencies))
+        else:
+            # своя копия: freeze() не должен запрещать запись в массив вызывающего кода
+            self.frequencies = np.array(frequencies, dtype=float)
+        n_ports = len(self.ports)
+        self._data = np.zeros((n_ports, n_ports, len(self.frequencies)), dtype=dtype)
+        self.data = self._data.view()
+        self.data.flags.writeable = False
+        self.measured = np.zeros((n_ports, n_ports), dtype=bool)
+        self._formats = {}
+        self._pool = None
+
+    @classmethod
+    def for_parameters(cls, parameters: Sequence[str], frequencies: Union[np.ndarray, int], **kwargs) -> 'SMatrix':
+        """
+        Пустой контейнер под список параметров
+
+        :param parameters: названия S параметров, например ['S11', 'S21']
+        :param frequencies: частоты в Гц или их количество
+        :return: контейнер
+        """
+        return cls(ports_of(parameters), frequencies, **kwargs)
+
+    @classmethod
+    def from_dict(cls, results: dict) -> 'SMatrix':
+        """
+        Контейнер из словаря старого формата {'S21': ..., 'f': ...}
+
+        :param results: словарь с результатами
+        :return: контейнер
+        """
+        parameters = [k for k in results if k != FREQUENCY_KEY]
+        res = cls.for_parameters(parameters, results[FREQUENCY_KEY])
+        for name in parameters:
+            res[name] = results[name]
+        return res
+
+    @property
+    def n_ports(self) -> int:
+        return len(self.ports)
+
+    @property
+    def n_freq(self) -> int:
+        return len(self.frequencies)
+
+    def index(self, key: Union[str, Tuple[int, int]]) -> Tuple[int, int]:
+        """
+        Индексы в массиве данных по названию параметра или паре портов
+
+        :param key: 'S21' или (2, 1)
+        :return: индексы (i, j) в data
+        """
+        if isinstance(key, str):
+            if (index := self.s_parameters.index.get(key)) is not None:
+                return index
+            out_port, in_port = parse_s_parameter(key)
+        else:
+            out_port, in_port = key
+        try:
+            return self._port_index[out_port], self._port_index[in_port]
+        except KeyError:
+            raise KeyError(f'Ports {out_port}, {in_port} are not in {self.ports}') from None
+
+    def parameters(self) -> List[str]:
+        """
+        Названия измеренных S параметров
+
+        :return: список названий
+        """
+        return [
+            s_parameter_name(self.ports[i], self.ports[j])
+            for i, j in zip(*np.nonzero(self.measured))
+        ]
+
+    def __getitem__(self, key: Union[str, Tuple[int, int]]) -> np.ndarray:
+        if isinstance(key, str) and key == FREQUENCY_KEY:
+            return self.frequencies
+        i, j = self.index(key)
+        if isinstance(key, str) and not self.measured[i, j]:
+            raise KeyError(key)
+        return self.data[i, j]
+
+    def __setitem__(self, key: Union[str, Tuple[int, int]], value) -> None:
+        if isinstance(key, str) and key == FREQUENCY_KEY:
+            self.frequencies[...] = value
+            return
+        i, j = self.index(key)
+        self._data[i, j] = value
+        self.measured[i, j] = True
+        self._formats.clear()
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.parameters()
+        yield FREQUENCY_KEY
+
+    def __len__(self) -> int:
+        return int(self.measured.sum()) + 1
+
+    def __contains__(self, key) -> bool:
+        if key == FREQUENCY_KEY:
+            return True
+        try:
+            return bool(self.measured[self.index(key)])
+        except KeyError:
+            return False
+
+    def format(self, format_type: Union[ResultsFormatType, str]) -> 'FormattedSMatrix':
+        """
+        Данные в заданном формате. Формат вычисляется на хосте один раз для всей матрицы
+        при первом обращении и запоминается до следующего изменения данных (res[key] = value,
+        set_interleaved, fill).
+        Повторные запросы, например дБ и фаза для графиков, не обращаются к анализатору.
+
+        :param format_type: формат: DB -- модуль в дБ, LIN -- модуль, PHASE -- развернутая фаза в градусах,
+            REAL, IMAG -- действительная и мнимая части, SMITH и POLAR -- комплексные данные
+        :return: view с тем же интерфейсом словаря
+        """
+        format_type = ResultsFormatType(format_type.upper()) if isinstance(format_type, str) else format_type
+        if (formatted := self._formats.get(format_type)) is None:
+            formatted = FormattedSMatrix(self, FORMATTERS[format_type](self.data))
+            self._formats[format_type] = formatted
+        return formatted
+
+    @property
+    def db(self) -> 'FormattedSMatrix':
+        return self.format(ResultsFormatType.DB)
+
+    @property
+    def lin(self) -> 'FormattedSMatrix':
+        return self.format(ResultsFormatType.LIN)
+
+    @property
+    def phase(self) -> 'FormattedSMatrix':
+        return self.format(ResultsFormatType.PHASE)
+
+    @property
+    def real(self) -> 'FormattedSMatrix':
+        return self.format(ResultsFormatType.REAL)
+
+    @property
+    def imag(self) -> 'FormattedSMatrix':
+        return self.format(ResultsFormatType.IMAG)
+
+    def set_interleaved(self, key: Union[str, Tuple[int, int]], text: str) -> None:
+        """
+        Записать на место параметра ответ анализатора вида "re1,im1,re2,im2,...".
+        Текст разбирается во временный массив, который затем копируется в data без комплексных преобразований
+
+        :param key: 'S21' или (2, 1)
+        :param text: комплексные данные, разделенные запятыми
+        """
+        i, j = self.index(key)
+        self._data[i, j].view(np.float64)[:] = np.fromstring(text, sep=',')
+        self.measured[i, j] = True
+        self._formats.clear()
+
+    def fill(self, data: np.ndarray) -> None:
+        """
+        Записать данные всех параметров сразу, отметки измеренных параметров не меняются
+
+        :param data: комплексный массив формы (n_ports, n_ports, n_freq)
+        """
+        self._data[...] = data
+        self._formats.clear()
+
+    @property
+    def pooled(self) -> bool:
+        """
+        Принадлежит ли результат пулу буферов SweepBufferPool
+        """
+        return self._pool is not None
+
+    def freeze(self) -> None:
+        """
+        Запретить запись в данные, в том числе через res[key] = value и set_interleaved
+        """
+        self._data.flags.writeable = False
+        self.frequencies.flags.writeable = False
+
+    def release(self) -> None:
+        """
+        Вернуть буфер в пул. Для результатов вне пула ничего не делает.
+        После release данные могут быть перезаписаны следующим свипом.
+        """
+        if self._pool is not None:
+            self._pool.release(self)
+
+    def _reset(self) -> None:
+        self._data.flags.writeable = True
+        self.frequencies.flags.writeable = True
+        self.measured[...] = False
+        self._formats.clear()
+
+    def __enter__(self) -> 'SMatrix':
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
+    def to_dict(self, copy: bool = False) -> dict:
+        """
+        Словарь старого формата {'S21': ..., 'f': ...}
+
+        :param copy: копировать ли массивы
+        :return: словарь
+        """
+        if copy:
+            return {k: np.array(v) for k, v in self.items()}
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(ports={self.ports}, n_freq={self.n_freq}, parameters={self.parameters()})'
+
+
+class FormattedSMatrix(Mapping):
+    """
+    S матрица в одном из форматов ResultsFormatType.
+    Ключи и индексация такие же, как у исходной SMatrix.
+    """
+    def __init__(self, source: SMatrix, data: np.ndarray):
+        """
+
+        :param source: исходная S матрица
+        :param data: отформатированные данные формы (n_ports, n_ports, n_freq)
+        """
+        self.source = source
+        self.data = data.view()
+        self.data.flags.writeable = False
+
+    def __getitem__(self, key: Union[str, Tuple[int, int]]) -> np.ndarray:
+        if isinstance(key, str) and key == FREQUENCY_KEY:
+            return self.source.frequencies
+        if isinstance(key, str) and key not in self.source:
+            raise KeyError(key)
+        return self.data[self.source.index(key)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.source)
+
+    def __len__(self) -> int:
+        return len(self.source)
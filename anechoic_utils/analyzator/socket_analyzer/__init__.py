@@ -1 +1,2 @@
-from socket_analyzer import SocketAnalyzer
+from .socket_analyzer import SocketAnalyzer
+from .async_socket_analyzer import AsyncSocketAnalyzer
@@ -0,0 +1,150 @@
+"""
+Эмулятор SCPI анализатора для SocketAnalyzer: отвечает на команды, которые использует драйвер,
+и возвращает синтетические комплексные данные
+"""
+import re
+import socket
+import threading
+import time
+
+import numpy as np
+
+# спектральная плотность теплового шума приемника, 1/sqrt(Гц): шум растет как sqrt(полосы)
+NOISE_DENSITY = 1e-5
+
+
+class AnalyzerStorage:
+    def __init__(self, ports: int = 2):
+        self.ports = ports
+        self.sweep_type = 'LIN'
+        self.freq_start = 1e9
+        self.freq_stop = 3e9
+        self.freq_cw = 1e9
+        self.points = 201
+        self.bandwidth = 3000.
+        self.sweep_time = None
+        self.continuous = True
+        self.traces = {}
+        self.selected = None
+        self.swept = set()  # трассы с данными последней одиночной развертки
+
+    def reset(self):
+        self.__init__(self.ports)
+
+    def frequencies(self) -> np.ndarray:
+        if self.sweep_type == 'CW':
+            return np.full(self.points, self.freq_cw)
+        return np.linspace(self.freq_start, self.freq_stop, self.points)
+
+    def get_sweep_time(self) -> float:
+        # без явной настройки -- примерно одна точка за время 1 / полоса
+        return self.sweep_time if self.sweep_time is not None else self.points / self.bandwidth
+
+    def trace(self) -> np.ndarray:
+        i, j = (int(c) for c in self.traces.get(self.selected, 'S21')[1:3])
+        f = self.frequencies()
+        if not self.continuous and self.selected not in self.swept:
+            # как у прибора: трасса, определенная после одиночной развертки, пуста
+            return np.full(2 * len(f), np.nan)
+        phase = 2 * np.pi * f * (i + j) * 1e-9 + np.random.uniform(0, 0.01, len(f))
+        noise = np.random.normal(0, NOISE_DENSITY * np.sqrt(self.bandwidth / 2), (2, len(f)))
+        data = np.empty(2 * len(f))
+        data[0::2] = np.cos(phase) / (i + j) + noise[0]
+        data[1::2] = np.sin(phase) / (i + j) + noise[1]
+        return data
+
+
+def _value(cmd: str) -> str:
+    return cmd.split(' ', 1)[1].strip() if ' ' in cmd else ''
+
+
+def _hz(value: str) -> float:
+    return float(value.removesuffix('Hz'))
+
+
+def handle(analyzer: AnalyzerStorage, cmd: str):
+    """
+    Выполняет одну команду, возвращает ответ для запросов или None
+    """
+    head = cmd.split(' ', 1)[0].upper()
+    if head == '*RST':
+        analyzer.reset()
+    elif head == '*OPC?':
+        return '1'
+    elif head == '*IDN?':
+        return 'anechoic_utils,analyzer emulator,0,0'
+    elif head == 'SERV:PORT:COUN?':
+        return str(analyzer.ports)
+    elif re.fullmatch(r'SENS\d*:FREQ:DATA\?', head):
+        return ','.join(f'{f:.1f}' for f in analyzer.frequencies())
+    elif re.fullmatch(r'SENS\d*:SWE:TYPE', head):
+        analyzer.sweep_type = _value(cmd).upper()
+    elif re.fullmatch(r'SENS\d*:SWE:POIN', head):
+        analyzer.points = int(_value(cmd))
+    elif re.fullmatch(r'SENS\d*:SWE:TIME', head):
+        analyzer.sweep_time = float(_value(cmd))
+    elif re.fullmatch(r'SENS\d*:SWE:TIME\?', head):
+        return repr(analyzer.get_sweep_time())
+    elif re.fullmatch(r'SENS\d*:BAND\?', head):
+        return repr(analyzer.bandwidth)
+    elif re.fullmatch(r'SENS\d*:BAND', head):
+        analyzer.bandwidth = float(_value(cmd))
+    elif re.fullmatch(r'SENS\d*:FREQ:STAR', head):
+        analyzer.freq_start = _hz(_value(cmd))
+    elif re.fullmatch(r'SENS\d*:FREQ:STOP', head):
+        analyzer.freq_stop = _hz(_value(cmd))
+    elif re.fullmatch(r'SENS\d*:FREQ:CW', head):
+        analyzer.freq_cw = _hz(_value(cmd))
+    elif re.fullmatch(r'CALC\d*:PAR:DEF', head):
+        name, param = _value(cmd).split(',')
+        analyzer.traces[name.strip("'")] = param.strip().upper()
+        analyzer.swept.discard(name.strip("'"))
+    elif re.fullmatch(r'CALC\d*:PAR:SEL', head):
+        analyzer.selected = _value(cmd).strip("'")
+    elif re.fullmatch(r'CALC\d*:PAR:DEL', head):
+        analyzer.traces.pop(_value(cmd).strip("'"), None)
+    elif re.fullmatch(r'CALC\d*:DATA\?', head):
+        return ','.join(f'{v:.6e}' for v in analyzer.trace())
+    elif re.fullmatch(r'INIT\d*:CONT\?', head):
+        return '1' if analyzer.continuous else '0'
+    elif re.fullmatch(r'INIT\d*:CONT', head):
+        analyzer.continuous = _value(cmd).upper() in ('ON', '1')
+    elif re.fullmatch(r'INIT\d*(:IMM)?', head):
+        time.sleep(analyzer.get_sweep_time())
+        analyzer.swept = set(analyzer.traces)
+    elif head.endswith('?'):
+        return '0'
+    # остальные команды (усреднение, сглаживание, мощность, дисплей) принимаются без эффекта
+
+
+def emulator(ip="127.0.0.1", port=1024, ports: int = 2):
+    analyzer = AnalyzerStorage(ports)
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((ip, port))
+        s.listen()
+        while True:
+            conn, addr = s.accept()
+            with conn:
+                buffer = b''
+                while True:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    buffer += data
+                    *lines, buffer = buffer.split(b'\n')
+                    for line in lines:
+                        if (response := handle(analyzer, line.decode().strip())) is not None:
+                            conn.sendall(response.encode() + b'\n')
+
+
+def run(blocking=True, ip="127.0.0.1", port=1024, ports: int = 2):
+    server_thread = threading.Thread(target=emulator, args=(ip, port, ports), daemon=not blocking)
+    print('Starting analyzer emulator')
+    server_thread.start()
+    if blocking:
+        server_thread.join()
+
+
+if __name__ == "__main__":
+    run()
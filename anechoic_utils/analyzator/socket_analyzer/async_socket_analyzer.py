@@ -0,0 +1,263 @@
+import asyncio
+import time
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Sequence, Union
+from anechoic_utils.analyzator.base_analyzator import BaseAnalyzer, AnalyzerSignals, AnalyzerConnectionError
+from anechoic_utils.analyzator.s_matrix import SMatrix
+from anechoic_utils.analyzator.buffer_pool import SweepBufferPool
+from anechoic_utils.analyzator.socket_analyzer.socket_analyzer import SocketAnalyzerSignals, settings_cmds, command_type, trace_name
+from anechoic_utils.metrics import metrics
+from anechoic_utils.tracing import tracer
+import numpy as np
+
+
+class AsyncSocketAnalyzer(BaseAnalyzer):
+    """
+    Асинхронный SCPI анализатор на asyncio. Команды те же, что у SocketAnalyzer,
+    но ожидание ответа и пауза после команды не блокируют поток.
+    """
+    def __init__(
+            self,
+            ip: str,
+            port: Union[str, int],
+            bufsize: int = 1024,
+            maxbufs: int = 1024,
+            cmd_delay: float = 0.1,
+            signals: AnalyzerSignals = None,
+            buffer_pool: SweepBufferPool = None,
+    ):
+        """
+
+        :param ip: ip адрес анализатора
+        :param port: порт анализатора
+        :param bufsize: размер чанка сообщения в байтах
+        :param maxbufs: максимальное число чанков
+        :param cmd_delay: пауза после каждой команды в секундах
+        :param buffer_pool: пул буферов под результаты, если задан -- результаты нужно возвращать через release()
+        """
+        self.ip, self.port = ip, port
+        self.bufsize, self.maxbufs = bufsize, maxbufs
+        self.cmd_delay = cmd_delay
+        self._reader: asyncio.StreamReader = None
+        self._writer: asyncio.StreamWriter = None
+        # лок создается в работающем event loop: в Python 3.9 asyncio.Lock привязывается к циклу при создании
+        self._lock: asyncio.Lock = None
+        self._lock_loop: asyncio.AbstractEventLoop = None
+        self._is_connected = False
+        self.channel = 1
+        self.buffer_pool = buffer_pool
+        self._single_depth = 0
+        self._traces: Dict[str, str] = {}  # S параметр -> трасса, определенная на время single_sweeps
+
+        if signals is None:
+            self._signals = SocketAnalyzerSignals()
+        else:
+            self._signals = signals
+
+    async def _send_cmd(self, cmd: str):
+        # обмен защищен от отмены, чтобы недочитанный ответ не сбил следующую команду
+        return await asyncio.shield(self._exchange(cmd))
+
+    async def _exchange(self, cmd: str):
+        if self._writer is None:
+            raise AnalyzerConnectionError
+        self._bind_lock()
+        waiting = time.perf_counter() if metrics.enabled else None
+        async with self._lock:
+            if waiting is not None:
+                started = time.perf_counter()
+                metrics.observe('lock_wait_seconds', started - waiting, lock='analyzer.tcp')
+            try:
+                command_bytes = str.encode(cmd+'\n')
+                sent = time.perf_counter_ns() if self.recorder is not None else None
+                self._writer.write(command_bytes)
+                await self._writer.drain()
+                await asyncio.sleep(self.cmd_delay)
+                response = await self._reader.readuntil(b'\n') if '?' in cmd else b''
+                if waiting is not None:
+                    metrics.command('analyzer', command_type(cmd), time.perf_counter() - started,
+                                    len(command_bytes), len(response))
+                if sent is not None:
+                    self.recorder.record(sent, time.perf_counter_ns(), command_bytes, response)
+                if '?' in cmd:
+                    return response.decode()
+            except (OSError, asyncio.IncompleteReadError) as e:
+                self._set_is_connected(False)
+                raise AnalyzerConnectionError from e
+
+    async def set_settings(self,
+                           channel: int = 1,
+                           sweep_type: str = None,
+                           freq_start: float = None,
+                           freq_stop: float = None,
+                           freq_num: int = None,
+                           bandwidth: float = None,
+                           aver_fact: int = None,
+                           smooth_aper: int = None,
+                           power: int = None,
+                           cw_freq: float = None,
+                           sweep_time: float = None,
+                           ) -> None:
+
+        await self._send_cmd("*RST")
+        self.channel = channel
+        for cmd in settings_cmds(channel, sweep_type, freq_start, freq_stop, freq_num,
+                                 bandwidth, aver_fact, smooth_aper, cw_freq, sweep_time):
+            await self._send_cmd(cmd)
+        if power is not None:
+            number_of_ports = int(await self._send_cmd(f'SERV:PORT:COUN?'))
+            for n_port in range(1, number_of_ports+1):
+                await self._send_cmd(f'SOUR{channel}:POW{n_port} {power}dBm')
+
+    def _bind_lock(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock_loop, self._lock = loop, asyncio.Lock()
+
+    def _set_is_connected(self, state: bool):
+        self._is_connected = state
+        self._signals.is_connected.emit(state)
+
+    async def connect(self) -> None:
+        if self._is_connected:
+            return
+        self._bind_lock()
+        try:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.ip, self.port, limit=self.bufsize * self.maxbufs
+            )
+        except OSError as e:
+            raise AnalyzerConnectionError from e
+        self._set_is_connected(True)
+
+    async def disconnect(self) -> None:
+        if not self._is_connected:
+            return
+        try:
+            self._writer.close()
+            await self._writer.wait_closed()
+        finally:
+            self._set_is_connected(False)
+
+    async def get_scattering_parameters(
+            self,
+            parameters: List[str],
+    ) -> SMatrix:
+
+        if not self.is_connected:
+            raise AnalyzerConnectionError
+
+        with tracer.span('sweep', 'analyzer', parameters=len(parameters)):
+            with tracer.span('transfer', 'analyzer'):
+                freq_data = await self._send_cmd(f'SENS{self.channel}:FREQ:DATA?')
+            with tracer.span('parse', 'analyzer'):
+                res = self._acquire_result(parameters, np.fromstring(freq_data, sep=','))
+
+            try:
+                for num, s_param in enumerate(parameters):
+                    num += 1
+                    temporary = s_param.upper() not in self._traces
+                    trace = f'Tr{num}' if temporary else self._traces[s_param.upper()]
+                    if temporary:
+                        await self._send_cmd(f"CALC{self.channel}:PAR:DEF '{trace}',{s_param}")
+                        await self._send_cmd(f"DISPlay:WINDow1:TRACe2:FEED '{trace}'")
+                    await self._send_cmd(f"CALC{self.channel}:PAR:SEL '{trace}'")
+                    with tracer.span('transfer', 'analyzer', parameter=s_param):
+                        trace_data = await self._send_cmd(f'CALC{self.channel}:DATA? SDATA')
+                    with tracer.span('parse', 'analyzer', parameter=s_param):
+                        res.set_interleaved(s_param, trace_data)
+                    if temporary:
+                        await self._send_cmd(f"CALC{self.channel}:PAR:DEL '{trace}'")
+            except BaseException:
+                res.release()
+                raise
+
+            self._finalize_result(res)
+        with tracer.span('signal dispatch', 'analyzer'):
+            self._signals.data.emit(res)
+        return res
+
+    async def sweep_time(self) -> float:
+        """
+        Длительность развертки в секундах
+        """
+        return float(await self._send_cmd(f'SENS{self.channel}:SWE:TIME?'))
+
+    async def bandwidth(self) -> float:
+        """
+        Полоса ПЧ в Гц
+        """
+        return float(await self._send_cmd(f'SENS{self.channel}:BAND?'))
+
+    async def set_bandwidth(self, bandwidth: float) -> None:
+        """
+        Изменить только полосу ПЧ. В отличие от set_settings, остальные настройки не сбрасываются
+        """
+        await self._send_cmd(f'SENS{self.channel}:BAND {bandwidth}')
+
+    async def _define_traces(self, parameters: Sequence[str]) -> None:
+        for s_param in parameters:
+            if (s_param := s_param.upper()) in self._traces:
+                continue
+            trace = trace_name(s_param)
+            await self._send_cmd(f"CALC{self.channel}:PAR:DEF '{trace}',{s_param}")
+            await self._send_cmd(f"DISPlay:WINDow1:TRACe2:FEED '{trace}'")
+            self._traces[s_param] = trace
+
+    @asynccontextmanager
+    async def single_sweeps(self, parameters: Sequence[str] = ()) -> AsyncIterator['AsyncSocketAnalyzer']:
+        """
+        Выключает непрерывные развертки и определяет трассы parameters на время блока,
+        как SocketAnalyzer.single_sweeps
+        """
+        continuous = False
+        if self._single_depth == 0:
+            continuous = (await self._send_cmd(f'INIT{self.channel}:CONT?')).strip().upper() in ('1', 'ON')
+            if continuous:
+                await self._send_cmd(f'INIT{self.channel}:CONT OFF')
+        self._single_depth += 1
+        defined = set(self._traces)
+        try:
+            await self._define_traces(parameters)
+            yield self
+        finally:
+            self._single_depth -= 1
+            for s_param in [p for p in self._traces if p not in defined]:
+                trace = self._traces.pop(s_param)
+                if self._is_connected:
+                    await self._send_cmd(f"CALC{self.channel}:PAR:DEL '{trace}'")
+            if continuous and self._is_connected:
+                await self._send_cmd(f'INIT{self.channel}:CONT ON')
+
+    async def trigger_sweep(self) -> float:
+        """
+        Запускает одну развертку и ждет ее окончания.
+        Данные этой развертки затем читаются get_scattering_parameters для параметров, переданных в single_sweeps.
+        Вызывать внутри single_sweeps, иначе непрерывные развертки выключаются и остаются выключенными.
+
+        :return: время запуска развертки по time.monotonic()
+        """
+        if self._single_depth == 0:
+            await self._send_cmd(f'INIT{self.channel}:CONT OFF')
+        started = time.monotonic()
+        await self._send_cmd(f'INIT{self.channel}:IMM')
+        await self._send_cmd('*OPC?')
+        return started
+
+    @property
+    def is_connected(self) -> bool:
+        return self._is_connected
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.disconnect()
+
+    def __enter__(self):
+        raise TypeError('Use "async with" for AsyncSocketAnalyzer')
+
+    def __exit__(self, type, value, traceback):
+        pass
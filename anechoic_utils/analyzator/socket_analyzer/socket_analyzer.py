@@ -1,16 +1,76 @@
+import re
 import socket
 import threading
 import time
 
-from typing import List, Union
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Union
 from anechoic_utils.analyzator.base_analyzator import BaseAnalyzer, AnalyzerSignals, AnalyzerConnectionError
-from anechoic_utils.utils import EmptySignal
+from anechoic_utils.analyzator.s_matrix import SMatrix
+from anechoic_utils.analyzator.buffer_pool import SweepBufferPool
+from anechoic_utils.utils import InstanceSignal
+from anechoic_utils.metrics import metrics
+from anechoic_utils.tracing import tracer
 import numpy as np
 
 
+def settings_cmds(
+        channel: int,
+        sweep_type: str = None,
+        freq_start: float = None,
+        freq_stop: float = None,
+        freq_num: int = None,
+        bandwidth: float = None,
+        aver_fact: int = None,
+        smooth_aper: int = None,
+        cw_freq: float = None,
+        sweep_time: float = None,
+) -> List[str]:
+    """
+    SCPI команды для настроек анализатора, кроме мощности (для нее нужно узнать число портов).
+    Для развертки по времени на одной частоте: sweep_type='CW', cw_freq, freq_num точек за sweep_time секунд
+    """
+    cmds = []
+    if sweep_type is not None:
+        cmds.append(f'SENS{channel}:SWE:TYPE {sweep_type}')
+    if bandwidth is not None:
+        cmds.append(f'SENS{channel}:BAND {bandwidth}')
+    if freq_start is not None:
+        cmds.append(f'SENS{channel}:FREQ:STAR {freq_start}Hz')
+    if freq_stop is not None:
+        cmds.append(f'SENS{channel}:FREQ:STOP {freq_stop}Hz')
+    if freq_num is not None:
+        cmds.append(f'SENS{channel}:SWE:POIN {freq_num}')
+    if cw_freq is not None:
+        cmds.append(f'SENS{channel}:FREQ:CW {cw_freq}Hz')
+    if sweep_time is not None:
+        cmds.append(f'SENS{channel}:SWE:TIME {sweep_time}')
+    if aver_fact is not None:
+        cmds.append(f'SENS{channel}:AVER:STAT ON')
+        cmds.append(f'SENS{channel}:AVER:COUN  {aver_fact}')
+    if smooth_aper is not None:
+        cmds.append(f'CALC{channel}:SMO:STAT ON')
+        cmds.append(f'CALC{channel}:SMO:APER {smooth_aper}')
+    return cmds
+
+
+def trace_name(s_param: str) -> str:
+    """
+    Имя трассы, которая остается определенной на время single_sweeps
+    """
+    return f'Tr{s_param.upper()}'
+
+
+def command_type(cmd: str) -> str:
+    """
+    Заголовок SCPI команды без номеров каналов и аргументов: 'CALC1:DATA? SDATA' -> 'CALC:DATA?'
+    """
+    return re.sub(r'\d+', '', cmd.split(' ', 1)[0])
+
+
 class SocketAnalyzerSignals(AnalyzerSignals):
-    data = EmptySignal()
-    is_connected = EmptySignal()
+    data = InstanceSignal()
+    is_connected = InstanceSignal()
 
 
 class SocketAnalyzer(BaseAnalyzer):
@@ -20,7 +80,8 @@ class SocketAnalyzer(BaseAnalyzer):
             port: Union[str, int],
             bufsize: int = 1024,
             maxbufs: int = 1024,
-            signals: AnalyzerSignals = None
+            signals: AnalyzerSignals = None,
+            buffer_pool: SweepBufferPool = None,
     ):
         """
 
@@ -28,6 +89,7 @@ class SocketAnalyzer(BaseAnalyzer):
         :param port: порт сканера
         :param bufsize: размер чанка сообщения в байтах
         :param maxbufs: максимальное число чанков
+        :param buffer_pool: пул буферов под результаты, если задан -- результаты нужно возвращать через release()
         """
         self.ip, self.port, self.conn = ip, port, socket.socket()
         self.bufsize, self.maxbufs = bufsize, maxbufs
@@ -35,6 +97,9 @@ class SocketAnalyzer(BaseAnalyzer):
         self._is_connected = False
         self.instrument = None
         self.channel = 1
+        self.buffer_pool = buffer_pool
+        self._single_depth = 0
+        self._traces: Dict[str, str] = {}  # S параметр -> трасса, определенная на время single_sweeps
 
         if signals is None:
             self._signals = SocketAnalyzerSignals()
@@ -42,15 +107,28 @@ class SocketAnalyzer(BaseAnalyzer):
             self._signals = signals
 
     def _send_cmd(self, cmd: str):
-        self.instrument.sendall(str.encode(cmd+'\n'))
-        time.sleep(0.1)
+        started = time.perf_counter() if metrics.enabled else None
+        command_bytes = str.encode(cmd+'\n')
+        sent = time.perf_counter_ns() if self.recorder is not None else None
+        response = bytearray()
+        try:
+            self.instrument.sendall(command_bytes)
+            time.sleep(0.1)
+            if '?' in cmd:
+                while not response.endswith(b'\n'):
+                    chunk = self.instrument.recv(self.bufsize)
+                    if not chunk:
+                        raise ConnectionResetError(f'Connection closed while waiting for the answer to {cmd}')
+                    response += chunk
+        except OSError as e:
+            self._set_is_connected(False)
+            raise AnalyzerConnectionError from e
+        if started is not None:
+            metrics.command('analyzer', command_type(cmd), time.perf_counter() - started,
+                            len(command_bytes), len(response))
+        if sent is not None:
+            self.recorder.record(sent, time.perf_counter_ns(), command_bytes, bytes(response))
         if '?' in cmd:
-            response = bytearray()
-            while not response.endswith(b'\n'):
-                chunk = self.instrument.recv(self.bufsize)
-                if not chunk:
-                    break
-                response += chunk
             return response.decode()
 
     def set_settings(self,
@@ -62,27 +140,16 @@ class SocketAnalyzer(BaseAnalyzer):
                      bandwidth: float = None,
                      aver_fact: int = None,
                      smooth_aper: int = None,
-                     power: int = None
+                     power: int = None,
+                     cw_freq: float = None,
+                     sweep_time: float = None,
                      ) -> None:
 
         self._send_cmd("*RST")
         self.channel = channel
-        if sweep_type is not None:
-            self._send_cmd(f'SENS{channel}:SWE:TYPE {sweep_type}')
-        if bandwidth is not None:
-            self._send_cmd(f'SENS{channel}:BAND {bandwidth}')
-        if freq_start is not None:
-            self._send_cmd(f'SENS{channel}:FREQ:STAR {freq_start}Hz')
-        if freq_stop is not None:
-            self._send_cmd(f'SENS{channel}:FREQ:STOP {freq_stop}Hz')
-        if freq_num is not None:
-            self._send_cmd(f'SENS{channel}:SWE:POIN {freq_num}')
-        if aver_fact is not None:
-            self._send_cmd(f'SENS{channel}:AVER:STAT ON')
-            self._send_cmd(f'SENS{channel}:AVER:COUN  {aver_fact}')
-        if smooth_aper is not None:
-            self._send_cmd(f'CALC{channel}:SMO:STAT ON')
-            self._send_cmd(f'CALC{channel}:SMO:APER {smooth_aper}')
+        for cmd in settings_cmds(channel, sweep_type, freq_start, freq_stop, freq_num,
+                                 bandwidth, aver_fact, smooth_aper, cw_freq, sweep_time):
+            self._send_cmd(cmd)
         if power is not None:
             number_of_ports = int(self._send_cmd(f'SERV:PORT:COUN?'))
             for n_port in range(1, number_of_ports+1):
@@ -95,8 +162,14 @@ class SocketAnalyzer(BaseAnalyzer):
     def connect(self) -> None:
         if self._is_connected:
             return
-        self.instrument = self.conn
-        self.instrument.connect((self.ip, self.port))
+        try:
+            # закрытый сокет нельзя подключить повторно, поэтому при переподключении создается новый
+            self.conn.close()
+            self.conn = socket.socket()
+            self.instrument = self.conn
+            self.instrument.connect((self.ip, self.port))
+        except OSError as e:
+            raise AnalyzerConnectionError from e
         self._set_is_connected(True)
 
     def disconnect(self) -> None:
@@ -112,33 +185,118 @@ class SocketAnalyzer(BaseAnalyzer):
     def get_scattering_parameters(
             self,
             parameters: List[str],
-    ) -> dict[str: List[complex]]:
-
-        res = {}
+    ) -> SMatrix:
 
         if not self.is_connected:
             raise AnalyzerConnectionError
 
-        freq_data = self._send_cmd(f'SENS{self.channel}:FREQ:DATA?')
-
-        for num, s_param in enumerate(parameters):
-            num += 1
-            self._send_cmd(f"CALC{self.channel}:PAR:DEF 'Tr{num}',{s_param}")
-            self._send_cmd(f"DISPlay:WINDow1:TRACe2:FEED 'Tr{num}'")
-            # print(self._send_cmd(f"CALC{self.channel}:PAR:CAT?"))
-            self._send_cmd(f"CALC{self.channel}:PAR:SEL 'Tr{num}'")
-            trace_data = self._send_cmd(f'CALC{self.channel}:DATA? SDATA')
-            trace_tup = tuple(map(str, trace_data.split(',')))
-            trace_array = np.array(trace_tup).astype(float)
-            res[f'{s_param}'] = trace_array[:-1:2] + 1j * trace_array[1::2]
-            self._send_cmd(f"CALC{self.channel}:PAR:DEL 'Tr{num}'")
+        with tracer.span('sweep', 'analyzer', parameters=len(parameters)):
+            with tracer.span('transfer', 'analyzer'):
+                freq_data = self._send_cmd(f'SENS{self.channel}:FREQ:DATA?')
+            with tracer.span('parse', 'analyzer'):
+                res = self._acquire_result(parameters, np.fromstring(freq_data, sep=','))
 
-        freq_tup = tuple(map(str, freq_data.split(',')))
-        res[f'f'] = np.array(freq_tup).astype(float)
+            for num, s_param in enumerate(parameters):
+                num += 1
+                # трассы из single_sweeps уже содержат данные последней развертки, остальные создаются на время чтения
+                temporary = s_param.upper() not in self._traces
+                trace = f'Tr{num}' if temporary else self._traces[s_param.upper()]
+                if temporary:
+                    self._send_cmd(f"CALC{self.channel}:PAR:DEF '{trace}',{s_param}")
+                    self._send_cmd(f"DISPlay:WINDow1:TRACe2:FEED '{trace}'")
+                # print(self._send_cmd(f"CALC{self.channel}:PAR:CAT?"))
+                self._send_cmd(f"CALC{self.channel}:PAR:SEL '{trace}'")
+                # всегда забираем комплексные данные, форматирование делается на хосте: res.format(...)
+                with tracer.span('transfer', 'analyzer', parameter=s_param):
+                    trace_data = self._send_cmd(f'CALC{self.channel}:DATA? SDATA')
+                with tracer.span('parse', 'analyzer', parameter=s_param):
+                    res.set_interleaved(s_param, trace_data)
+                if temporary:
+                    self._send_cmd(f"CALC{self.channel}:PAR:DEL '{trace}'")
 
-        self._signals.data.emit(res)
+            self._finalize_result(res)
+        with tracer.span('signal dispatch', 'analyzer'):
+            self._signals.data.emit(res)
         return res
 
+    def sweep_time(self) -> float:
+        """
+        Длительность развертки в секундах
+        """
+        return float(self._send_cmd(f'SENS{self.channel}:SWE:TIME?'))
+
+    def bandwidth(self) -> float:
+        """
+        Полоса ПЧ в Гц
+        """
+        return float(self._send_cmd(f'SENS{self.channel}:BAND?'))
+
+    def set_bandwidth(self, bandwidth: float) -> None:
+        """
+        Изменить только полосу ПЧ. В отличие от set_settings, остальные настройки не сбрасываются
+        """
+        self._send_cmd(f'SENS{self.channel}:BAND {bandwidth}')
+
+    def _define_traces(self, parameters: Sequence[str]) -> None:
+        """
+        Определяет трассы параметров, у которых их еще нет
+        """
+        for s_param in parameters:
+            if (s_param := s_param.upper()) in self._traces:
+                continue
+            trace = trace_name(s_param)
+            self._send_cmd(f"CALC{self.channel}:PAR:DEF '{trace}',{s_param}")
+            self._send_cmd(f"DISPlay:WINDow1:TRACe2:FEED '{trace}'")
+            self._traces[s_param] = trace
+
+    @contextmanager
+    def single_sweeps(self, parameters: Sequence[str] = ()) -> Iterator['SocketAnalyzer']:
+        """
+        Выключает непрерывные развертки на время блока, развертки запускаются trigger_sweep.
+        После блока, в том числе при исключении, непрерывные развертки включаются снова,
+        если они были включены до него. Блоки можно вкладывать друг в друга.
+
+        Трасса, определенная после развертки, не содержит ее данных, поэтому трассы parameters
+        определяются в начале блока и удаляются после него, а get_scattering_parameters читает их без
+        переопределения. Параметры, которых нет в parameters, после trigger_sweep прочитать нельзя
+
+        :param parameters: S параметры, которые будут читаться после trigger_sweep
+        """
+        continuous = False
+        if self._single_depth == 0:
+            continuous = self._send_cmd(f'INIT{self.channel}:CONT?').strip().upper() in ('1', 'ON')
+            if continuous:
+                self._send_cmd(f'INIT{self.channel}:CONT OFF')
+        self._single_depth += 1
+        defined = set(self._traces)
+        try:
+            self._define_traces(parameters)
+            yield self
+        finally:
+            self._single_depth -= 1
+            # после потери связи команды не отправляются, чтобы не скрыть исходную ошибку
+            for s_param in [p for p in self._traces if p not in defined]:
+                trace = self._traces.pop(s_param)
+                if self._is_connected:
+                    self._send_cmd(f"CALC{self.channel}:PAR:DEL '{trace}'")
+            if continuous and self._is_connected:
+                self._send_cmd(f'INIT{self.channel}:CONT ON')
+
+    def trigger_sweep(self) -> float:
+        """
+        Запускает одну развертку и ждет ее окончания.
+        Данные этой развертки затем читаются get_scattering_parameters для параметров, переданных в single_sweeps.
+        Вызывать внутри single_sweeps, иначе непрерывные развертки выключаются и остаются выключенными.
+
+        :return: время запуска развертки по time.monotonic()
+        """
+        if self._single_depth == 0:
+            self._send_cmd(f'INIT{self.channel}:CONT OFF')
+        started = time.monotonic()
+        self._send_cmd(f'INIT{self.channel}:IMM')
+        self._send_cmd('*OPC?')
+        return started
+
     def is_connected(self) -> bool:
         return self._is_connected
 
@@ -0,0 +1,264 @@
+"""
+Бенчмарки драйверов и скана на эмуляторах сканера TRIM и SCPI анализатора.
+
+Запуск:
+    python -m anechoic_utils.benchmark --output results.json
+    python -m anechoic_utils.benchmark --output results.json --baseline baseline.json
+
+С --baseline результаты сравниваются с сохраненными, и при ухудшении больше порога
+команда завершается с кодом 1. С --latency, --jitter, --bandwidth, --fragment приборы подключаются
+через прокси anechoic_utils.proxy с такими условиями сети.
+"""
+import argparse
+import dataclasses
+import json
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from .analyzator.socket_analyzer import SocketAnalyzer, analyzer_emulator
+from . import proxy
+from .scanner import Position
+from .scanner.TRIM import TRIMScanner, TRIM_emulator, DEFAULT_SETTINGS
+
+import logging
+logger = logging.getLogger('benchmark')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def stats(samples: List[float], unit: str = 's', better: str = 'lower') -> Dict:
+    """
+    Сводка по замерам, по медиане идет сравнение с базовыми результатами
+    """
+    samples = sorted(samples)
+    return {
+        'unit': unit,
+        'better': better,
+        'n': len(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'p90': samples[min(len(samples) - 1, int(0.9 * len(samples)))],
+        'min': samples[0],
+        'max': samples[-1],
+    }
+
+
+def timeit(func: Callable, repeat: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        func()
+    res = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        res.append(time.perf_counter() - t)
+    return res
+
+
+class Benchmark:
+    """
+    Набор бенчмарков. Каждый метод bench_* возвращает словарь {имя метрики: stats(...)}
+    """
+    def __init__(self, repeat: int = 20, motion_time: float = 0.2,
+                 freq_nums=(201, 1601, 6401), parameter_counts=(1, 2, 4), raster: int = 5,
+                 network: proxy.NetworkProfile = None):
+        """
+
+        :param repeat: число повторов быстрых замеров
+        :param motion_time: длительность каждого движения в эмуляторе сканера в секундах
+        :param freq_nums: числа точек по частоте для замера get_scattering_parameters
+        :param parameter_counts: числа S параметров для замера get_scattering_parameters
+        :param raster: размер эталонного растра raster x raster
+        :param network: условия сети между драйверами и эмуляторами, None -- напрямую
+        """
+        self.repeat = repeat
+        self.motion_time = motion_time
+        self.freq_nums, self.parameter_counts = freq_nums, parameter_counts
+        self.raster = raster
+        self.network = network
+
+        scanner_port, analyzer_port = free_port(), free_port()
+        TRIM_emulator.run(blocking=False, ip='127.0.0.1', port=scanner_port, motion_time=motion_time)
+        analyzer_emulator.run(blocking=False, ip='127.0.0.1', port=analyzer_port)
+        if network is not None:
+            proxy_ports = free_port(), free_port()
+            for target, port in zip((scanner_port, analyzer_port), proxy_ports):
+                proxy.run('127.0.0.1', target, network, blocking=False, port=port)
+            scanner_port, analyzer_port = proxy_ports
+        self.scanner = TRIMScanner('127.0.0.1', scanner_port)
+        self.analyzer = SocketAnalyzer('127.0.0.1', analyzer_port)
+        for _ in range(50):
+            try:
+                self.scanner.connect()
+                self.analyzer.connect()
+                break
+            except (OSError, Exception):
+                time.sleep(0.1)
+        self.scanner.set_settings(**DEFAULT_SETTINGS)
+
+    def bench_send_cmd(self) -> Dict:
+        return {
+            'scanner.send_cmd': stats(timeit(lambda: self.scanner._send_cmd('AMS'), self.repeat * 5)),
+            'analyzer.send_cmd': stats(timeit(lambda: self.analyzer._send_cmd('*OPC?'), max(3, self.repeat // 4))),
+        }
+
+    def bench_set_settings(self) -> Dict:
+        return {
+            'scanner.set_settings': stats(timeit(lambda: self.scanner.set_settings(**DEFAULT_SETTINGS), self.repeat)),
+        }
+
+    def bench_pipeline(self) -> Dict:
+        res = {}
+        for pipeline in (False, True):
+            self.scanner.pipeline = pipeline
+            res[f'scanner.set_settings[pipeline={pipeline}]'] = stats(
+                timeit(lambda: self.scanner.set_settings(**DEFAULT_SETTINGS), self.repeat)
+            )
+        self.scanner.pipeline = False
+        return res
+
+    def bench_import(self) -> Dict:
+        """
+        Время импорта в новом процессе: рабочие процессы запускаются часто
+        """
+        res = {}
+        for module in ('anechoic_utils.analyzator', 'anechoic_utils.analyzator.socket_analyzer',
+                       'anechoic_utils.scanner.TRIM', 'anechoic_utils.scan'):
+            code = f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+            samples = [
+                float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout)
+                for _ in range(max(3, self.repeat // 4))
+            ]
+            res[f'import[{module}]'] = stats(samples)
+        return res
+
+    def bench_goto(self) -> Dict:
+        positions = iter([Position(x=10. * (i % 2), y=5. * (i % 2)) for i in range(self.repeat + 1)])
+        times = timeit(lambda: self.scanner.goto(next(positions)), self.repeat, warmup=0)
+        # время сверх самого движения: команды, опрос, успокоение, проверка причины остановки
+        return {'scanner.goto_overhead': stats([t - self.motion_time for t in times])}
+
+    def bench_sweep(self) -> Dict:
+        res = {}
+        repeat = max(2, self.repeat // 10)
+        for freq_num in self.freq_nums:
+            self.analyzer.set_settings(freq_num=freq_num)
+            for count in self.parameter_counts:
+                parameters = ['S11', 'S21', 'S12', 'S22'][:count]
+                res[f'analyzer.get_scattering_parameters[{freq_num}x{count}]'] = stats(
+                    timeit(lambda: self.analyzer.get_scattering_parameters(parameters).release(), repeat)
+                )
+        return res
+
+    def bench_raster(self) -> Dict:
+        from .scan import ScanPlan, Chamber, Orchestrator
+        import asyncio
+        self.analyzer.set_settings(freq_num=201)
+        plan = ScanPlan.grid(['S21'], x=np.linspace(0, 40, self.raster), y=np.linspace(0, 40, self.raster))
+        chamber = Chamber('benchmark', self.scanner, self.analyzer, plan, on_point=lambda *args: None)
+        asyncio.run(Orchestrator([chamber]).run())
+        return {
+            'scan.points_per_hour': stats([chamber.stats.throughput * 3600], unit='points/h', better='higher'),
+        }
+
+    def run(self, names: List[str] = None) -> Dict:
+        names = names or [name.removeprefix('bench_') for name in dir(self) if name.startswith('bench_')]
+        results = {}
+        for name in names:
+            logger.info(f'Running {name}...')
+            results.update(getattr(self, f'bench_{name}')())
+        return {
+            'meta': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'motion_time': self.motion_time,
+                'network': dataclasses.asdict(self.network) if self.network is not None else None,
+            },
+            'results': results,
+        }
+
+    def close(self) -> None:
+        self.scanner.disconnect()
+        self.analyzer.disconnect()
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = 0.2, noise: float = 1e-4) -> List[str]:
+    """
+    Сравнение медиан с базовыми результатами
+
+    :param results: результаты Benchmark.run
+    :param baseline: сохраненные результаты Benchmark.run
+    :param threshold: допустимое относительное ухудшение
+    :param noise: изменения времени меньше noise секунд не считаются ухудшением (шум планировщика)
+    :return: описания ухудшившихся метрик
+    """
+    regressions = []
+    for name, current in results['results'].items():
+        if (base := baseline.get('results', {}).get(name)) is None or not base['median']:
+            continue
+        change = current['median'] / base['median'] - 1
+        if current['better'] == 'higher':
+            change = -change
+        line = f'{name}: {base["median"]:.6g} -> {current["median"]:.6g} {current["unit"]} ({change:+.1%})'
+        logger.info(line)
+        if change > threshold and not (current['unit'] == 's' and abs(current['median'] - base['median']) < noise):
+            regressions.append(line)
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='anechoic_utils benchmarks on the TRIM and analyzer emulators')
+    parser.add_argument('--output', help='JSON file for the results')
+    parser.add_argument('--baseline', help='JSON file with baseline results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--only', nargs='*',
+                        help='benchmarks to run: send_cmd, set_settings, pipeline, import, goto, sweep, raster')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--quick', action='store_true', help='fewer repeats and smaller sweeps')
+    parser.add_argument('--latency', type=float, help='one-way network delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0., help='max random extra delay in seconds')
+    parser.add_argument('--bandwidth', type=float, help='network bandwidth in bytes per second')
+    parser.add_argument('--fragment', type=int, help='max network fragment size in bytes')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    network = None
+    if args.latency is not None or args.jitter or args.bandwidth or args.fragment:
+        network = proxy.NetworkProfile(args.latency or 0., args.jitter, args.bandwidth, args.fragment, seed=0)
+    if args.quick:
+        benchmark = Benchmark(repeat=5, freq_nums=(201, 1601), parameter_counts=(1, 2), raster=3, network=network)
+    else:
+        benchmark = Benchmark(repeat=args.repeat, network=network)
+    try:
+        results = benchmark.run(args.only)
+    finally:
+        benchmark.close()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
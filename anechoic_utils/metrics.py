@@ -0,0 +1,162 @@
+"""
+Метрики горячих путей драйверов: задержки команд, ожидание локов, опросы во время движения, трафик.
+
+По умолчанию сбор выключен, и инструментированный код проверяет только флаг metrics.enabled.
+"""
+import bisect
+import threading
+from typing import Dict, Tuple
+
+# границы корзин гистограмм в секундах: от 10 мкс до 30 с
+LATENCY_BUCKETS = (
+    1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2,
+    0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.,
+)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами, как в Prometheus
+    """
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict:
+        cumulative, total = {}, 0
+        for bound, count in zip(self.bounds + (float('inf'), ), self.counts):
+            total += count
+            cumulative[bound] = total
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.,
+            'buckets': cumulative,
+        }
+
+
+class Metrics:
+    """
+    Реестр метрик. Имена метрик:
+    - command_latency_seconds{device, command} -- время обмена командой без ожидания лока
+    - lock_wait_seconds{lock} -- ожидание FIFOLock
+    - motion_polls{device} -- число опросов состояния за одно движение
+    - motion_poll_sleep_seconds{device} -- суммарная пауза между опросами за одно движение
+    - bytes_sent_total{device}, bytes_received_total{device} -- трафик
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if (histogram := self._histograms.get(key)) is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def command(self, device: str, command: str, latency: float, sent: int, received: int) -> None:
+        """
+        Обмен одной командой с прибором
+        """
+        self.observe('command_latency_seconds', latency, device=device, command=command)
+        self.inc('bytes_sent_total', sent, device=device)
+        self.inc('bytes_received_total', received, device=device)
+
+    def snapshot(self) -> Dict:
+        """
+        Текущие значения всех метрик: {имя: [{'labels': {...}, ...значения}]}
+        """
+        res = {}
+        with self._lock:
+            for (name, labels), histogram in self._histograms.items():
+                res.setdefault(name, []).append({'labels': dict(labels), **histogram.snapshot()})
+            for (name, labels), value in self._counters.items():
+                res.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        return res
+
+    def prometheus_text(self) -> str:
+        """
+        Метрики в текстовом формате Prometheus
+        """
+        def fmt(labels: Dict, **extra) -> str:
+            items = {**labels, **extra}
+            return '{' + ','.join(f'{k}="{v}"' for k, v in items.items()) + '}' if items else ''
+
+        lines = []
+        for name, series in sorted(self.snapshot().items()):
+            full_name = f'anechoic_{name}'
+            if 'buckets' in series[0]:
+                lines.append(f'# TYPE {full_name} histogram')
+                for s in series:
+                    for bound, count in s['buckets'].items():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{full_name}_bucket{fmt(s["labels"], le=le)} {count}')
+                    lines.append(f'{full_name}_sum{fmt(s["labels"])} {s["sum"]}')
+                    lines.append(f'{full_name}_count{fmt(s["labels"])} {s["count"]}')
+            else:
+                lines.append(f'# TYPE {full_name} counter')
+                for s in series:
+                    lines.append(f'{full_name}{fmt(s["labels"])} {s["value"]}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int = 9464, host: str = '127.0.0.1') -> 'ThreadingHTTPServer':
+        """
+        Отдает метрики в формате Prometheus по http://host:port/metrics из отдельного потока.
+        Остановить сервер: server.shutdown()
+        """
+        # http.server импортируется только здесь: он заметно увеличивает время импорта драйверов
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+metrics = Metrics()
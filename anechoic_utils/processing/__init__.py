@@ -0,0 +1,4 @@
+"""
+Обработка данных анализатора
+"""
+from .time_domain import TimeGate, time_gate, tukey, WINDOWS
@@ -0,0 +1,171 @@
+"""
+Преобразование S параметров во временную область и временное стробирование (time gating)
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+
+WINDOWS = {
+    'rect': np.ones,
+    'hann': lambda n: np.hanning(n + 2)[1:-1],
+    'hamming': np.hamming,
+    'blackman': lambda n: np.blackman(n + 2)[1:-1],
+    'kaiser': lambda n, beta=6.0: np.kaiser(n, beta),
+}
+# допустимое отклонение шага частотной сетки от среднего, в долях шага
+GRID_TOLERANCE = 1e-3
+
+
+def tukey(n: int, alpha: float) -> np.ndarray:
+    """
+    Окно Тьюки: прямоугольник с косинусными фронтами
+
+    :param n: длина окна
+    :param alpha: доля окна, занятая фронтами (0 -- прямоугольник, 1 -- окно Ханна)
+    :return: окно
+    """
+    if n <= 0:
+        return np.zeros(0)
+    if alpha <= 0 or n == 1:
+        return np.ones(n)
+    alpha = min(alpha, 1.)
+    x = np.linspace(0, 1, n)
+    res = np.ones(n)
+    edge = alpha / 2
+    left, right = x < edge, x > 1 - edge
+    res[left] = 0.5 * (1 + np.cos(np.pi * (x[left] / edge - 1)))
+    res[right] = 0.5 * (1 + np.cos(np.pi * ((x[right] - 1) / edge + 1)))
+    return res
+
+
+class TimeGate:
+    """
+    Временное стробирование блока S параметров.
+
+    Блок данных формы (..., n_freq) переводится во временную область оконным ОБПФ,
+    умножается на строб и возвращается обратно в частотную область. Все точки скана
+    обрабатываются одним векторизованным вызовом по последней оси.
+    Окно и строб вычисляются один раз для каждой частотной сетки и кэшируются.
+    """
+    def __init__(
+            self,
+            start: float,
+            stop: float,
+            window: str = 'hann',
+            gate_taper: float = 0.,
+            n_fft: int = None,
+            cache_size: int = 8,
+    ):
+        """
+
+        :param start: начало строба в секундах
+        :param stop: конец строба в секундах
+        :param window: окно, применяемое к данным перед ОБПФ (см. WINDOWS)
+        :param gate_taper: доля строба, занятая косинусными фронтами (окно Тьюки)
+        :param n_fft: число точек ОБПФ (дополнение нулями), по умолчанию равно числу частот
+        :param cache_size: максимальное число частотных сеток в кэше
+        """
+        if stop <= start:
+            raise ValueError(f'Gate stop ({stop}) must be greater than start ({start})')
+        if window not in WINDOWS:
+            raise ValueError(f'Unknown window {window}, available: {", ".join(WINDOWS)}')
+        self.start, self.stop = start, stop
+        self.window = window
+        self.gate_taper = gate_taper
+        self.n_fft = n_fft
+        self.cache_size = cache_size
+        self._kernels: Dict[Tuple, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def _kernels_for(self, frequencies: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Окно, обратное окно, строб и временная ось для частотной сетки. Результат кэшируется.
+
+        :param frequencies: частоты в Гц, равномерная сетка
+        :return: (окно, 1 / окно, строб во временной области, времена ОБПФ)
+        """
+        frequencies = np.asarray(frequencies, dtype=float)
+        n = len(frequencies)
+        if n < 2:
+            raise ValueError('At least two frequency points are required for time gating')
+        df = (frequencies[-1] - frequencies[0]) / (n - 1)
+        # ОБПФ неравномерной сетки дает неверную импульсную характеристику
+        if df == 0 or np.abs(np.diff(frequencies) - df).max() > GRID_TOLERANCE * abs(df):
+            raise ValueError('Time domain transform requires a uniform frequency grid')
+        key = (n, float(frequencies[0]), float(df))
+        if (kernels := self._kernels.get(key)) is not None:
+            return kernels
+
+        n_fft = max(self.n_fft or n, n)
+        window = WINDOWS[self.window](n)
+        # отрицательные времена лежат во второй половине массива ОБПФ
+        time = np.fft.fftfreq(n_fft, d=df)
+        gate = np.zeros(n_fft)
+        inside = np.flatnonzero((time >= self.start) & (time <= self.stop))
+        if len(inside):
+            order = inside[np.argsort(time[inside])]
+            gate[order] = tukey(len(order), self.gate_taper)
+
+        if len(self._kernels) >= self.cache_size:
+            self._kernels.pop(next(iter(self._kernels)))
+        kernels = (window, 1 / window, gate, time)
+        self._kernels[key] = kernels
+        return kernels
+
+    def time_axis(self, frequencies: np.ndarray) -> np.ndarray:
+        """
+        Временная ось ОБПФ для частотной сетки
+
+        :param frequencies: частоты в Гц
+        :return: времена в секундах, отрицательные времена во второй половине массива
+        """
+        return self._kernels_for(frequencies)[3]
+
+    def to_time(self, data: np.ndarray, frequencies: np.ndarray) -> np.ndarray:
+        """
+        Оконное ОБПФ блока данных по последней оси
+
+        :param data: комплексные S параметры формы (..., n_freq)
+        :param frequencies: частоты в Гц
+        :return: импульсная характеристика формы (..., n_fft)
+        """
+        window, _, _, time = self._kernels_for(frequencies)
+        return np.fft.ifft(np.asarray(data) * window, n=len(time), axis=-1)
+
+    def __call__(self, data: np.ndarray, frequencies: np.ndarray) -> np.ndarray:
+        """
+        Стробирование блока данных
+
+        :param data: комплексные S параметры формы (..., n_freq), например (points, freqs)
+        :param frequencies: частоты в Гц
+        :return: стробированные S параметры той же формы
+        """
+        data = np.asarray(data)
+        n = data.shape[-1]
+        if n != len(frequencies):
+            raise ValueError(f'Data has {n} frequency points, but {len(frequencies)} frequencies were given')
+        window, inv_window, gate, _ = self._kernels_for(frequencies)
+        impulse = np.fft.ifft(data * window, n=len(gate), axis=-1)
+        impulse *= gate
+        gated = np.fft.fft(impulse, axis=-1)[..., :n]
+        gated *= inv_window
+        return gated
+
+
+def time_gate(
+        data: np.ndarray,
+        frequencies: np.ndarray,
+        start: float,
+        stop: float,
+        **kwargs
+) -> np.ndarray:
+    """
+    Однократное стробирование без сохранения кэша. Для потока данных лучше использовать TimeGate.
+
+    :param data: комплексные S параметры формы (..., n_freq)
+    :param frequencies: частоты в Гц
+    :param start: начало строба в секундах
+    :param stop: конец строба в секундах
+    :param kwargs: остальные параметры TimeGate
+    :return: стробированные S параметры
+    """
+    return TimeGate(start, stop, **kwargs)(data, frequencies)
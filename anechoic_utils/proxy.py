@@ -0,0 +1,178 @@
+"""
+TCP прокси для проверки драйверов на эмуляторах в сетевых условиях, близких к реальным:
+задержка, джиттер, ограничение полосы и дробление данных на мелкие пакеты.
+
+Запуск перед эмулятором сканера на порту 9000:
+    python -m anechoic_utils.proxy --target-port 9000 --port 9100 --latency 0.002 --jitter 0.001 --fragment 8
+"""
+import argparse
+import queue
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import logging
+logger = logging.getLogger('proxy')
+
+
+@dataclass
+class NetworkProfile:
+    """
+    Условия сети. Задержки в секундах, полоса в байтах в секунду
+    """
+    latency: float = 0.  # задержка в одну сторону, RTT = 2 * latency
+    jitter: float = 0.  # максимальная случайная добавка к задержке, порядок байт сохраняется
+    bandwidth: Optional[float] = None  # None -- без ограничения
+    fragment: Optional[int] = None  # максимальный размер фрагмента, None -- не дробить
+    fragment_gap: float = 0.0002  # пауза между фрагментами, чтобы они приходили отдельными пакетами
+    seed: Optional[int] = None
+
+    @classmethod
+    def lan(cls) -> 'NetworkProfile':
+        """
+        Коммутатор камеры: RTT около 2 мс с небольшим джиттером
+        """
+        return cls(latency=0.001, jitter=0.0005)
+
+    @classmethod
+    def slow_link(cls) -> 'NetworkProfile':
+        """
+        Медленный канал к старому анализатору: 100 кбит/с, RTT 10 мс, мелкие пакеты
+        """
+        return cls(latency=0.005, jitter=0.002, bandwidth=12_500, fragment=64)
+
+
+class _Pipe:
+    """
+    Одно направление соединения: читает из src, доставляет в dst с задержками профиля
+    """
+    def __init__(self, src: socket.socket, dst: socket.socket, profile: NetworkProfile, rng: random.Random):
+        self.src, self.dst, self.profile, self.rng = src, dst, profile, rng
+        self._queue = queue.Queue()
+        self._last_delivery = 0.  # доставка не раньше предыдущей, чтобы джиттер не переставлял байты
+        self._link_free = 0.  # когда канал освободится при ограниченной полосе
+
+    def _read(self) -> None:
+        try:
+            while data := self.src.recv(65536):
+                now = time.monotonic()
+                delay = self.profile.latency + self.rng.uniform(0, self.profile.jitter)
+                if self.profile.bandwidth:
+                    self._link_free = max(self._link_free, now) + len(data) / self.profile.bandwidth
+                    delivery = self._link_free + delay
+                else:
+                    delivery = now + delay
+                self._last_delivery = max(self._last_delivery, delivery)
+                self._queue.put((self._last_delivery, data))
+        except OSError:
+            pass
+        self._queue.put(None)
+
+    def _write(self) -> None:
+        try:
+            while (item := self._queue.get()) is not None:
+                delivery, data = item
+                if (wait := delivery - time.monotonic()) > 0:
+                    time.sleep(wait)
+                if not self.profile.fragment:
+                    self.dst.sendall(data)
+                    continue
+                while data:
+                    size = self.rng.randint(1, self.profile.fragment)
+                    self.dst.sendall(data[:size])
+                    data = data[size:]
+                    if data and self.profile.fragment_gap:
+                        time.sleep(self.profile.fragment_gap)
+        except OSError:
+            pass
+        for s in (self.dst, self.src):
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self) -> None:
+        threading.Thread(target=self._read, daemon=True).start()
+        threading.Thread(target=self._write, daemon=True).start()
+
+
+class ShapingProxy:
+    """
+    Прокси: каждое входящее соединение пробрасывается на target с условиями profile в обе стороны
+    """
+    def __init__(self, target_ip: str, target_port: int, profile: NetworkProfile = None,
+                 upstream: NetworkProfile = None):
+        """
+
+        :param target_ip: адрес эмулятора или прибора
+        :param target_port: порт эмулятора или прибора
+        :param profile: условия в сторону клиента (ответы) и, если upstream не задан, в сторону прибора
+        :param upstream: условия в сторону прибора (команды)
+        """
+        self.target = (target_ip, target_port)
+        self.profile = profile if profile is not None else NetworkProfile()
+        self.upstream = upstream if upstream is not None else self.profile
+        self.rng = random.Random(self.profile.seed)
+        self.connections = 0
+        self._server: socket.socket = None
+
+    def _handle(self, client: socket.socket) -> None:
+        try:
+            target = socket.create_connection(self.target)
+        except OSError as e:
+            logger.warning(f'Cannot connect to {self.target}: {e}')
+            client.close()
+            return
+        for s in (client, target):
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections += 1
+        _Pipe(client, target, self.upstream, self.rng).start()
+        _Pipe(target, client, self.profile, self.rng).start()
+
+    def serve(self, ip: str = '127.0.0.1', port: int = 9100) -> None:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((ip, port))
+            s.listen()
+            self._server = s
+            while True:
+                try:
+                    client, addr = s.accept()
+                except OSError:
+                    return
+                self._handle(client)
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+
+
+def run(target_ip: str, target_port: int, profile: NetworkProfile = None,
+        blocking=True, ip='127.0.0.1', port=9100) -> ShapingProxy:
+    proxy = ShapingProxy(target_ip, target_port, profile)
+    server_thread = threading.Thread(target=proxy.serve, args=(ip, port), daemon=not blocking)
+    print(f'Starting proxy {ip}:{port} -> {target_ip}:{target_port}')
+    server_thread.start()
+    if blocking:
+        server_thread.join()
+    return proxy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TCP proxy with latency, jitter, bandwidth and fragmentation')
+    parser.add_argument('--target-ip', default='127.0.0.1')
+    parser.add_argument('--target-port', type=int, required=True)
+    parser.add_argument('--ip', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency', type=float, default=0., help='one-way delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0., help='max random extra delay in seconds')
+    parser.add_argument('--bandwidth', type=float, help='bytes per second')
+    parser.add_argument('--fragment', type=int, help='max fragment size in bytes')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    run(args.target_ip, args.target_port,
+        NetworkProfile(args.latency, args.jitter, args.bandwidth, args.fragment, seed=args.seed),
+        ip=args.ip, port=args.port)
@@ -0,0 +1,11 @@
+"""
+Сканы: планы, выполнение и управление несколькими камерами
+"""
+from .plan import ScanPlan
+from .orchestrator import Chamber, ChamberStats, Orchestrator, PointRecord
+from .motion_model import MotionModel
+from .path import optimize_order, optimize_plan
+from .adaptive import AdaptiveScan
+from .checkpoint import Checkpoint, plan_hash
+from .pattern_cut import PatternCut, continuous_cut
+from .simulate import ScanSimulator, AcquisitionModel, ScanEstimate, EtaTracker, STOP_AND_GO, FLY
@@ -0,0 +1,224 @@
+"""
+Адаптивный скан: начинается с грубой сетки и сгущает точки только там, где поле меняется
+"""
+import heapq
+import itertools
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from ..analyzator.base_analyzator import BaseAnalyzer
+from ..analyzator.s_matrix import SMatrix
+from ..scanner import Position, Scanner
+from .plan import AXES
+
+import logging
+logger = logging.getLogger('scan.adaptive')
+
+Cell = Tuple[Tuple[int, ...], int]  # (нижний угол на целочисленной решетке, размер)
+
+
+class AdaptiveScan:
+    """
+    Адаптивный скан по одной, двум или трем осям.
+
+    Область делится на ячейки (отрезки, прямоугольники, параллелепипеды). Сначала измеряются
+    узлы грубой сетки, затем ячейка с наибольшей ошибкой делится пополам по каждой оси.
+    Ошибка ячейки -- наибольшая разница значений в ее углах и ошибка мультилинейной
+    интерполяции в центре родительской ячейки. Ячейки с ошибкой меньше tolerance не делятся.
+    Все узлы лежат на целочисленной решетке самого мелкого уровня: словарь узлов служит
+    пространственным индексом, общие узлы соседних ячеек измеряются один раз, а выбор
+    следующей ячейки -- операция с кучей, O(log n).
+    """
+    def __init__(
+            self,
+            scanner: Scanner,
+            analyzer: BaseAnalyzer,
+            bounds: Dict[str, Tuple[float, float]],
+            parameters: Sequence[str] = ('S21', ),
+            initial: int = 5,
+            max_depth: int = 4,
+            tolerance: float = 0.05,
+            feature: Callable[[SMatrix], np.ndarray] = None,
+            max_points: int = None,
+            time_budget: float = None,
+            fixed: Position = None,
+            on_point: Callable[[Position, SMatrix], None] = None,
+    ):
+        """
+
+        :param scanner: сканер
+        :param analyzer: анализатор
+        :param bounds: границы области по осям, например {'x': (0, 1000), 'y': (0, 500)}
+        :param parameters: измеряемые S параметры
+        :param initial: число точек начальной сетки по каждой оси
+        :param max_depth: максимальное число делений начальной ячейки
+        :param tolerance: допустимая ошибка в единицах feature
+        :param feature: величина, по которой оценивается изменение поля,
+            по умолчанию комплексный первый параметр на всех частотах
+        :param max_points: максимальное число измеренных точек
+        :param time_budget: максимальная длительность скана в секундах
+        :param fixed: координаты остальных осей, которые не меняются во время скана
+        :param on_point: вызывается после каждой измеренной точки
+        """
+        unknown = set(bounds) - set(AXES)
+        if unknown or not bounds:
+            raise ValueError(f'Bounds must be given for some of the axes {AXES}, got {list(bounds)}')
+        if initial < 2:
+            raise ValueError('At least two initial points per axis are required')
+        self.scanner, self.analyzer = scanner, analyzer
+        self.axes = [axis for axis in AXES if axis in bounds]
+        self.low = np.array([bounds[axis][0] for axis in self.axes], dtype=float)
+        high = np.array([bounds[axis][1] for axis in self.axes], dtype=float)
+        self.parameters = list(parameters)
+        self.initial, self.max_depth = initial, max_depth
+        self.tolerance = tolerance
+        self.feature = feature or (lambda res: res[self.parameters[0]])
+        self.max_points, self.time_budget = max_points, time_budget
+        self.fixed = fixed or Position()
+        self.on_point = on_point
+
+        self.root_size = 2 ** max_depth
+        self.step = (high - self.low) / ((initial - 1) * self.root_size)
+        # пространственный индекс: узел решетки -> значение feature
+        self.values: Dict[Tuple[int, ...], np.ndarray] = {}
+        self.results: Dict[Tuple[int, ...], SMatrix] = {}
+        self._queue: List = []
+        self._counter = itertools.count()
+        self._started: float = None
+
+    @property
+    def dims(self) -> int:
+        return len(self.axes)
+
+    def position(self, node: Tuple[int, ...]) -> Position:
+        """
+        Координаты узла решетки
+        """
+        coordinates = self.low + np.array(node) * self.step
+        res = Position(**{axis: self.fixed.__getattribute__(axis) for axis in AXES})
+        for axis, value in zip(self.axes, coordinates.tolist()):
+            res.__setattr__(axis, value)
+        return res
+
+    def _corners(self, cell: Cell) -> List[Tuple[int, ...]]:
+        low, size = cell
+        return [tuple(l + o * size for l, o in zip(low, offset)) for offset in itertools.product((0, 1), repeat=self.dims)]
+
+    def _nodes(self, cell: Cell) -> List[Tuple[int, ...]]:
+        """
+        Узлы ячейки после деления: 3^dims точек
+        """
+        low, size = cell
+        half = size // 2
+        return [tuple(l + o * half for l, o in zip(low, offset)) for offset in itertools.product((0, 1, 2), repeat=self.dims)]
+
+    def _children(self, cell: Cell) -> List[Cell]:
+        low, size = cell
+        half = size // 2
+        return [(tuple(l + o * half for l, o in zip(low, offset)), half)
+                for offset in itertools.product((0, 1), repeat=self.dims)]
+
+    @staticmethod
+    def _distance(a: np.ndarray, b: np.ndarray) -> float:
+        return float(np.max(np.abs(np.asarray(a) - np.asarray(b))))
+
+    def _variation(self, cell: Cell) -> float:
+        values = [self.values[c] for c in self._corners(cell)]
+        return max(self._distance(a, b) for a, b in itertools.combinations(values, 2))
+
+    def _center_error(self, cell: Cell) -> float:
+        """
+        Ошибка мультилинейной интерполяции по углам в центре ячейки
+        """
+        low, size = cell
+        center = tuple(l + size // 2 for l in low)
+        interpolated = np.mean([self.values[c] for c in self._corners(cell)], axis=0)
+        return self._distance(self.values[center], interpolated)
+
+    def _push(self, cell: Cell, inherited: float = 0.) -> None:
+        if cell[1] < 2:
+            return
+        error = max(self._variation(cell), inherited)
+        if error > self.tolerance:
+            heapq.heappush(self._queue, (-error, -cell[1], next(self._counter), cell))
+
+    def _budget_left(self) -> bool:
+        if self.max_points is not None and len(self.values) >= self.max_points:
+            return False
+        if self.time_budget is not None and time.monotonic() - self._started >= self.time_budget:
+            return False
+        return True
+
+    def measure(self, node: Tuple[int, ...]) -> np.ndarray:
+        """
+        Измерить узел, если он еще не измерен
+        """
+        if node in self.values:
+            return self.values[node]
+        position = self.position(node)
+        self.scanner.goto(position)
+        result = self.analyzer.get_scattering_parameters(self.parameters)
+        try:
+            stored = SMatrix.from_dict(result.to_dict(copy=True)) if result.pooled else result
+        finally:
+            result.release()
+        self.results[node] = stored
+        self.values[node] = np.asarray(self.feature(stored))
+        if self.on_point is not None:
+            self.on_point(position, stored)
+        return self.values[node]
+
+    def _serpentine(self, shape: Sequence[int]) -> List[Tuple[int, ...]]:
+        """
+        Обход начальной сетки змейкой, чтобы не возвращаться в начало каждой строки
+        """
+        nodes = []
+        for index, node in enumerate(itertools.product(*(range(n) for n in shape[:-1]))):
+            row = range(shape[-1]) if index % 2 == 0 else range(shape[-1] - 1, -1, -1)
+            nodes += [node + (k, ) for k in row]
+        return nodes
+
+    def run(self) -> Dict[Tuple[int, ...], SMatrix]:
+        """
+        Выполнить адаптивный скан
+
+        :return: результаты по узлам решетки, координаты узла -- position(node)
+        """
+        self._started = time.monotonic()
+        shape = [self.initial] * self.dims
+        if hasattr(self.scanner, 'check_positions'):
+            # все узлы лежат внутри области, поэтому достаточно проверить ее углы
+            full = self.root_size * (self.initial - 1)
+            self.scanner.check_positions([self.position(node) for node in itertools.product((0, full), repeat=self.dims)])
+        for node in self._serpentine(shape):
+            if not self._budget_left():
+                break
+            self.measure(tuple(k * self.root_size for k in node))
+
+        for low in itertools.product(*(range(n - 1) for n in shape)):
+            cell = (tuple(k * self.root_size for k in low), self.root_size)
+            if all(c in self.values for c in self._corners(cell)):
+                self._push(cell)
+
+        while self._queue and self._budget_left():
+            _, _, _, cell = heapq.heappop(self._queue)
+            for node in self._nodes(cell):
+                if not self._budget_left():
+                    break
+                self.measure(node)
+            else:
+                inherited = self._center_error(cell)
+                for child in self._children(cell):
+                    self._push(child, inherited)
+        logger.info(f'Adaptive scan finished: {len(self.values)} points, {len(self._queue)} cells left to refine')
+        return self.results
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Координаты измеренных точек (n, dims) и значения feature (n, ...)
+        """
+        nodes = list(self.values)
+        coordinates = self.low + np.array(nodes, dtype=float).reshape(len(nodes), self.dims) * self.step
+        return coordinates, np.array([self.values[node] for node in nodes])
@@ -0,0 +1,147 @@
+"""
+Контрольные точки скана: позволяют продолжить прерванный скан без повторных измерений
+"""
+import hashlib
+import json
+import os
+from dataclasses import astuple
+from typing import Optional, Set
+
+import numpy as np
+
+from ..scanner import Position
+from .plan import ScanPlan, AXES
+
+import logging
+logger = logging.getLogger('scan.checkpoint')
+
+
+def plan_hash(plan: ScanPlan) -> str:
+    """
+    Хэш плана: координаты точек и измеряемые параметры
+
+    :param plan: план скана
+    :return: sha256 в hex
+    """
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(plan.to_array()).tobytes())
+    h.update(json.dumps(list(plan.parameters)).encode())
+    return h.hexdigest()
+
+
+class Checkpoint:
+    """
+    Журнал выполненных точек скана, хранится рядом с данными.
+
+    Файл дописывается по одной строке JSON на точку, поэтому запись не зависит от длины
+    скана, а при падении теряется не больше недописанной последней строки.
+    Первая строка -- заголовок с хэшем плана, по нему журнал не применится к другому плану.
+    """
+    VERSION = 1
+
+    def __init__(self, path: str, plan: ScanPlan, fsync: bool = True):
+        """
+
+        :param path: путь к файлу, обычно путь к файлу данных с суффиксом .checkpoint
+        :param plan: план скана
+        :param fsync: сбрасывать каждую запись на диск
+        """
+        self.path = path
+        self.plan_hash = plan_hash(plan)
+        self.n_points = len(plan)
+        self.fsync = fsync
+        self.completed: Set[int] = set()
+        self.last_position: Optional[Position] = None
+        self._file = None
+        if os.path.exists(path):
+            self._load()
+
+    @classmethod
+    def for_dataset(cls, dataset_path: str, plan: ScanPlan, **kwargs) -> 'Checkpoint':
+        """
+        Журнал рядом с файлом данных
+        """
+        return cls(f'{dataset_path}.checkpoint', plan, **kwargs)
+
+    def _load(self) -> None:
+        with open(self.path, 'r') as f:
+            lines = f.read().splitlines()
+        if not lines:
+            return
+        try:
+            header = json.loads(lines[0])
+        except json.JSONDecodeError:
+            if len(lines) > 1:
+                raise
+            # падение во время записи заголовка: журнал пуст
+            return
+        if header.get('plan') != self.plan_hash:
+            raise ValueError(f'Checkpoint {self.path} belongs to another scan plan')
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # недописанная строка при падении процесса
+                logger.warning(f'Skipping a truncated record in {self.path}')
+                continue
+            self.completed.add(record['i'])
+            self.last_position = Position(**dict(zip(AXES, record['p'])))
+        logger.info(f'Checkpoint {self.path}: {len(self.completed)} of {self.n_points} points are done')
+
+    def _open(self):
+        if self._file is None:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if size:
+                # недописанная при падении строка отрезается, иначе следующая запись склеится с ней
+                with open(self.path, 'rb+') as f:
+                    end = f.read().rfind(b'\n') + 1
+                    if end < size:
+                        f.truncate(end)
+                        size = end
+            self._file = open(self.path, 'a')
+            if size == 0:
+                self._write({'version': self.VERSION, 'plan': self.plan_hash, 'points': self.n_points})
+        return self._file
+
+    def _write(self, record: dict) -> None:
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def mark(self, index: int, position: Position) -> None:
+        """
+        Отметить точку как выполненную. Вызывать после того, как результат сохранен.
+
+        :param index: индекс точки в плане
+        :param position: позиция, в которой измерена точка
+        """
+        self._open()
+        # координаты плана могут быть numpy скалярами, которые json не сериализует
+        self._write({'i': int(index), 'p': [None if v is None else float(v) for v in astuple(position)]})
+        self.completed.add(index)
+        self.last_position = position
+
+    def is_done(self, index: int) -> bool:
+        return index in self.completed
+
+    def first_unfinished(self) -> Optional[int]:
+        """
+        Индекс первой невыполненной точки или None, если скан завершен
+        """
+        return next((i for i in range(self.n_points) if i not in self.completed), None)
+
+    @property
+    def finished(self) -> bool:
+        return len(self.completed) >= self.n_points
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
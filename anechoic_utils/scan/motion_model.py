@@ -0,0 +1,119 @@
+"""
+Модель времени движения сканера между точками
+"""
+import math
+from dataclasses import dataclass, astuple
+from typing import Sequence
+
+import numpy as np
+
+from ..scanner import Scanner, Velocity, Acceleration, Deceleration
+
+
+@dataclass
+class MotionModel:
+    """
+    Трапецеидальный профиль скорости по каждой оси. Оси двигаются одновременно,
+    поэтому время перемещения -- максимум по осям (метрика Чебышёва по времени).
+    Единицы те же, что у сканера: мм (градусы для w), мм/с, мм/с^2.
+    """
+    velocity: Velocity
+    acceleration: Acceleration
+    deceleration: Deceleration
+    overhead: float = 0.  # постоянные затраты на одно перемещение в секундах (команды, опрос, успокоение)
+
+    def __post_init__(self):
+        self._v = self._axes_array(self.velocity, 'velocity')
+        self._a = self._axes_array(self.acceleration, 'acceleration')
+        self._d = self._axes_array(self.deceleration, 'deceleration')
+        # путь разгона до полной скорости и торможения с нее, на более коротком пути
+        # скорость успевает вырасти только до sqrt(d * peak)
+        self._ramp = self._v ** 2 / (2 * self._a) + self._v ** 2 / (2 * self._d)
+        self._ramp_time = self._v / (2 * self._a) + self._v / (2 * self._d)
+        self._peak = 2 * self._a * self._d / (self._a + self._d)
+        self._peak_time = 1 / self._a + 1 / self._d
+        self._axes = list(zip(
+            self._v.tolist(), self._ramp.tolist(), self._ramp_time.tolist(),
+            self._peak.tolist(), self._peak_time.tolist()
+        ))
+
+    @staticmethod
+    def _axes_array(axes, name: str) -> np.ndarray:
+        values = astuple(axes)
+        if any(v is None or v <= 0 for v in values):
+            raise ValueError(f'All axes of {name} must be positive, got {axes}')
+        return np.array(values, dtype=float)
+
+    @classmethod
+    def from_scanner(cls, scanner: Scanner, overhead: float = 0.) -> 'MotionModel':
+        """
+        Модель по текущим настройкам сканера
+        """
+        return cls(scanner.velocity(), scanner.acceleration(), scanner.deceleration(), overhead)
+
+    @classmethod
+    def default(cls, overhead: float = 0.) -> 'MotionModel':
+        """
+        Модель для настроек TRIM по умолчанию (DEFAULT_SETTINGS)
+        """
+        from ..scanner.TRIM import DEFAULT_SETTINGS
+        return cls(
+            DEFAULT_SETTINGS['velocity'], DEFAULT_SETTINGS['acceleration'], DEFAULT_SETTINGS['deceleration'],
+            overhead
+        )
+
+    def axis_times(self, displacement: np.ndarray) -> np.ndarray:
+        """
+        Время движения каждой оси
+
+        :param displacement: перемещения формы (..., 4), nan -- ось не двигается
+        :return: времена той же формы
+        """
+        d = np.abs(np.asarray(displacement, dtype=float))
+        if np.isnan(d).any():
+            d = np.nan_to_num(d)
+        cruise = d / self._v + self._ramp_time
+        short = np.sqrt(d * self._peak) * self._peak_time
+        return np.where(d >= self._ramp, cruise, short)
+
+    def times(self, start: np.ndarray, stop: np.ndarray) -> np.ndarray:
+        """
+        Время перемещения между точками, векторизовано
+
+        :param start: начальные точки формы (..., 4)
+        :param stop: конечные точки формы (..., 4), nan -- ось не двигается
+        :return: времена формы (...)
+        """
+        displacement = np.asarray(stop, dtype=float) - np.asarray(start, dtype=float)
+        t = self.axis_times(displacement).max(axis=-1)
+        moved = np.any(np.abs(displacement) > 0, axis=-1)
+        return np.where(moved, t + self.overhead, 0.)
+
+    def time(self, start: Sequence[float], stop: Sequence[float]) -> float:
+        """
+        Время перемещения между двумя точками, быстрая скалярная версия для циклов
+        """
+        res = 0.
+        for p, q, (v, ramp, ramp_time, peak, peak_time) in zip(start, stop, self._axes):
+            d = abs(q - p)
+            if not d > 0:  # в том числе nan
+                continue
+            t = d / v + ramp_time if d >= ramp else math.sqrt(d * peak) * peak_time
+            if t > res:
+                res = t
+        return res + self.overhead if res > 0 else 0.
+
+    def path_time(self, points: np.ndarray, start: np.ndarray = None) -> float:
+        """
+        Полное время прохода точек по порядку
+
+        :param points: точки формы (n, 4)
+        :param start: начальная точка, по умолчанию первая точка
+        :return: время в секундах
+        """
+        points = np.asarray(points, dtype=float)
+        if start is not None:
+            points = np.vstack([np.asarray(start, dtype=float)[None], points])
+        if len(points) < 2:
+            return 0.
+        return float(self.times(points[:-1], points[1:]).sum())
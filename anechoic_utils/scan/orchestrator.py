@@ -0,0 +1,376 @@
+"""
+Одновременное управление несколькими безэховыми камерами из одного процесса
+"""
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from ..analyzator.base_analyzator import BaseAnalyzer, AnalyzerConnectionError
+from ..analyzator.averaging import HostAveraging
+from ..analyzator.s_matrix import SMatrix
+from ..scanner import Position, Scanner, ScannerConnectionError
+from .checkpoint import Checkpoint
+from .plan import ScanPlan, AXES
+from .simulate import EtaTracker
+from ..tracing import tracer
+
+import logging
+logger = logging.getLogger('scan.orchestrator')
+
+
+async def call(func: Callable, *args, **kwargs) -> Any:
+    """
+    Вызывает метод прибора. Методы асинхронных драйверов (AsyncTRIMScanner, AsyncSocketAnalyzer)
+    выполняются в event loop, блокирующие методы -- в пуле потоков.
+    """
+    if inspect.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+@dataclass
+class PointRecord:
+    """
+    Результаты одной точки от нескольких анализаторов, измеренные одновременно
+    """
+    results: Dict[str, SMatrix]
+    timings: Dict[str, float]  # время измерения каждым анализатором в секундах
+
+    def __getitem__(self, name: str) -> SMatrix:
+        return self.results[name]
+
+    def copy(self) -> 'PointRecord':
+        """
+        Копия с результатами вне пула буферов
+        """
+        return PointRecord(
+            {name: SMatrix.from_dict(r.to_dict(copy=True)) if r.pooled else r for name, r in self.results.items()},
+            dict(self.timings),
+        )
+
+    def release(self) -> None:
+        for result in self.results.values():
+            result.release()
+
+
+@dataclass
+class ChamberStats:
+    """
+    Статистика скана в одной камере
+    """
+    points_total: int = 0
+    points_done: int = 0
+    motion_time: float = 0.
+    measure_time: float = 0.
+    points_skipped: int = 0
+    reconnects: int = 0
+    instrument_time: Dict[str, float] = field(default_factory=dict)  # суммарное время каждого анализатора
+    started: float = None
+    finished: float = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """
+        Точек в секунду
+        """
+        return self.points_done / self.elapsed if self.elapsed else 0.
+
+
+@dataclass
+class Chamber:
+    """
+    Камера: сканер, анализатор и план скана.
+    on_point вызывается в event loop после каждой точки: on_point(chamber, index, position, result).
+    Если on_point не задан, копии результатов сохраняются в results.
+    Результаты из пула буферов возвращаются в пул после on_point.
+
+    Если задан checkpoint, каждая точка отмечается в нем после on_point, выполненные точки
+    пропускаются, а при потере связи камера переподключается (до reconnect_attempts раз подряд),
+    при необходимости заново выполняет home и повторяет прерванную точку. Перед продолжением
+    скана, в том числе в новом процессе, позиция сканера так же сверяется с последней точкой журнала.
+
+    Если задан eta (ScanSimulator.eta(plan)), оценка оставшегося времени уточняется после каждой точки.
+
+    Вместо одного анализатора можно передать словарь {имя: анализатор}. Тогда в каждой точке все
+    анализаторы измеряют одновременно (блокирующие драйверы -- в пуле потоков), время точки -- максимум
+    их времен, а в on_point и results передается PointRecord. analyzer_parameters задает S параметры
+    отдельных анализаторов, по умолчанию -- параметры плана.
+
+    Если задан averaging, в каждой точке развертки повторяются до достижения заданного отношения
+    сигнал/шум, а результаты -- AveragedSMatrix с числом разверток и отношением сигнал/шум.
+    """
+    name: str
+    scanner: Scanner
+    analyzer: Union[BaseAnalyzer, Dict[str, BaseAnalyzer]]
+    plan: ScanPlan = None
+    on_point: Optional[Callable[['Chamber', int, Position, Union[SMatrix, PointRecord]], Any]] = None
+    results: List[Union[SMatrix, PointRecord]] = field(default_factory=list)
+    stats: ChamberStats = field(default_factory=ChamberStats)
+    checkpoint: Checkpoint = None
+    reconnect_attempts: int = 3
+    reconnect_delay: float = 5.
+    home_tolerance: float = 1.  # допустимое отличие позиции после переподключения, мм
+    eta: EtaTracker = None
+    analyzer_parameters: Dict[str, Sequence[str]] = None
+    averaging: HostAveraging = None
+
+    @property
+    def analyzers(self) -> Dict[str, BaseAnalyzer]:
+        if isinstance(self.analyzer, dict):
+            return self.analyzer
+        return {'analyzer': self.analyzer}
+
+    async def connect(self) -> None:
+        await asyncio.gather(
+            call(self.scanner.connect), *(call(analyzer.connect) for analyzer in self.analyzers.values())
+        )
+
+    async def disconnect(self) -> None:
+        await asyncio.gather(
+            call(self.scanner.disconnect), *(call(analyzer.disconnect) for analyzer in self.analyzers.values())
+        )
+
+    async def _sweep(self, analyzer: BaseAnalyzer, parameters: Sequence[str]) -> SMatrix:
+        if self.averaging is None:
+            return await call(analyzer.get_scattering_parameters, parameters)
+        if inspect.iscoroutinefunction(analyzer.get_scattering_parameters):
+            return await self.averaging.measure_async(analyzer, parameters)
+        return await asyncio.to_thread(self.averaging.measure, analyzer, parameters)
+
+    async def _acquire(self, name: str, analyzer: BaseAnalyzer) -> Tuple[SMatrix, float]:
+        parameters = (self.analyzer_parameters or {}).get(name, self.plan.parameters)
+        t = time.monotonic()
+        with tracer.span('acquire', analyzer=name):
+            result = await self._sweep(analyzer, parameters)
+        return result, time.monotonic() - t
+
+    async def _acquire_all(self) -> PointRecord:
+        names = list(self.analyzer)
+        done = await asyncio.gather(*(self._acquire(name, self.analyzer[name]) for name in names),
+                                    return_exceptions=True)
+        errors = [res for res in done if isinstance(res, BaseException)]
+        if errors:
+            for res in done:
+                if not isinstance(res, BaseException):
+                    res[0].release()
+            raise errors[0]
+        record = PointRecord({}, {})
+        for name, (result, elapsed) in zip(names, done):
+            record.results[name], record.timings[name] = result, elapsed
+            self.stats.instrument_time[name] = self.stats.instrument_time.get(name, 0.) + elapsed
+        return record
+
+    async def measure_point(self, index: int, position: Position) -> None:
+        with tracer.span('point', index=index):
+            t0 = time.monotonic()
+            await call(self.scanner.goto, position)
+            t1 = time.monotonic()
+            if isinstance(self.analyzer, dict):
+                result = await self._acquire_all()
+            else:
+                result = await self._sweep(self.analyzer, self.plan.parameters)
+            t2 = time.monotonic()
+            self.stats.motion_time += t1 - t0
+            self.stats.measure_time += t2 - t1
+            if self.eta is not None:
+                self.eta.update(index, t1 - t0, t2 - t1)
+            with tracer.span('storage'):
+                try:
+                    if self.on_point is not None:
+                        if inspect.iscoroutine(res := self.on_point(self, index, position, result)):
+                            await res
+                    elif isinstance(result, PointRecord):
+                        self.results.append(result.copy())
+                    else:
+                        self.results.append(SMatrix.from_dict(result.to_dict(copy=True)) if result.pooled else result)
+                finally:
+                    result.release()
+                if self.checkpoint is not None:
+                    self.checkpoint.mark(index, position)
+        self.stats.points_done += 1
+
+    @staticmethod
+    def _is_near(a: Position, b: Optional[Position], tolerance: float) -> bool:
+        if b is None:
+            return False
+        for axis in AXES:
+            p, q = a.__getattribute__(axis), b.__getattribute__(axis)
+            if p is not None and q is not None and abs(p - q) > tolerance:
+                return False
+        return True
+
+    async def _verify_position(self, target: Position = None) -> None:
+        """
+        Если позиция сканера не совпадает ни с последней выполненной точкой журнала, ни с target,
+        сканер мог потерять привязку координат (например, после перезапуска контроллера), и выполняется home
+
+        :param target: цель прерванного движения
+        """
+        last = self.checkpoint.last_position if self.checkpoint is not None else None
+        if last is None:
+            return
+        try:
+            position = await call(self.scanner.position)
+        except ScannerConnectionError:
+            raise
+        except Exception as e:
+            logger.warning(f'{self.name}: scanner position is unavailable: {e!r}')
+            position = None
+        if position is None or not (self._is_near(position, last, self.home_tolerance)
+                                    or self._is_near(position, target, self.home_tolerance)):
+            logger.warning(f'{self.name}: scanner position {position} is unexpected, homing')
+            await call(self.scanner.home)
+
+    async def recover(self, target: Position = None) -> None:
+        """
+        Переподключиться после потери связи и проверить позицию сканера (_verify_position)
+
+        :param target: цель прерванного движения
+        """
+        self.stats.reconnects += 1
+        await self.disconnect()
+        await self.connect()
+        await self._verify_position(target)
+        logger.info(f'{self.name}: reconnected')
+
+    async def _measure_with_recovery(self, index: int, position: Position) -> None:
+        failures = 0
+        while True:
+            try:
+                return await self.measure_point(index, position)
+            except (ScannerConnectionError, AnalyzerConnectionError) as e:
+                failures += 1
+                if self.checkpoint is None or failures > self.reconnect_attempts:
+                    raise
+                logger.warning(f'{self.name}: connection lost at point {index} ({e!r}), '
+                               f'reconnecting ({failures}/{self.reconnect_attempts})')
+                await asyncio.sleep(self.reconnect_delay)
+                try:
+                    await self.recover(position)
+                except (ScannerConnectionError, AnalyzerConnectionError) as e:
+                    logger.warning(f'{self.name}: reconnection failed: {e!r}')
+
+    async def run(self) -> ChamberStats:
+        """
+        Выполнить план скана. С checkpoint выполненные ранее точки пропускаются
+        """
+        if self.plan is None:
+            raise ValueError(f'Chamber {self.name} has no scan plan')
+        if hasattr(self.scanner, 'check_positions'):
+            # точки за программными пределами обнаруживаются до начала скана, а не через несколько часов
+            await call(self.scanner.check_positions, self.plan.to_array())
+        self.stats = ChamberStats(points_total=len(self.plan), started=time.monotonic())
+        if self.checkpoint is not None:
+            self.stats.points_skipped = len(self.checkpoint.completed)
+            # продолжение прерванного скана, возможно в новом процессе: позиция сверяется с журналом
+            await self._verify_position()
+        logger.info(f'{self.name}: scan of {len(self.plan)} points started, '
+                    f'{self.stats.points_skipped} done before')
+        try:
+            with tracer.track(self.name):
+                for index, position in enumerate(self.plan):
+                    if self.checkpoint is not None and self.checkpoint.is_done(index):
+                        if self.eta is not None:
+                            self.eta.skip(index)
+                        continue
+                    await self._measure_with_recovery(index, position)
+        finally:
+            self.stats.finished = time.monotonic()
+            logger.info(f'{self.name}: {self.stats.points_done} points in {self.stats.elapsed:.1f} s')
+        return self.stats
+
+
+class Orchestrator:
+    """
+    Запускает сканы во всех камерах одновременно в одном event loop.
+    С асинхронными драйверами все сокеты обслуживаются одним потоком, и ресурсы растут
+    с объемом ввода-вывода, а не с числом камер. Блокирующие драйверы тоже поддерживаются,
+    их вызовы выполняются в пуле потоков.
+    Ошибка в одной камере не останавливает остальные.
+    """
+    def __init__(self, chambers: List[Chamber] = None):
+        self.chambers: Dict[str, Chamber] = {}
+        for chamber in chambers or []:
+            self.add(chamber)
+        self._started: float = None
+        self._finished: float = None
+
+    def add(self, chamber: Chamber) -> None:
+        if chamber.name in self.chambers:
+            raise ValueError(f'Chamber {chamber.name} already exists')
+        self.chambers[chamber.name] = chamber
+
+    async def connect(self) -> None:
+        await asyncio.gather(*(chamber.connect() for chamber in self.chambers.values()))
+
+    async def disconnect(self) -> None:
+        await asyncio.gather(
+            *(chamber.disconnect() for chamber in self.chambers.values()), return_exceptions=True
+        )
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Выполнить планы всех камер
+
+        :return: статистика каждой камеры или исключение, которым завершился ее скан
+        """
+        self._started, self._finished = time.monotonic(), None
+        try:
+            results = await asyncio.gather(
+                *(chamber.run() for chamber in self.chambers.values()), return_exceptions=True
+            )
+        finally:
+            self._finished = time.monotonic()
+        for name, res in zip(self.chambers, results):
+            if isinstance(res, BaseException):
+                logger.error(f'{name}: scan failed: {res!r}')
+        return dict(zip(self.chambers, results))
+
+    def run_sync(self) -> Dict[str, Any]:
+        """
+        Подключиться, выполнить планы всех камер и отключиться без собственного event loop
+        """
+        async def main():
+            await self.connect()
+            try:
+                return await self.run()
+            finally:
+                await self.disconnect()
+        return asyncio.run(main())
+
+    @property
+    def points_done(self) -> int:
+        return sum(chamber.stats.points_done for chamber in self.chambers.values())
+
+    @property
+    def throughput(self) -> float:
+        """
+        Суммарное число точек в секунду по всем камерам
+        """
+        if self._started is None:
+            return 0.
+        elapsed = (self._finished or time.monotonic()) - self._started
+        return self.points_done / elapsed if elapsed else 0.
+
+    def report(self) -> str:
+        """
+        Текстовый отчет о производительности всех камер
+        """
+        lines = [
+            f'{name}: {c.stats.points_done}/{c.stats.points_total} points, '
+            f'{c.stats.throughput:.2f} points/s, motion {c.stats.motion_time:.1f} s, '
+            f'measurement {c.stats.measure_time:.1f} s'
+            + ''.join(f', {instrument} {t:.1f} s' for instrument, t in c.stats.instrument_time.items())
+            + (f', ETA {c.eta.remaining:.0f} s' if c.eta is not None else '')
+            for name, c in self.chambers.items()
+        ]
+        lines.append(f'total: {self.points_done} points, {self.throughput:.2f} points/s')
+        return '\n'.join(lines)
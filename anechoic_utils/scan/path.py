@@ -0,0 +1,344 @@
+"""
+Оптимизация порядка обхода точек скана по времени движения
+"""
+import itertools
+import time
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from ..scanner import Position
+from .motion_model import MotionModel
+from .plan import ScanPlan, AXES, forward_fill
+
+import logging
+logger = logging.getLogger('scan.path')
+
+
+class _Grid:
+    """
+    Равномерная сетка в пространстве "времени крейсерского движения" (координата / скорость оси).
+    Для каждого кольца ячеек известна нижняя граница времени перемещения,
+    поэтому дальние кольца можно отсекать без потери ближайшего соседа.
+    """
+    def __init__(self, scaled: np.ndarray, points_per_cell: float = 2.):
+        n = len(scaled)
+        extent = np.ptp(scaled, axis=0)
+        self.active = np.flatnonzero(extent > 0)
+        self.cell = 1.
+        # оси, размах которых меньше ячейки, в сетке не участвуют: иначе кольца растут без пользы
+        while len(self.active):
+            volume = np.prod(extent[self.active])
+            self.cell = float((volume * points_per_cell / n) ** (1 / len(self.active))) or 1.
+            narrow = extent[self.active] < self.cell
+            if not narrow.any():
+                break
+            self.active = self.active[~narrow]
+        scaled = scaled[:, self.active]
+        self.origin = scaled.min(axis=0)
+        index = np.floor((scaled - self.origin) / self.cell).astype(np.int64)
+        # ячейка кодируется одним целым числом, смещения колец -- тоже. Смещения, выходящие
+        # за край сетки, попадают в другие ячейки и дают лишних кандидатов, но не теряют нужных
+        size = index.max(axis=0, initial=0) + 1
+        self.strides = np.cumprod(np.concatenate([[1], size[:-1]])).astype(np.int64)
+        self.keys = (index @ self.strides).tolist() if len(self.active) else [0] * n
+        self.cells: Dict[int, List[int]] = {}
+        for i, key in enumerate(self.keys):
+            self.cells.setdefault(key, []).append(i)
+        self._rings: Dict[int, List[int]] = {}
+        self._bounds: Dict[int, float] = {}
+
+    def ring(self, r: int) -> List[int]:
+        """
+        Смещения ключей ячеек, удаленных ровно на r по метрике Чебышёва
+        """
+        if r not in self._rings:
+            dims = len(self.active)
+            self._rings[r] = [
+                int(np.dot(offset, self.strides)) for offset in itertools.product(range(-r, r + 1), repeat=dims)
+                if max(map(abs, offset), default=0) == r
+            ]
+        return self._rings[r]
+
+    def bound(self, model: MotionModel, r: int) -> float:
+        """
+        Нижняя граница времени перемещения до точек кольца r: хотя бы по одной оси
+        смещение не меньше (r - 1) ячеек
+        """
+        if r not in self._bounds:
+            displacement = np.zeros(len(model._v))
+            displacement[self.active] = max(r - 1, 0) * self.cell * model._v[self.active]
+            self._bounds[r] = model.overhead + float(model.axis_times(displacement)[self.active].min())
+        return self._bounds[r]
+
+    def remove(self, i: int) -> None:
+        cell = self.cells[self.keys[i]]
+        cell.remove(i)
+        if not cell:
+            del self.cells[self.keys[i]]
+
+    def around(self, i: int, r: int) -> List[int]:
+        key, get = self.keys[i], self.cells.get
+        return list(itertools.chain.from_iterable(
+            cell for offset in self.ring(r) if (cell := get(key + offset)) is not None
+        ))
+
+
+def _fill_missing(points: np.ndarray, start: Union[Position, np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Координаты осей, не заданных в точке, -- как в предыдущей точке исходного порядка (или в start),
+    так же, как в ScanSimulator
+
+    :return: точки и начальная позиция (или None), оси без известной координаты -- nan
+    """
+    points = np.asarray(points, dtype=float)
+    if start is None:
+        return forward_fill(points), None
+    if isinstance(start, Position):
+        start = [np.nan if (value := start.__getattribute__(axis)) is None else value for axis in AXES]
+    filled = forward_fill(np.vstack([np.asarray(start, dtype=float)[None], points]))
+    return filled[1:], filled[0]
+
+
+def _nearest_neighbour_tour(
+        points: List[Tuple], scaled: np.ndarray, model: MotionModel, first: int, max_ring: int = 3
+) -> np.ndarray:
+    """
+    Жадный обход: из каждой точки идем в ближайшую по времени непосещенную
+    """
+    n = len(points)
+    grid = _Grid(scaled)
+    visited = np.zeros(n, dtype=bool)
+    array = np.array(points)
+    tour = np.empty(n, dtype=np.int64)
+    current = first
+    for step in range(n):
+        tour[step] = current
+        visited[current] = True
+        grid.remove(current)
+        if step == n - 1:
+            break
+        best, best_time = -1, float('inf')
+        r = 0
+        while grid.cells:
+            if r > 0 and grid.bound(model, r) >= best_time:
+                break
+            if r > max_ring and best < 0:
+                # вокруг пусто: ищем среди всех оставшихся точек
+                rest = np.flatnonzero(~visited)
+                times = model.times(array[current], array[rest])
+                best = int(rest[np.argmin(times)])
+                break
+            if candidates := grid.around(current, r):
+                times = model.times(array[current], array[candidates])
+                k = int(np.argmin(times))
+                if times[k] < best_time:
+                    best, best_time = candidates[k], float(times[k])
+            r += 1
+        current = best
+    return tour
+
+
+def _neighbour_lists(
+        points: List[Tuple], scaled: np.ndarray, model: MotionModel, k: int
+) -> Tuple[List[List[int]], List[List[float]]]:
+    """
+    Для каждой точки -- до k ближайших по времени точек из соседних ячеек сетки,
+    отсортированных по времени, и времена до них
+    """
+    grid = _Grid(scaled, points_per_cell=max(k / 3, 1.))
+    array = np.array(points)
+    neighbours, times = [], []
+    for i in range(len(points)):
+        candidates = grid.around(i, 0) + grid.around(i, 1)
+        candidates = np.array([j for j in candidates if j != i], dtype=np.int64)
+        t = model.times(array[i], array[candidates])
+        order = np.argsort(t)[:k]
+        neighbours.append(candidates[order].tolist())
+        times.append(t[order].tolist())
+    return neighbours, times
+
+
+def _two_opt(tour: np.ndarray, points: List[Tuple], neighbours: List[List[int]], neighbour_times: List[List[float]],
+             model: MotionModel, deadline: float) -> bool:
+    """
+    Один проход 2-opt по спискам соседей для открытого пути с закрепленным началом.
+    Для пары (a, c) переворачивается участок между ними так, чтобы появилось ребро a-c.
+    Соседи перебираются, пока ребро a-c короче удаляемого ребра a-a_next.
+    """
+    n = len(tour)
+    pos = np.empty(n, dtype=np.int64)
+    pos[tour] = np.arange(n)
+    dist = model.time
+    improved = False
+    for a in tour.tolist():
+        if time.monotonic() > deadline:
+            break
+        i = int(pos[a])
+        a_next = int(tour[i + 1]) if i + 1 < n else None
+        for c, t_ac in zip(neighbours[a], neighbour_times[a]):
+            if a_next is not None and t_ac >= dist(points[a], points[a_next]):
+                break
+            j = int(pos[c])
+            if j == 0 or abs(j - i) <= 1:
+                continue
+            if j > i:
+                if a_next is None:
+                    continue
+                c_next = int(tour[j + 1]) if j + 1 < n else None
+                old = dist(points[a], points[a_next]) + (dist(points[c], points[c_next]) if c_next is not None else 0.)
+                new = dist(points[a], points[c]) + (dist(points[a_next], points[c_next]) if c_next is not None else 0.)
+                lo, hi = i + 1, j
+            else:
+                c_next = int(tour[j + 1])
+                old = dist(points[c], points[c_next]) + (dist(points[a], points[a_next]) if a_next is not None else 0.)
+                new = dist(points[c], points[a]) + (dist(points[c_next], points[a_next]) if a_next is not None else 0.)
+                lo, hi = j + 1, i
+            if new < old - 1e-12:
+                tour[lo:hi + 1] = tour[lo:hi + 1][::-1].copy()
+                pos[tour[lo:hi + 1]] = np.arange(lo, hi + 1)
+                improved = True
+                i = int(pos[a])
+                a_next = int(tour[i + 1]) if i + 1 < n else None
+    return improved
+
+
+def _or_opt(tour: np.ndarray, points: List[Tuple], neighbours: List[List[int]], neighbour_times: List[List[float]],
+            model: MotionModel, deadline: float, max_segment: int = 3) -> Tuple[np.ndarray, bool]:
+    """
+    Один проход Or-opt: перенос участков из 1..max_segment точек (в том числе с разворотом)
+    к соседней точке, если это сокращает время.
+    Рассматриваются только соседи c концов участка, ребро до которых короче выигрыша от удаления участка.
+    """
+    dist = model.time
+
+    def d(u, v):
+        return 0. if u is None or v is None else dist(points[u], points[v])
+
+    n = len(tour)
+    pos = np.empty(n, dtype=np.int64)
+    pos[tour] = np.arange(n)
+    improved = False
+    i = 1
+    while i < n:
+        if time.monotonic() > deadline:
+            break
+        moved = False
+        for length in range(1, min(max_segment, n - i) + 1):
+            segment = tour[i:i + length].tolist()
+            first, last = segment[0], segment[-1]
+            prev = int(tour[i - 1])
+            nxt = int(tour[i + length]) if i + length < n else None
+            gain = d(prev, first) + d(last, nxt) - d(prev, nxt)
+            if gain <= 1e-12:
+                continue
+
+            def rest(k):
+                # k-я точка обхода без участка
+                if k < 0 or k >= n - length:
+                    return None
+                return int(tour[k]) if k < i else int(tour[k + length])
+
+            best = None
+            for end, other in ((first, last), (last, first)):
+                for c, t_c in zip(neighbours[end], neighbour_times[end]):
+                    if t_c >= gain:
+                        break
+                    if c in segment:
+                        continue
+                    k = int(pos[c])
+                    k = k if k < i else k - length
+                    # участок встает после c (c-end-...-other-v) или перед c (u-other-...-end-c)
+                    for left, s0, s1 in ((k, end, other), (k - 1, other, end)):
+                        if left < 0:
+                            continue
+                        u, v = rest(left), rest(left + 1)
+                        cost = d(u, s0) + d(s1, v) - d(u, v)
+                        if cost < gain - 1e-12 and (best is None or cost < best[0]):
+                            best = (cost, left, s0 != first)
+            if best is not None:
+                _, left, reverse = best
+                segment = segment[::-1] if reverse else segment
+                rest_tour = np.concatenate([tour[:i], tour[i + length:]])
+                tour = np.concatenate([rest_tour[:left + 1], segment, rest_tour[left + 1:]]).astype(np.int64)
+                pos[tour] = np.arange(n)
+                improved = moved = True
+                break
+        if not moved:
+            i += 1
+    return tour, improved
+
+
+def optimize_order(
+        points: np.ndarray,
+        model: MotionModel = None,
+        start: Union[Position, np.ndarray] = None,
+        neighbours: int = 8,
+        max_passes: int = 10,
+        time_limit: float = 60.,
+) -> np.ndarray:
+    """
+    Порядок обхода точек, минимизирующий полное время движения.
+    Начальный порядок строится жадным ближайшим соседом, затем улучшается 2-opt и Or-opt
+    по спискам ближайших соседей. Время перемещения -- максимум по осям времени
+    трапецеидального движения (MotionModel).
+
+    :param points: точки формы (n, 4) по осям x, y, z, w, nan -- ось остается там же, где в предыдущей точке
+    :param model: модель движения, по умолчанию MotionModel.default()
+    :param start: текущая позиция сканера, с которой начинается обход
+    :param neighbours: число ближайших соседей, которые рассматриваются при улучшении
+    :param max_passes: максимальное число проходов улучшения
+    :param time_limit: ограничение времени оптимизации в секундах
+    :return: индексы точек в порядке обхода
+    """
+    deadline = time.monotonic() + time_limit
+    model = model or MotionModel.default()
+    points, start = _fill_missing(points, start)
+    n = len(points)
+    if n <= 2:
+        return np.arange(n)
+
+    if start is not None:
+        # начало -- дополнительная точка с номером n, она закреплена в начале обхода
+        points = np.vstack([points, start[None]])
+        first = n
+    else:
+        first = None
+    # до первой заданной координаты положение оси неизвестно, считаем его равным этой координате
+    points = np.nan_to_num(forward_fill(points[::-1])[::-1])
+    if first is None:
+        first = int(np.argmin((points / model._v).sum(axis=1)))
+
+    scaled = points / model._v
+    as_tuples = [tuple(p) for p in points.tolist()]
+    tour = _nearest_neighbour_tour(as_tuples, scaled, model, first)
+    logger.debug(f'Nearest neighbour tour: {model.path_time(points[tour]):.1f} s')
+
+    neighbour_lists, neighbour_times = _neighbour_lists(as_tuples, scaled, model, neighbours)
+    for _ in range(max_passes):
+        improved = _two_opt(tour, as_tuples, neighbour_lists, neighbour_times, model, deadline)
+        tour, moved = _or_opt(tour, as_tuples, neighbour_lists, neighbour_times, model, deadline)
+        if not (improved or moved) or time.monotonic() > deadline:
+            break
+    logger.debug(f'Optimized tour: {model.path_time(points[tour]):.1f} s')
+
+    if start is not None:
+        tour = tour[tour != n]
+    return tour
+
+
+def optimize_plan(plan: ScanPlan, model: MotionModel = None, start: Position = None, **kwargs) -> ScanPlan:
+    """
+    План с теми же точками в порядке, минимизирующем время движения.
+    Оси, не заданные в точке, заполняются по исходному порядку, иначе после перестановки
+    сканер измерял бы точку в другом месте
+
+    :param plan: исходный план
+    :param model: модель движения
+    :param start: текущая позиция сканера
+    :param kwargs: параметры optimize_order
+    :return: новый план
+    """
+    points, _ = _fill_missing(plan.to_array(), start)
+    order = optimize_order(points, model, start, **kwargs)
+    return ScanPlan.from_array(points[order], plan.parameters)
@@ -0,0 +1,137 @@
+"""
+Быстрый срез диаграммы направленности: непрерывное вращение оси w и развертка по времени на одной частоте
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from ..analyzator.s_matrix import SMatrix
+from ..scanner import Position, Velocity
+
+import logging
+logger = logging.getLogger('scan.pattern_cut')
+
+
+@dataclass
+class PatternCut:
+    """
+    Результат среза: значения S параметров, время и угол каждого отсчета
+    """
+    angles: np.ndarray
+    times: np.ndarray
+    data: SMatrix
+    positions: np.ndarray  # опросы энкодера: (время, угол)
+
+    def __getitem__(self, key) -> np.ndarray:
+        return self.data[key]
+
+
+class _PositionSampler(threading.Thread):
+    """
+    Опрашивает позицию сканера во время вращения и запоминает время каждого опроса
+    """
+    def __init__(self, scanner, poll_interval: float):
+        super().__init__(daemon=True)
+        self.scanner = scanner
+        self.poll_interval = poll_interval
+        self.samples: List[Tuple[float, float]] = []
+        self._stopped = threading.Event()
+        self.error: BaseException = None
+
+    def run(self) -> None:
+        try:
+            while not self._stopped.is_set():
+                before = time.monotonic()
+                w = self.scanner.position().w
+                # время опроса -- середина обмена с контроллером
+                self.samples.append(((before + time.monotonic()) / 2, w))
+                self._stopped.wait(self.poll_interval)
+        except BaseException as e:
+            self.error = e
+
+    def last_angle(self) -> float:
+        return self.samples[-1][1] if self.samples else None
+
+    def stop(self) -> np.ndarray:
+        self._stopped.set()
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return np.array(self.samples, dtype=float).reshape(-1, 2)
+
+
+def continuous_cut(
+        scanner,
+        analyzer,
+        start: float,
+        stop: float,
+        parameters: Sequence[str] = ('S21', ),
+        velocity: float = None,
+        trigger_delay: float = 0.,
+        poll_interval: float = 0.02,
+        timeout: float = 60.,
+) -> PatternCut:
+    """
+    Срез по оси w за одну развертку анализатора.
+
+    Анализатор должен быть заранее настроен на развертку по времени на одной частоте, например
+    analyzer.set_settings(sweep_type='CW', cw_freq=10e9, freq_num=721, sweep_time=12).
+    Ось w разгоняется до start, вращается с постоянной скоростью в режиме JOG, во время вращения
+    запускается одна развертка. Углы отсчетов восстанавливаются по времени отсчета и опросам APS.
+
+    :param scanner: сканер с методами jogging и position (TRIMScanner)
+    :param analyzer: анализатор с методами sweep_time, single_sweeps и trigger_sweep (SocketAnalyzer).
+        После среза прежний режим разверток анализатора восстанавливается
+    :param start: начальный угол в градусах
+    :param stop: конечный угол в градусах
+    :param parameters: S параметры
+    :param velocity: скорость вращения в градусах в секунду, по умолчанию такая,
+        чтобы развертка заняла ровно срез от start до stop
+    :param trigger_delay: задержка между командой запуска и первым отсчетом анализатора в секундах
+    :param poll_interval: период опроса позиции в секундах
+    :param timeout: максимальное время ожидания подхода к start в секундах
+    :return: срез
+    """
+    span = stop - start
+    if span == 0:
+        raise ValueError('Empty cut: start == stop')
+    direction = 1. if span > 0 else -1.
+    sweep_time = analyzer.sweep_time()
+    if velocity is None:
+        velocity = abs(span) / sweep_time
+    acceleration = scanner.acceleration().w
+    # разгон до постоянной скорости до начала среза и торможение после конца
+    run_up = velocity ** 2 / (2 * acceleration) * 1.5 if acceleration else 0.
+    stop_at = start + direction * (velocity * sweep_time + run_up)
+    if hasattr(scanner, 'check_positions'):
+        scanner.check_positions([Position(w=start - direction * run_up), Position(w=stop_at)])
+
+    with analyzer.single_sweeps(parameters):
+        scanner.goto(Position(w=start - direction * run_up))
+        sampler = _PositionSampler(scanner, poll_interval)
+        with scanner.jogging(Velocity(w=direction * velocity)):
+            sampler.start()
+            deadline = time.monotonic() + timeout
+            while (angle := sampler.last_angle()) is None or (angle - start) * direction < 0:
+                if sampler.error is not None or time.monotonic() > deadline:
+                    sampler.stop()
+                    raise TimeoutError(f'Axis w has not reached {start} in {timeout} s')
+                time.sleep(poll_interval / 2)
+            started = analyzer.trigger_sweep()
+            # опросы должны перекрывать всю развертку, иначе последние углы не восстановить
+            finished = started + trigger_delay + sweep_time
+            while sampler.samples[-1][0] < finished and sampler.error is None:
+                time.sleep(poll_interval / 2)
+            samples = sampler.stop()
+        result = analyzer.get_scattering_parameters(list(parameters))
+
+    n = result.n_freq
+    times = started + trigger_delay + np.linspace(0., sweep_time, n)
+    if samples[-1, 0] < times[-1]:
+        logger.warning('Position samples end before the sweep, last angles are clamped')
+    angles = np.interp(times, samples[:, 0], samples[:, 1])
+    logger.info(f'Cut from {angles[0]:.1f} to {angles[-1]:.1f} deg: {n} samples in {sweep_time:.1f} s')
+    return PatternCut(angles, times - started, result, samples)
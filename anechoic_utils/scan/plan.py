@@ -0,0 +1,89 @@
+"""
+План скана: точки, в которых нужно измерить S параметры
+"""
+import itertools
+from dataclasses import dataclass, field, fields
+from typing import Iterator, List, Sequence
+
+import numpy as np
+
+from ..scanner import BaseAxes, Position
+
+AXES = tuple(f.name for f in fields(BaseAxes))
+
+
+def forward_fill(points: np.ndarray) -> np.ndarray:
+    """
+    Координата оси, не заданная в точке, берется из предыдущей точки: сканер двигает только заданные оси.
+    До первой заданной координаты ось остается nan
+
+    :param points: массив (n_points, 4) по осям x, y, z, w
+    :return: новый массив той же формы
+    """
+    points = np.asarray(points, dtype=float)
+    rows = np.where(np.isnan(points), 0, np.arange(len(points))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return points[rows, np.arange(points.shape[1])]
+
+
+@dataclass
+class ScanPlan:
+    """
+    Упорядоченный список точек скана и измеряемые в каждой точке S параметры
+    """
+    points: List[Position]
+    parameters: List[str] = field(default_factory=lambda: ['S21'])
+
+    @classmethod
+    def grid(cls, parameters: Sequence[str] = ('S21', ), **axes: Sequence[float]) -> 'ScanPlan':
+        """
+        Растровый план: декартово произведение координат по осям.
+        Последняя переданная ось меняется быстрее всех.
+
+        :param parameters: измеряемые S параметры
+        :param axes: координаты по осям, например x=range(0, 100, 10), y=[0, 50]
+        :return: план
+        """
+        unknown = set(axes) - set(AXES)
+        if unknown:
+            raise ValueError(f'Unknown axes: {", ".join(unknown)}')
+        names = list(axes)
+        points = [Position(**dict(zip(names, values))) for values in itertools.product(*axes.values())]
+        return cls(points, list(parameters))
+
+    def to_array(self) -> np.ndarray:
+        """
+        Точки плана в виде массива (n_points, 4) по осям x, y, z, w. Неиспользуемые оси -- nan
+
+        :return: массив координат
+        """
+        res = np.full((len(self.points), len(AXES)), np.nan)
+        for i, point in enumerate(self.points):
+            for j, axis in enumerate(AXES):
+                if (value := point.__getattribute__(axis)) is not None:
+                    res[i, j] = value
+        return res
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, parameters: Sequence[str] = ('S21', )) -> 'ScanPlan':
+        """
+        План из массива (n_points, 4), nan означает, что ось не двигается
+
+        :param array: массив координат
+        :param parameters: измеряемые S параметры
+        :return: план
+        """
+        points = [
+            Position(**{axis: float(v) for axis, v in zip(AXES, row) if not np.isnan(v)})
+            for row in np.asarray(array, dtype=float)
+        ]
+        return cls(points, list(parameters))
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __iter__(self) -> Iterator[Position]:
+        return iter(self.points)
+
+    def __getitem__(self, item):
+        return self.points[item]
@@ -0,0 +1,251 @@
+"""
+Пробный прогон скана без приборов: предсказание времени по плану, настройкам сканера и анализатора,
+сравнение вариантов плана и оценка оставшегося времени во время реального скана
+"""
+import re
+from dataclasses import dataclass, astuple
+from typing import Dict, Sequence, Tuple, Union
+
+import numpy as np
+
+from ..scanner import Position
+from ..scanner.TRIM.settle import SettleDetector
+from .motion_model import MotionModel
+from .plan import ScanPlan, AXES, forward_fill
+
+STOP_AND_GO = 'stop'
+FLY = 'fly'
+
+
+@dataclass
+class AcquisitionModel:
+    """
+    Время измерения в одной точке. Параметры те же, что у SocketAnalyzer.set_settings,
+    задержки обмена -- как у SocketAnalyzer (пауза после каждой команды)
+    """
+    freq_num: int = 201
+    bandwidth: float = 3000.
+    aver_fact: int = 1
+    sweep_time: float = None  # явная длительность развертки, иначе freq_num / bandwidth
+    sweep_overhead: float = 0.005  # обратный ход и переключение источника на одну развертку
+    command_latency: float = 0.1  # время одной команды без передачи данных
+    link_rate: float = 1e7  # скорость передачи данных в байтах в секунду
+    bytes_per_value: int = 14  # одно число в ASCII ответе вместе с запятой
+
+    @classmethod
+    def from_settings(cls, **settings) -> 'AcquisitionModel':
+        """
+        Модель по настройкам анализатора, лишние настройки (частоты, сглаживание, мощность) игнорируются
+        """
+        names = ('freq_num', 'bandwidth', 'aver_fact', 'sweep_time')
+        return cls(**{name: settings[name] for name in names if settings.get(name) is not None})
+
+    def one_sweep(self) -> float:
+        if self.sweep_time is not None:
+            return self.sweep_time + self.sweep_overhead
+        return self.freq_num / self.bandwidth + self.sweep_overhead
+
+    @staticmethod
+    def sources(parameters: Sequence[str]) -> int:
+        """
+        Число разверток на одно измерение: Sij для одного порта-источника j измеряются одной разверткой
+        """
+        ports = set()
+        for parameter in parameters:
+            match = re.fullmatch(r'S(\d)(\d)', parameter.upper())
+            ports.add(match.group(2) if match else parameter)
+        return max(1, len(ports))
+
+    def sweep(self, parameters: Sequence[str]) -> float:
+        return self.one_sweep() * self.sources(parameters) * self.aver_fact
+
+    def transfer(self, parameters: Sequence[str]) -> float:
+        """
+        Команды и передача данных get_scattering_parameters: частоты, затем по 5 команд на параметр
+        """
+        commands = 1 + 5 * len(parameters)
+        values = self.freq_num * (1 + 2 * len(parameters))
+        return commands * self.command_latency + values * self.bytes_per_value / self.link_rate
+
+
+@dataclass
+class ScanEstimate:
+    """
+    Предсказанное время скана по составляющим, секунды
+    """
+    points: int
+    motion: float
+    settle: float
+    sweep: float
+    transfer: float
+    mode: str = STOP_AND_GO
+
+    @property
+    def total(self) -> float:
+        return self.motion + self.settle + self.sweep + self.transfer
+
+    @property
+    def throughput(self) -> float:
+        """
+        Точек в час
+        """
+        return self.points / self.total * 3600 if self.total else 0.
+
+    def __str__(self) -> str:
+        parts = ', '.join(
+            f'{name} {value:.1f} s ({value / self.total:.0%})' if self.total else f'{name} 0 s'
+            for name, value in (('motion', self.motion), ('settle', self.settle),
+                                ('sweep', self.sweep), ('transfer', self.transfer))
+        )
+        return f'{self.points} points ({self.mode}): {self.total:.1f} s, {self.throughput:.0f} points/h; {parts}'
+
+
+class EtaTracker:
+    """
+    Оставшееся время реального скана. Предсказанные времена движения и измерения каждой точки
+    масштабируются по отношению наблюдаемых времен к предсказанным (экспоненциальное сглаживание),
+    поэтому оценка подстраивается под реальные приборы уже после нескольких точек.
+    """
+    def __init__(self, motion: np.ndarray, measure: np.ndarray, smoothing: float = 0.2):
+        """
+
+        :param motion: предсказанное время движения с успокоением для каждой точки
+        :param measure: предсказанное время измерения для каждой точки
+        :param smoothing: вес новой точки при пересчете поправок
+        """
+        self.motion = np.asarray(motion, dtype=float)
+        self.measure = np.asarray(measure, dtype=float)
+        self.smoothing = smoothing
+        self.motion_scale = 1.
+        self.measure_scale = 1.
+        self._done = np.zeros(len(self.motion), dtype=bool)
+        self._motion_left = float(self.motion.sum())
+        self._measure_left = float(self.measure.sum())
+
+    def _calibrate(self, scale: float, observed: float, predicted: float) -> float:
+        if predicted <= 0:
+            return scale
+        return (1 - self.smoothing) * scale + self.smoothing * observed / float(predicted)
+
+    def skip(self, index: int) -> None:
+        """
+        Точка не требует измерения (например, выполнена до перезапуска)
+        """
+        if not self._done[index]:
+            self._done[index] = True
+            self._motion_left -= float(self.motion[index])
+            self._measure_left -= float(self.measure[index])
+
+    def update(self, index: int, motion_time: float, measure_time: float) -> None:
+        """
+        Точка выполнена за наблюдаемые времена движения и измерения
+        """
+        self.motion_scale = self._calibrate(self.motion_scale, motion_time, self.motion[index])
+        self.measure_scale = self._calibrate(self.measure_scale, measure_time, self.measure[index])
+        self.skip(index)
+
+    @property
+    def remaining(self) -> float:
+        """
+        Оставшееся время в секундах
+        """
+        return max(0., self._motion_left * self.motion_scale + self._measure_left * self.measure_scale)
+
+    @property
+    def points_left(self) -> int:
+        return int((~self._done).sum())
+
+
+class ScanSimulator:
+    """
+    Предсказание времени скана без приборов
+    """
+    def __init__(self, motion: MotionModel = None, acquisition: AcquisitionModel = None, settle: float = None):
+        """
+
+        :param motion: модель движения, по умолчанию для DEFAULT_SETTINGS
+        :param acquisition: модель измерения, по умолчанию AcquisitionModel()
+        :param settle: время успокоения после каждого движения, по умолчанию окно SettleDetector и один опрос
+        """
+        self.motion = motion or MotionModel.default()
+        self.acquisition = acquisition or AcquisitionModel()
+        if settle is None:
+            detector = SettleDetector()
+            settle = detector.window + detector.poll_interval
+        self.settle = settle
+        self._velocity = np.array(astuple(self.motion.velocity), dtype=float)
+
+    @staticmethod
+    def _points(plan: ScanPlan, start: Position = None) -> np.ndarray:
+        points = plan.to_array()
+        if start is None:
+            first = points[:1]
+        else:
+            first = np.array([[start.__getattribute__(axis) for axis in AXES]], dtype=float)
+        # оси без координаты в точке остаются на месте, как у сканера
+        return forward_fill(np.vstack([first, points]))
+
+    def point_times(self, plan: ScanPlan, start: Position = None, mode: str = STOP_AND_GO) -> np.ndarray:
+        """
+        Предсказанные времена каждой точки
+
+        :param plan: план скана
+        :param start: начальная позиция сканера, по умолчанию первая точка плана
+        :param mode: STOP_AND_GO -- остановка и измерение в каждой точке,
+            FLY -- непрерывное движение (TRIMScanner.follow) с измерением на ходу
+        :return: массив (n_points, 4): движение, успокоение, развертка, передача
+        """
+        if mode not in (STOP_AND_GO, FLY):
+            raise ValueError(f'Unknown mode {mode}, expected {STOP_AND_GO} or {FLY}')
+        points = self._points(plan, start)
+        displacement = np.nan_to_num(points[1:] - points[:-1])
+        moved = np.any(displacement != 0, axis=1)
+        res = np.zeros((len(plan), 4))
+        res[:, 2] = self.acquisition.sweep(plan.parameters)
+        res[:, 3] = self.acquisition.transfer(plan.parameters)
+        stop_and_go = self.motion.times(points[:-1], points[1:])
+        if mode == STOP_AND_GO:
+            res[:, 0] = stop_and_go
+            res[:, 1] = np.where(moved, self.settle, 0.)
+            return res
+
+        # на ходу: прямые участки проходятся с постоянной скоростью, остановки -- только на поворотах
+        cruise = (np.abs(displacement) / self._velocity).max(axis=1)
+        norm = np.linalg.norm(displacement, axis=1)
+        direction = np.divide(displacement, norm[:, None], out=np.zeros_like(displacement), where=norm[:, None] > 0)
+        turn = np.ones(len(plan), dtype=bool)
+        turn[1:] = (direction[1:] * direction[:-1]).sum(axis=1) < 0.99
+        motion = np.where(turn, stop_and_go, cruise)
+        res[:, 1] = np.where(turn & moved, self.settle, 0.)
+        # измерение идет во время движения, в сумму попадает только не перекрытая часть движения
+        res[:, 0] = np.where(turn, motion, np.maximum(0., motion - res[:, 2] - res[:, 3]))
+        return res
+
+    def estimate(self, plan: ScanPlan, start: Position = None, mode: str = STOP_AND_GO) -> ScanEstimate:
+        """
+        Предсказанное время скана по составляющим
+        """
+        motion, settle, sweep, transfer = self.point_times(plan, start, mode).sum(axis=0).tolist()
+        return ScanEstimate(len(plan), motion, settle, sweep, transfer, mode)
+
+    def compare(self, variants: Dict[str, Union[ScanPlan, Tuple[ScanPlan, str]]],
+                start: Position = None) -> Dict[str, ScanEstimate]:
+        """
+        Сравнение вариантов плана, например шага растра или режима
+
+        :param variants: {название: план или (план, режим)}
+        :param start: начальная позиция сканера
+        :return: {название: оценка} в порядке возрастания времени
+        """
+        res = {}
+        for name, variant in variants.items():
+            plan, mode = variant if isinstance(variant, tuple) else (variant, STOP_AND_GO)
+            res[name] = self.estimate(plan, start, mode)
+        return dict(sorted(res.items(), key=lambda item: item[1].total))
+
+    def eta(self, plan: ScanPlan, start: Position = None, smoothing: float = 0.2) -> EtaTracker:
+        """
+        Оценка оставшегося времени для реального скана плана (Chamber(..., eta=...))
+        """
+        times = self.point_times(plan, start)
+        return EtaTracker(times[:, 0] + times[:, 1], times[:, 2] + times[:, 3], smoothing)
@@ -4,12 +4,18 @@
 import time
 
 from ..scanner import Scanner, BaseAxes, Position, Velocity, Acceleration, Deceleration
-from ..scanner import ScannerConnectionError, ScannerInternalError, ScannerMotionError
+from ..scanner import ScannerConnectionError, ScannerInternalError, ScannerMotionError, ScannerLimitError
 from ..scanner import ScannerSignals
-from ...utils import EmptySignal, FIFOLock
+from ...utils import InstanceSignal, FIFOLock
+from .settle import SettleDetector, SettleStats
+from ...metrics import metrics, COUNT_BUCKETS
+from ...tracing import tracer
+from ...session import SessionRecorder
 import socket
-from typing import Union, List, Iterable
+import numpy as np
+from typing import Union, List, Iterable, Tuple, Dict, Optional, Sequence, Callable
 from dataclasses import fields, astuple
+from contextlib import contextmanager
 
 import logging
 logger = logging.getLogger('scanner.TRIM')
@@ -19,6 +25,9 @@ STEPS_PER_MM_Y = 5120
 STEPS_PER_MM_Z = 5120
 STEPS_PER_DEG_W = 1
 
+AXES = tuple(field.name for field in fields(BaseAxes))
+HOME_AXES = ('x', 'y', 'z')  # при парковке w не двигается
+
 AXES_SCALE = BaseAxes(
     x=STEPS_PER_MM_X,
     y=STEPS_PER_MM_Y,
@@ -53,6 +62,66 @@ def cmds_from_axes(axes: BaseAxes, basecmd: str, val: bool = True, scale: bool =
     return cmds
 
 
+def axes_of(axes: BaseAxes) -> Tuple[str, ...]:
+    """
+    Оси, значения которых не None
+    """
+    return tuple(axis for axis in AXES if axes.__getattribute__(axis) is not None)
+
+
+def restrict(axes: BaseAxes, names: Iterable[str]) -> BaseAxes:
+    """
+    Копия axes, в которой оставлены только оси names, остальные равны None
+    """
+    return type(axes)(**{axis: axes.__getattribute__(axis) for axis in names})
+
+
+def quantize(axes: BaseAxes) -> BaseAxes:
+    """
+    Значения, которые получит контроллер после перевода в целые шаги, как в cmds_from_axes
+    """
+    return type(axes)(**{
+        axis: None if (v := axes.__getattribute__(axis)) is None else int(v * scale) / scale
+        for axis, scale in zip(AXES, astuple(AXES_SCALE))
+    })
+
+
+def restrict_settings(settings: Dict[str, BaseAxes], names: Iterable[str]) -> Dict[str, BaseAxes]:
+    """
+    Настройки, которые применяются только к осям names
+    """
+    return {key: restrict(value, names) for key, value in settings.items()}
+
+
+def positions_array(positions) -> np.ndarray:
+    """
+    Переводит Position или последовательность Position в массив (n, 4), None -- nan.
+    Массивы (например, ScanPlan.to_array()) возвращаются как есть
+    """
+    if isinstance(positions, BaseAxes):
+        positions = [positions]
+    if len(positions) and isinstance(positions[0], BaseAxes):
+        positions = [[np.nan if v is None else v for v in astuple(p)] for p in positions]
+    return np.asarray(positions, dtype=float).reshape(-1, len(AXES))
+
+
+def out_of_limits(positions, low: BaseAxes, high: BaseAxes) -> np.ndarray:
+    """
+    Номера позиций, которые выходят за программные пределы. Сравнение идет в шагах, как в контроллере
+
+    :param positions: Position, список Position или массив (n, 4) в мм, nan -- ось не двигается
+    :param low: нижние пределы в шагах (ALL)
+    :param high: верхние пределы в шагах (AHL)
+    :return: номера позиций
+    """
+    steps = np.trunc(positions_array(positions) * np.array(astuple(AXES_SCALE), dtype=float))
+    low = np.array([-np.inf if v is None else v for v in astuple(low)])
+    high = np.array([np.inf if v is None else v for v in astuple(high)])
+    # сравнения с nan ложны, поэтому неподвижные оси не считаются выходом за пределы
+    outside = (steps < low) | (steps > high)
+    return np.flatnonzero(outside.any(axis=1))
+
+
 EM = [
     'Motion is still active',
     'Normal end-of-motion',
@@ -189,26 +258,82 @@ def settings_check(
         return BaseAxes(x=x, y=y, z=z, w=w)
 
 
+def parse_response(command: str, response: bytes) -> str:
+    """
+    Проверяет ответ сканера на команду и возвращает значение из него.
+    Ответ сканера -- это эхо команды, затем значение и '>' в конце, '?>' означает ошибку.
+
+    :param command: команда вместе с ';'
+    :param response: полный ответ сканера
+    :return: значение без эха и '>'
+    """
+    if response.endswith(b'?>'):
+        raise ScannerInternalError(
+            f'Scanner response:\n{response}'
+        )
+
+    if not response.startswith(command.encode('ascii')):
+        raise ScannerInternalError(
+            f'Scanner response:\n{response}\n\nEcho in start was expected:\n{command}'
+        )
+
+    return response.decode().removeprefix(command).removesuffix('>')
+
+
+SETTINGS_CMDS = {
+    'position': ('PS', True),
+    'velocity': ('SP', True),
+    'acceleration': ('AC', True),
+    'deceleration': ('DC', True),
+    'motion_mode': ('MM', False),
+    'special_motion_mode': ('SM', False),
+    'motor_on': ('MO', False),
+}
+
+
+def settings_cmds(**settings) -> Tuple[List[str], Dict[str, BaseAxes]]:
+    """
+    Переводит настройки в формате TRIMScanner.set_settings в команды сканера
+
+    :param settings: настройки, например velocity=Velocity(x=100) или velocity_x=100
+    :return: команды и настройки, приведенные к BaseAxes
+    """
+    cmds, parsed = [], {}
+    for name, (basecmd, scale) in SETTINGS_CMDS.items():
+        separated = (settings.pop(f'{name}_{axis}', None) for axis in 'xyzw')
+        if (axes := settings_check(*separated, settings.pop(name, None))) is not None:
+            parsed[name] = axes
+            cmds += cmds_from_axes(axes, basecmd=basecmd, scale=scale)
+    if settings:
+        raise TypeError(f'Unknown settings: {", ".join(settings)}')
+    return cmds, parsed
+
+
 class TRIMScannerSignals(ScannerSignals):
-    position = EmptySignal()
-    velocity = EmptySignal()
-    acceleration = EmptySignal()
-    deceleration = EmptySignal()
-    is_connected = EmptySignal()
-    is_moving = EmptySignal()
+    position = InstanceSignal()
+    velocity = InstanceSignal()
+    acceleration = InstanceSignal()
+    deceleration = InstanceSignal()
+    is_connected = InstanceSignal()
+    is_moving = InstanceSignal()
 
 
 class TRIMScanner(Scanner):
     """
     Класс сканера
     """
+    # если задан, каждый обмен с контроллером пишется в запись сессии
+    recorder: SessionRecorder = None
+
     def __init__(
             self,
             ip: str,
             port: Union[str, int],
             bufsize: int = 1024,
             maxbufs: int = 1024,
-            signals: ScannerSignals = None
+            signals: ScannerSignals = None,
+            settle: SettleDetector = None,
+            pipeline: bool = False,
     ):
         """
 
@@ -216,22 +341,29 @@ class TRIMScanner(Scanner):
         :param port: порт сканера
         :param bufsize: размер чанка сообщения в байтах
         :param maxbufs: максимальное число чанков
+        :param settle: условия успокоения сканера после движения
+        :param pipeline: отправлять пакет команд одним сообщением, не дожидаясь ответа на каждую
         """
         self.ip = ip
         self.port = port
         self.conn = socket.socket()
         self.bufsize = bufsize
         self.maxbufs = maxbufs
-        self._tcp_lock = FIFOLock()  # FIFO лок для tcp сокета. Реализует тредсейф
+        self.pipeline = pipeline
+        self._tcp_lock = FIFOLock('scanner.tcp')  # FIFO лок для tcp сокета. Реализует тредсейф
         #  внутренние переменные для тред сейф выполнения goto и home
-        self._motion_lock = FIFOLock()
-        self._inner_motion_lock = FIFOLock()
-        self._stop_flag = False
-        self._stop_released = True
+        #  у каждой оси свой лок, движения с непересекающимися наборами осей выполняются одновременно
+        self._axis_locks = {axis: FIFOLock(f'scanner.axis.{axis}') for axis in AXES}
+        self._inner_motion_lock = FIFOLock('scanner.motion')
+        # номер последней остановки, движения из очереди до остановки завершаются с ошибкой
+        self._stop_generation = 0
 
+        self._moving_count = 0
         self._is_moving = False
         self._is_connected = False
         self._velocity = Velocity()  # необходимо хранить скорость, потому что сканер не возвращает свою скорость
+        self._soft_limits: Tuple[BaseAxes, BaseAxes] = None  # (ALL, AHL) в шагах, читаются один раз после подключения
+        self.settle = settle if settle is not None else SettleDetector()
 
         if signals is not None:
             self._signals = signals
@@ -249,6 +381,8 @@ class TRIMScanner(Scanner):
             self.conn.close()
             self.conn = socket.socket()
             self.conn.connect((self.ip, self.port))
+            # после переподключения контроллер мог быть перезапущен с другими пределами
+            self._soft_limits = None
             self._set_is_connected(True)
             logger.info("Scanner is connected")
         except socket.error as e:
@@ -306,49 +440,37 @@ class TRIMScanner(Scanner):
         """
         Применить настройки
         """
-        cmds = []
-        if (position_par := settings_check(
-                position_x, position_y, position_z, position_w, position
-        )) is not None:
-            cmds += cmds_from_axes(position_par, basecmd='PS')
-        if (velocity_par := settings_check(
-                velocity_x, velocity_y, velocity_z, velocity_w, velocity
-        )) is not None:
-            cmds += cmds_from_axes(velocity_par, basecmd='SP')
-        if (acceleration_par := settings_check(
-                acceleration_x, acceleration_y, acceleration_z, acceleration_w, acceleration
-        )) is not None:
-            cmds += cmds_from_axes(acceleration_par, basecmd='AC')
-        if (deceleration_par := settings_check(
-                deceleration_x, deceleration_y, deceleration_z, deceleration_w, deceleration
-        )) is not None:
-            cmds += cmds_from_axes(deceleration_par, basecmd='DC')
-        if (motion_mode_par := settings_check(
-                motion_mode_x, motion_mode_y, motion_mode_z, motion_mode_w, motion_mode
-        )) is not None:
-            cmds += cmds_from_axes(motion_mode_par, basecmd='MM', scale=False)
-        if (special_motion_mode_par := settings_check(
-                special_motion_mode_x, special_motion_mode_y, special_motion_mode_z, special_motion_mode_w, special_motion_mode
-        )) is not None:
-            cmds += cmds_from_axes(special_motion_mode_par, basecmd='SM', scale=False)
-        if (motor_on_par := settings_check(
-                motor_on_x, motor_on_y, motor_on_z, motor_on_w, motor_on
-        )) is not None:
-            cmds += cmds_from_axes(motor_on_par, basecmd='MO', scale=False)
+        cmds, parsed = settings_cmds(
+            position=position, position_x=position_x, position_y=position_y,
+            position_z=position_z, position_w=position_w,
+            velocity=velocity, velocity_x=velocity_x, velocity_y=velocity_y,
+            velocity_z=velocity_z, velocity_w=velocity_w,
+            acceleration=acceleration, acceleration_x=acceleration_x, acceleration_y=acceleration_y,
+            acceleration_z=acceleration_z, acceleration_w=acceleration_w,
+            deceleration=deceleration, deceleration_x=deceleration_x, deceleration_y=deceleration_y,
+            deceleration_z=deceleration_z, deceleration_w=deceleration_w,
+            motion_mode=motion_mode, motion_mode_x=motion_mode_x, motion_mode_y=motion_mode_y,
+            motion_mode_z=motion_mode_z, motion_mode_w=motion_mode_w,
+            special_motion_mode=special_motion_mode, special_motion_mode_x=special_motion_mode_x,
+            special_motion_mode_y=special_motion_mode_y, special_motion_mode_z=special_motion_mode_z,
+            special_motion_mode_w=special_motion_mode_w,
+            motor_on=motor_on, motor_on_x=motor_on_x, motor_on_y=motor_on_y,
+            motor_on_z=motor_on_z, motor_on_w=motor_on_w,
+        )
         self._send_cmds(cmds)
 
-        if position_par is not None:
+        if (position_par := parsed.get('position')) is not None:
             self.position_signal[type(position_par)].emit(position_par)
-        if velocity_par is not None:
+        if (velocity_par := parsed.get('velocity')) is not None:
             self.velocity_signal[type(velocity_par)].emit(velocity_par)
             # Это необходимо, так как в самом сканере некорректно реализована команда ASP -- она возвращает нули
             for axis in fields(velocity_par):
                 axis_velocity = velocity_par.__getattribute__(axis.name)
                 if axis_velocity is not None:
                     self._velocity.__setattr__(axis.name, axis_velocity)
-        if acceleration_par is not None:
+        if (acceleration_par := parsed.get('acceleration')) is not None:
             self.acceleration_signal[type(acceleration_par)].emit(acceleration_par)
-        if deceleration_par is not None:
+        if (deceleration_par := parsed.get('deceleration')) is not None:
             self.deceleration_signal[type(deceleration_par)].emit(deceleration_par)
         logger.debug("Settings have been applied")
 
@@ -362,31 +484,27 @@ class TRIMScanner(Scanner):
         with self._tcp_lock:
             try:
                 command = f"{cmd};"
-                logger.debug(f">>> {command}")
+                logger.debug(">>> %s", command)
                 command_bytes = command.encode('ascii')
+                started = time.perf_counter() if metrics.enabled else None
+                sent = time.perf_counter_ns() if self.recorder is not None else None
                 self.conn.sendall(command_bytes)
 
                 response = self.conn.recv(self.bufsize)
-                logger.debug(f"<<< {response}")
                 i = 1
                 while not response.endswith(b'>'):
                     response += self.conn.recv(self.bufsize)
                     i += 1
                     if i >= self.maxbufs:
                         raise ScannerInternalError(f'maxbufs={self.maxbufs} limit is reached')
-
-                if response.endswith(b'?>'):
-                    raise ScannerInternalError(
-                        f'Scanner response:\n{response}'
-                    )
-
-                if not response.startswith(command_bytes):
-                    raise ScannerInternalError(
-                        f'Scanner response:\n{response}\n\nEcho in start was expected:\n{command}'
-                    )
-
-                answer = response.decode().removeprefix(command).removesuffix('>')
-                return answer
+                logger.debug("<<< %s", response)
+                if started is not None:
+                    metrics.command('scanner', cmd.split('=')[0], time.perf_counter() - started,
+                                    len(command_bytes), len(response))
+                if sent is not None:
+                    self.recorder.record(sent, time.perf_counter_ns(), command_bytes, response)
+
+                return parse_response(command, response)
             except socket.error as e:
                 self._set_is_connected(False)
                 raise ScannerConnectionError from e
@@ -398,10 +516,39 @@ class TRIMScanner(Scanner):
         :param cmds: список команд
         :return: ответы на команды
         """
-        responses = []
-        for cmd in cmds:
-            responses.append(self._send_cmd(cmd))
-        return responses
+        if not self.pipeline or len(cmds) < 2:
+            return [self._send_cmd(cmd) for cmd in cmds]
+        with self._tcp_lock:
+            try:
+                commands = [f"{cmd};" for cmd in cmds]
+                logger.debug(">>> %s", commands)
+                command_bytes = ''.join(commands).encode('ascii')
+                started = time.perf_counter() if metrics.enabled else None
+                sent = time.perf_counter_ns() if self.recorder is not None else None
+                self.conn.sendall(command_bytes)
+
+                responses, buffer, i = [], b'', 0
+                while len(responses) < len(commands):
+                    buffer += self.conn.recv(self.bufsize)
+                    i += 1
+                    if i >= self.maxbufs * len(commands):
+                        raise ScannerInternalError(f'maxbufs={self.maxbufs} limit is reached')
+                    while len(responses) < len(commands) and (end := buffer.find(b'>')) >= 0:
+                        responses.append(buffer[:end + 1])
+                        buffer = buffer[end + 1:]
+                logger.debug("<<< %s", responses)
+                if started is not None:
+                    metrics.command('scanner', 'pipeline', time.perf_counter() - started,
+                                    len(command_bytes), sum(map(len, responses)))
+                if sent is not None:
+                    received = time.perf_counter_ns()
+                    for command, response in zip(commands, responses):
+                        self.recorder.record(sent, received, command.encode('ascii'), response)
+            except socket.error as e:
+                self._set_is_connected(False)
+                raise ScannerConnectionError from e
+        # ответы разбираются после чтения всех, чтобы ошибка одной команды не оставила остальные в сокете
+        return [parse_response(command, response) for command, response in zip(commands, responses)]
 
     @staticmethod
     def _parse_A_res(res: str, scale=True) -> Union[Iterable[int], Iterable[float]]:
@@ -417,87 +564,134 @@ class TRIMScanner(Scanner):
             return (int(v) for v in res.split(','))
         return (int(v) / axis_scale for v, axis_scale in zip(res.split(','), astuple(AXES_SCALE)))
 
-    def _is_stopped(self) -> bool:
+    def _is_stopped(self, axes: Iterable[str] = AXES) -> bool:
         """
-        Проверяет, остановился ли двигатель
+        Проверяет, остановились ли двигатели осей axes
 
+        :param axes: оси, по умолчанию все
         """
-        res = self._send_cmd('AMS')
-        return all([r == 0 for r in self._parse_A_res(res)])
+        res = dict(zip(AXES, self._parse_A_res(self._send_cmd('AMS'))))
+        return all([res[axis] == 0 for axis in axes])
 
     def _end_of_motion_reason(self) -> Iterable[int]:
         """
-        Проверка причины остановки
+        Проверка причины остановки. Вызывается после _wait_settled, поэтому дополнительная пауза не нужна
 
         """
-        time.sleep(0.02)
         res = self._send_cmd('AEM')
         return self._parse_A_res(res, scale=False)
 
-    def _begin_motion_and_wait(self, cmds, action_description: str = "a motion"):
+    def _begin_motion_and_wait(self, cmds, action_description: str = "a motion", axes: Iterable[str] = AXES):
         """
         Отправляет команды, а затем ждет завершение движения
 
         :param cmds: команды
         :param action_description: описание движения, которое будет использовано при поднятии исплючения
+        :param axes: оси, завершения движения которых нужно ждать
         """
-        self._send_cmds(cmds)
+        with tracer.span('motion command', 'scanner'):
+            self._send_cmds(cmds)
+
+        polls = 0
+        with tracer.span('motion wait', 'scanner'):
+            while not self._is_stopped(axes):
+                polls += 1
+                time.sleep(0.1)
+        if metrics.enabled:
+            metrics.observe('motion_polls', polls, COUNT_BUCKETS, device='scanner')
+            metrics.observe('motion_poll_sleep_seconds', polls * 0.1, device='scanner')
+
+    def _wait_settled(self, target: Optional[Position], axes: Iterable[str]) -> None:
+        """
+        Ждет, пока позиция энкодеров осей axes не успокоится около цели (или не перестанет меняться,
+        если цель неизвестна). Вместо фиксированной паузы ждет ровно столько, сколько нужно механике
+
+        :param target: заданная позиция
+        :param axes: оси движения
+        """
+        generation = self._stop_generation
+        wait = self.settle.start(None if target is None else quantize(restrict(target, axes)), time.monotonic())
+        with tracer.span('settle', 'scanner'):
+            while not wait.update(restrict(self._encoder_position(), axes), time.monotonic()):
+                if generation != self._stop_generation:
+                    return
+                time.sleep(self.settle.poll_interval)
+        if wait.timed_out:
+            logger.warning(f'Scanner has not settled in {self.settle.timeout} s on axes {", ".join(axes)}')
 
-        while not self._is_stopped():
-            time.sleep(0.1)
+    @property
+    def settle_stats(self) -> SettleStats:
+        """
+        Статистика времени успокоения после движений
+        """
+        return self.settle.stats
 
     def _set_is_moving(self, state: bool):
-        self._is_moving = state
-        self._signals.is_moving.emit(state)
+        """
+        Учитывает число одновременных движений. Сигнал посылается, когда сканер начинает
+        или полностью заканчивает двигаться.
+        """
+        with self._inner_motion_lock:
+            self._moving_count += 1 if state else -1
+            is_moving = self._moving_count > 0
+            changed = is_moving != self._is_moving
+            self._is_moving = is_moving
+        if changed:
+            self._signals.is_moving.emit(is_moving)
+
+    @contextmanager
+    def _lock_axes(self, axes: Iterable[str]):
+        """
+        Захватывает локи осей всегда в одном порядке, чтобы движения не блокировали друг друга навсегда
+        """
+        locks = [self._axis_locks[axis] for axis in AXES if axis in set(axes)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
 
-    def _motion_decorator(self, func, *args, **kwargs):
+    def _motion_decorator(self, func, *args, axes: Iterable[str] = AXES, **kwargs):
         """
         Декоратор, который контролирует флаг остановки, потому что это не реализовано в контроллере.
         По документации MS=7 должен об этом сигнализировать, но это не работает.
         Декоратор реализует тред сейф сканера.
 
-        Если в очереди стоят, например goto или home, из разных потоков, то при поднятии _stop_flag, все стоящие в очереди
-        команды завершатся.
-        После остановки тред с новым движением поменяет _stop_released и _stop_flag.
+        Движения, которые используют общие оси, выполняются по очереди, а движения
+        с непересекающимися наборами осей (например, W и X/Y) -- одновременно.
+
+        Если в очереди стоят, например goto или home, из разных потоков, то после stop все команды,
+        поставленные в очередь до остановки, завершатся. Движение запоминает номер остановки
+        _stop_generation в момент постановки в очередь, поэтому новые движения не сбрасывают
+        остановку для тех, что еще ждут своей очереди.
 
         :param func:
+        :param axes: оси, которые использует движение
         """
-        self._inner_motion_lock.acquire()
+        generation = self._stop_generation
         self._set_is_moving(True)
-        if self._stop_flag and not self._stop_released:
-            self._stop_released = True
-            self._inner_motion_lock.release()
-            with self._motion_lock:
-                self._stop_flag = False
-                try:
-                    func(*args, **kwargs)
-                except Exception as e:
-                    raise e
-                finally:
-                    self._set_is_moving(False)
-        else:
-            self._inner_motion_lock.release()
-            with self._motion_lock:
-                if self._stop_flag:
-                    self._set_is_moving(False)
+        try:
+            with self._lock_axes(axes):
+                if generation != self._stop_generation:
                     raise ScannerMotionError(f'During the motion STOP or ABORT was executed')
-                try:
-                    func(*args, **kwargs)
-                except Exception as e:
-                    raise e
-                finally:
-                    self._set_is_moving(False)
-        if self._stop_flag:
+                func(*args, **kwargs)
+        finally:
             self._set_is_moving(False)
+        if generation != self._stop_generation:
             raise ScannerMotionError(f'During the motion STOP or ABORT was executed')
 
     def _goto(self, position: Position) -> None:
-        logger.debug(f'Moving to {position}')
-        self.set_settings(**PTP_MODE_SETTINGS)
+        logger.debug('Moving to %s', position)
+        axes = axes_of(position)
+        # режим движения меняется только у своих осей, чтобы не мешать одновременным движениям других осей
+        self.set_settings(**restrict_settings(PTP_MODE_SETTINGS, axes))
         cmds = cmds_from_axes(position, 'AP')
         cmds += cmds_from_axes(position, 'BG', val=False, scale=False)
         action_description = f'the motion to {position}'
-        self._begin_motion_and_wait(cmds, action_description)
+        self._begin_motion_and_wait(cmds, action_description, axes)
+        self._wait_settled(position, axes)
 
         stop_reasons = list(self._end_of_motion_reason())
         if position.x is not None and stop_reasons[0] != 1:
@@ -508,16 +702,184 @@ class TRIMScanner(Scanner):
             raise scanner_motion_error(action_description, stop_reasons)
         if position.w is not None and stop_reasons[3] != 1:
             raise scanner_motion_error(action_description, stop_reasons)
-        logger.debug(f'Moved to {position}')
+        logger.debug('Moved to %s', position)
         self.position()
 
     def goto(self, position: Position) -> None:
-        self._motion_decorator(self._goto, position)
+        self.check_positions(position)
+        with tracer.span('motion', 'scanner'):
+            self._motion_decorator(self._goto, position, axes=axes_of(position))
+
+    def _soft_limits_steps(self) -> Tuple[BaseAxes, BaseAxes]:
+        if self._soft_limits is None:
+            low = BaseAxes(*self._parse_A_res(self._send_cmd('ALL'), scale=False))
+            high = BaseAxes(*self._parse_A_res(self._send_cmd('AHL'), scale=False))
+            self._soft_limits = (low, high)
+        return self._soft_limits
+
+    def soft_limits(self, refresh: bool = False) -> Tuple[Position, Position]:
+        """
+        Программные пределы сканера. Читаются из контроллера один раз и хранятся до переподключения
+
+        :param refresh: прочитать пределы заново
+        :return: нижние и верхние пределы в мм
+        """
+        if refresh:
+            self._soft_limits = None
+        low, high = self._soft_limits_steps()
+        return (
+            Position(*(v / scale for v, scale in zip(astuple(low), astuple(AXES_SCALE)))),
+            Position(*(v / scale for v, scale in zip(astuple(high), astuple(AXES_SCALE)))),
+        )
+
+    def check_positions(self, positions) -> None:
+        """
+        Проверяет позиции по программным пределам без движения сканера.
+        Весь план скана проверяется одним векторным сравнением
+
+        :param positions: Position, список Position или массив (n, 4) в мм, например ScanPlan.to_array()
+        """
+        indices = out_of_limits(positions, *self._soft_limits_steps())
+        if len(indices):
+            low, high = self.soft_limits()
+            shown = ', '.join(map(str, indices[:20])) + (', ...' if len(indices) > 20 else '')
+            raise ScannerLimitError(
+                f'{len(indices)} position(s) are outside of the software limits {low} - {high}: {shown}',
+                indices.tolist()
+            )
+
+    def _near(self, position: Position, target: Position, blend: float) -> bool:
+        return all(
+            abs(position.__getattribute__(axis) - target.__getattribute__(axis)) <= blend
+            for axis in axes_of(target)
+        )
+
+    def _check_end_of_motion(self, action_description: str, axes: Iterable[str]) -> None:
+        """
+        Проверяет причины завершения движения (AEM) осей axes
+
+        :param action_description: описание движения для текста ошибки
+        :param axes: оси движения
+        """
+        stop_reasons = list(self._end_of_motion_reason())
+        for i, axis in enumerate(AXES):
+            if axis in axes and stop_reasons[i] != 1:
+                raise scanner_motion_error(action_description, stop_reasons)
+
+    def _follow(
+            self,
+            points: Sequence[Position],
+            blend: float,
+            special_motion_mode: Optional[BaseAxes],
+            on_waypoint: Optional[Callable[[int], None]],
+    ) -> None:
+        axes = tuple(axis for axis in AXES if any(p.__getattribute__(axis) is not None for p in points))
+        settings = restrict_settings(PTP_MODE_SETTINGS, axes)
+        if special_motion_mode is not None:
+            settings['special_motion_mode'] = restrict(special_motion_mode, axes)
+        self.set_settings(**settings)
+        action_description = f'the trajectory of {len(points)} points'
+        generation = self._stop_generation
+        on_the_fly = True
+        try:
+            for index, point in enumerate(points):
+                cmds = cmds_from_axes(point, 'AP') + cmds_from_axes(point, 'BG', val=False, scale=False)
+                if on_the_fly and index > 0:
+                    try:
+                        self._send_cmds(cmds)
+                    except ScannerInternalError:
+                        # контроллер не принимает новую цель во время движения -- едем с остановками
+                        logger.warning('Target update during motion was rejected, falling back to stop-start motion')
+                        on_the_fly = False
+                if not on_the_fly or index == 0:
+                    self._begin_motion_and_wait([], action_description, axes)
+                    self._send_cmds(cmds)
+                if index == len(points) - 1:
+                    break
+                # следующая цель отправляется, когда сканер подходит к текущей на blend, без остановки
+                while generation == self._stop_generation:
+                    if self._near(self.position(), point, blend):
+                        break
+                    if self._is_stopped(axes):
+                        # оси остановились, не дойдя до точки: это нормально, только если контроллер
+                        # сообщает штатное завершение движения (AEM=1) по каждой оси
+                        self._check_end_of_motion(action_description, axes)
+                        break
+                    time.sleep(self.settle.poll_interval)
+                if generation != self._stop_generation:
+                    return
+                if on_waypoint is not None:
+                    on_waypoint(index)
+
+            self._begin_motion_and_wait([], action_description, axes)
+            self._wait_settled(points[-1], axes)
+            self._check_end_of_motion(action_description, axes)
+            if on_waypoint is not None:
+                on_waypoint(len(points) - 1)
+            self.position()
+        finally:
+            if special_motion_mode is not None:
+                self.set_settings(special_motion_mode=restrict(PTP_MODE_SETTINGS['special_motion_mode'], axes))
+
+    def follow(
+            self,
+            points: Sequence[Position],
+            blend: float = 1.,
+            special_motion_mode: BaseAxes = None,
+            on_waypoint: Callable[[int], None] = None,
+    ) -> None:
+        """
+        Проходит точки одним непрерывным движением: следующая цель отправляется контроллеру,
+        когда сканер подошел к текущей ближе blend, поэтому между сегментами нет полного
+        торможения и разгона. Ход движения публикуется через position_signal.
+        Если контроллер отклоняет смену цели во время движения, точки проходятся с остановками.
+
+        :param points: точки траектории, например строка плана скана
+        :param blend: расстояние до промежуточной точки в мм, с которого начинается следующий сегмент
+        :param special_motion_mode: значения SM на время траектории, если режим смены цели
+            во время движения у контроллера включается специальным режимом (см. документацию контроллера)
+        :param on_waypoint: вызывается с номером пройденной точки
+        """
+        if not points:
+            return
+        self.check_positions(points)
+        axes = tuple(axis for axis in AXES if any(p.__getattribute__(axis) is not None for p in points))
+        self._motion_decorator(self._follow, points, blend, special_motion_mode, on_waypoint, axes=axes)
+
+    @contextmanager
+    def jogging(self, velocity: Velocity):
+        """
+        Непрерывное движение осей с заданной скоростью (JOG), пока выполняется блок with.
+        Направление задается знаком скорости. После блока оси останавливаются,
+        а скорость и режим PTP восстанавливаются.
+
+        :param velocity: скорости осей, которые должны двигаться
+        """
+        axes = axes_of(velocity)
+        self._set_is_moving(True)
+        try:
+            with self._lock_axes(axes):
+                old_velocity = restrict(self.velocity(), axes)
+                self.set_settings(**restrict_settings(JOG_MODE_SETTINGS, axes))
+                try:
+                    self.set_settings(velocity=velocity)
+                    self._send_cmds(cmds_from_axes(velocity, 'BG', val=False, scale=False))
+                    yield
+                finally:
+                    self._send_cmds(cmds_from_axes(velocity, 'ST', val=False, scale=False))
+                    self._begin_motion_and_wait([], 'jogging', axes)
+                    # скорость, которую сканер не сообщал, остается равной модулю скорости JOG
+                    self.set_settings(velocity=Velocity(**{
+                        axis: abs(velocity.__getattribute__(axis)) if (v := old_velocity.__getattribute__(axis)) is None else v
+                        for axis in axes
+                    }))
+                    self.set_settings(**restrict_settings(PTP_MODE_SETTINGS, axes))
+        finally:
+            self._set_is_moving(False)
 
     def stop(self) -> None:
         logger.info(f'Stopping...')
-        self._stop_flag = True
-        self._stop_released = False
+        self._stop_generation += 1
         self._send_cmd('AST')
 
     def abort(self) -> None:
@@ -535,7 +897,7 @@ class TRIMScanner(Scanner):
 
         :return: реальная позиция
         """
-        res = self._send_cmd('PS')
+        res = self._send_cmd('APS')
         ans = Position(*self._parse_A_res(res))
         return ans
 
@@ -612,28 +974,28 @@ class TRIMScanner(Scanner):
     def _home(self) -> None:
         logger.info(f'Homing...')
         # уменьшение скорости в два раза
-        old_velocity = self.velocity()
+        old_velocity = restrict(self.velocity(), HOME_AXES)
         new_velocity = old_velocity / 2
         self.set_settings(velocity=new_velocity)
         # выставляем режим бесконечного движения с постоянной скоростью
-        self.set_settings(**JOG_MODE_SETTINGS)
+        self.set_settings(**restrict_settings(JOG_MODE_SETTINGS, HOME_AXES))
 
         action_description = f'homing'
         cmds = ['XBG', 'YBG', 'ZBG']
-        self._begin_motion_and_wait(cmds, action_description)
+        self._begin_motion_and_wait(cmds, action_description, HOME_AXES)
 
         # возвращаем старую скорость
         self.set_settings(velocity=old_velocity)
         # возвращаем point-to-point режим работы
-        self.set_settings(**PTP_MODE_SETTINGS)
+        self.set_settings(**restrict_settings(PTP_MODE_SETTINGS, HOME_AXES))
 
-        time.sleep(1)
+        self._wait_settled(None, HOME_AXES)
         stop_reasons = list(self._end_of_motion_reason())
         if not (stop_reasons[0] == stop_reasons[1] == stop_reasons[2] == 2):
             raise scanner_motion_error(action_description, stop_reasons)
 
     def home(self) -> None:
-        self._motion_decorator(self._home)
+        self._motion_decorator(self._home, axes=HOME_AXES)
 
     @property
     def position_signal(self):
@@ -17,8 +17,9 @@ class ScannerStorage:
     motor_on = BaseAxes(0, 0, 0, 0)
     motion_mode = BaseAxes(0, 0, 0, 0)
     special_motion_mode = BaseAxes(0, 0, 0, 0)
-    high_limit = BaseAxes(127, 127, 127, 127)
-    low_limit = BaseAxes(-127, -127, -127, -127)
+    # пределы в шагах: 3000 мм по x, 2000 мм по y, 1000 мм по z, 360 градусов по w
+    high_limit = BaseAxes(3000 * 8192, 2000 * 5120, 1000 * 5120, 360)
+    low_limit = BaseAxes(-3000 * 8192, -2000 * 5120, -1000 * 5120, -360)
 
     motor_status = BaseAxes(0, 0, 0, 0)
     error_motion = BaseAxes(1, 1, 1, 1)
@@ -79,17 +80,96 @@ def update_ms_em(scanner, tmp, motion_time):
                 ends.append(False)
             else:
                 scanner.motor_status.__setattr__(attr, 0)
-                if scanner.motion_mode.__getattribute__(attr) == 0:
+                target = scanner.absolute_position.__getattribute__(attr)
+                high = scanner.high_limit.__getattribute__(attr)
+                low = scanner.low_limit.__getattribute__(attr)
+                if target > high:
+                    scanner.error_motion.__setattr__(attr, 4)
+                    target = high
+                elif target < low:
+                    scanner.error_motion.__setattr__(attr, 5)
+                    target = low
+                elif scanner.motion_mode.__getattribute__(attr) == 0:
                     scanner.error_motion.__setattr__(attr, 1)
                 elif scanner.motion_mode.__getattribute__(attr) == 1:
                     scanner.error_motion.__setattr__(attr, 2)
-                scanner.position.__setattr__(attr, scanner.absolute_position.__getattribute__(attr))
+                scanner.position.__setattr__(attr, target)
                 ends.append(True)
         else:
             ends.append(True)
     scanner.in_motion = not all(ends)
 
 
+def handle(scanner: ScannerStorage, data: bytes, motion_time) -> bytes:
+    """
+    Выполняет одну команду вместе с ';', возвращает ответ
+    """
+    new_data = data
+
+    axis = None
+    done = False
+    if data[1:3] == b'PS':
+        update_ms_em(scanner, time.time(), motion_time)
+        axis = scanner.position
+    elif data[1:3] == b'AP':
+        axis = scanner.absolute_position
+    elif data[1:3] == b'SP':
+        axis = scanner.velocity
+    elif data[1:3] == b'AC':
+        axis = scanner.acceleration
+    elif data[1:3] == b'DC':
+        axis = scanner.deceleration
+    elif data[1:3] == b'MO':
+        axis = scanner.motor_on
+    elif data[1:3] == b'MM':
+        axis = scanner.motion_mode
+    elif data[1:3] == b'SM':
+        axis = scanner.special_motion_mode
+    elif data[1:3] == b'HL':
+        axis = scanner.high_limit
+    elif data[1:3] == b'LL':
+        axis = scanner.low_limit
+
+    elif data[1:3] == b'BG':
+        scanner.in_motion = True
+        axis = scanner.motion_start_time
+        letter = data[0:1]
+        tmp = time.time()
+        set_by_value(axis, letter, tmp)
+        update_ms_em(scanner, time.time(), motion_time)
+        new_data += b'>'
+        done = True
+
+    elif data[1:3] == b'ST' or data[1:3] == b'AB':
+        update_ms_em(scanner, time.time(), motion_time)
+        scanner.in_motion = False
+        letter = data[0:1]
+        axis = scanner.motor_status
+        set_by_value(axis, letter, 0)
+        axis = scanner.error_motion
+        set_by_value(axis, letter, 1)
+        new_data += b'>'
+        done = True
+
+    elif data[1:3] == b'MS':
+        update_ms_em(scanner, time.time(), motion_time)
+        axis = scanner.motor_status
+    elif data[1:3] == b'EM':
+        update_ms_em(scanner, time.time(), motion_time)
+        axis = scanner.error_motion
+
+    if axis is None and not done:
+        new_data += b'?>'
+    elif not done:
+        if data.count(b'=') == 0:
+            new_data += return_by_cmd(axis, data[0:1])
+        elif data[3:4] == b'=':
+            new_data += set_by_cmd(axis, data[0:1], data[4:-1])
+        else:
+            new_data += b'?>'
+    return new_data
+
+
 def emulator(ip="127.0.0.1", port=9000, motion_time: int = 5):
     scanner = ScannerStorage()
     while True:
@@ -98,81 +178,20 @@ def emulator(ip="127.0.0.1", port=9000, motion_time: int = 5):
             s.listen()
             conn, addr = s.accept()
             with conn:
+                # команды могут приходить частями и по несколько в одном пакете
+                buffer = b''
                 while True:
                     data = conn.recv(1024)
                     if not data:
                         break
-
-                    if not data.endswith(b';'):
-                        raise RuntimeError
-                    new_data = data
-
-                    axis = None
-                    done = False
-                    if data[1:3] == b'PS':
-                        update_ms_em(scanner, time.time(), motion_time)
-                        axis = scanner.position
-                    elif data[1:3] == b'AP':
-                        axis = scanner.absolute_position
-                    elif data[1:3] == b'SP':
-                        axis = scanner.velocity
-                    elif data[1:3] == b'AC':
-                        axis = scanner.acceleration
-                    elif data[1:3] == b'DC':
-                        axis = scanner.deceleration
-                    elif data[1:3] == b'MO':
-                        axis = scanner.motor_on
-                    elif data[1:3] == b'MM':
-                        axis = scanner.motion_mode
-                    elif data[1:3] == b'SM':
-                        axis = scanner.special_motion_mode
-                    elif data[1:3] == b'HL':
-                        axis = scanner.high_limit
-                    elif data[1:3] == b'LL':
-                        axis = scanner.low_limit
-
-                    elif data[1:3] == b'BG':
-                        scanner.in_motion = True
-                        axis = scanner.motion_start_time
-                        letter = data[0:1]
-                        tmp = time.time()
-                        set_by_value(axis, letter, tmp)
-                        update_ms_em(scanner, time.time(), motion_time)
-                        new_data += b'>'
-                        done = True
-
-                    elif data[1:3] == b'ST' or data[1:3] == b'AB':
-                        update_ms_em(scanner, time.time(), motion_time)
-                        scanner.in_motion = False
-                        letter = data[0:1]
-                        axis = scanner.motor_status
-                        set_by_value(axis, letter, 0)
-                        axis = scanner.error_motion
-                        set_by_value(axis, letter, 1)
-                        new_data += b'>'
-                        done = True
-
-                    elif data[1:3] == b'MS':
-                        update_ms_em(scanner, time.time(), motion_time)
-                        axis = scanner.motor_status
-                    elif data[1:3] == b'EM':
-                        update_ms_em(scanner, time.time(), motion_time)
-                        axis = scanner.error_motion
-
-                    if axis is None and not done:
-                        new_data += b'?>'
-                    elif not done:
-                        if data.count(b'=') == 0:
-                            new_data += return_by_cmd(axis, data[0:1])
-                        elif data[3:4] == b'=':
-                            new_data += set_by_cmd(axis, data[0:1], data[4:-1])
-                        else:
-                            new_data += b'?>'
-                    conn.sendall(new_data)
+                    buffer += data
+                    *cmds, buffer = buffer.split(b';')
+                    if cmds:
+                        conn.sendall(b''.join(handle(scanner, cmd + b';', motion_time) for cmd in cmds))
 
 
 def run(blocking=True, ip="127.0.0.1", port=9000, motion_time=5):
-    server_thread = threading.Thread(target=emulator, args=(ip, port, motion_time))
+    server_thread = threading.Thread(target=emulator, args=(ip, port, motion_time), daemon=not blocking)
     print('Starting server')
     server_thread.start()
     if blocking:
@@ -1 +1,3 @@
 from .TRIM import TRIMScanner, DEFAULT_SETTINGS, PTP_MODE_SETTINGS, JOG_MODE_SETTINGS
+from .async_TRIM import AsyncTRIMScanner
+from .settle import SettleDetector, SettleStats
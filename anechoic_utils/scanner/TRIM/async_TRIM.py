@@ -0,0 +1,419 @@
+"""
+Асинхронное управление сканером с контроллером ORBIT/FR AL-4164 и AL-4166 на asyncio
+"""
+import asyncio
+from dataclasses import fields, astuple
+import time
+from typing import Union, List, Iterable, Tuple, Optional
+
+from ..scanner import Scanner, BaseAxes, Position, Velocity, Acceleration, Deceleration
+from ..scanner import ScannerConnectionError, ScannerInternalError, ScannerMotionError, ScannerLimitError
+from ..scanner import ScannerSignals
+from .TRIM import TRIMScanner, TRIMScannerSignals, PTP_MODE_SETTINGS, JOG_MODE_SETTINGS
+from .TRIM import cmds_from_axes, scanner_motion_error, settings_cmds, parse_response, out_of_limits, AXES_SCALE
+from .TRIM import restrict, quantize, axes_of, HOME_AXES
+from .settle import SettleDetector, SettleStats
+from ...metrics import metrics, COUNT_BUCKETS
+from ...tracing import tracer
+from ...session import SessionRecorder
+
+import logging
+logger = logging.getLogger('scanner.TRIM.async')
+
+
+class AsyncTRIMScanner(Scanner):
+    """
+    Асинхронный сканер. Протокол тот же, что у TRIMScanner, но все команды -- корутины,
+    поэтому несколько сканеров и анализаторов работают в одном потоке без блокировок.
+    Отмена задачи с goto или home останавливает сканер командой AST.
+    """
+    # если задан, каждый обмен с контроллером пишется в запись сессии
+    recorder: SessionRecorder = None
+
+    def __init__(
+            self,
+            ip: str,
+            port: Union[str, int],
+            bufsize: int = 1024,
+            maxbufs: int = 1024,
+            poll_interval: float = 0.1,
+            signals: ScannerSignals = None,
+            settle: SettleDetector = None,
+            pipeline: bool = False,
+    ):
+        """
+
+        :param ip: ip адрес сканера
+        :param port: порт сканера
+        :param bufsize: размер чанка сообщения в байтах
+        :param maxbufs: максимальное число чанков
+        :param poll_interval: период опроса состояния двигателей во время движения в секундах
+        :param settle: условия успокоения сканера после движения
+        :param pipeline: отправлять пакет команд одним сообщением, не дожидаясь ответа на каждую
+        """
+        self.ip = ip
+        self.port = port
+        self.bufsize = bufsize
+        self.maxbufs = maxbufs
+        self.poll_interval = poll_interval
+        self.pipeline = pipeline
+        self._reader: asyncio.StreamReader = None
+        self._writer: asyncio.StreamWriter = None
+        # asyncio.Lock отдает управление в порядке очереди, как FIFOLock.
+        # Локи создаются в работающем event loop (_bind_locks): в Python 3.9 лок привязывается к циклу при создании
+        self._tcp_lock: asyncio.Lock = None
+        self._motion_lock: asyncio.Lock = None
+        self._locks_loop: asyncio.AbstractEventLoop = None
+        # номер последней остановки, движения из очереди до остановки завершаются с ошибкой
+        self._stop_generation = 0
+
+        self._is_moving = False
+        self._is_connected = False
+        self._velocity = Velocity()  # необходимо хранить скорость, потому что сканер не возвращает свою скорость
+        self._soft_limits: Tuple[BaseAxes, BaseAxes] = None  # (ALL, AHL) в шагах, читаются один раз после подключения
+        self.settle = settle if settle is not None else SettleDetector()
+
+        if signals is not None:
+            self._signals = signals
+        else:
+            self._signals = TRIMScannerSignals()
+
+    def _bind_locks(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._locks_loop is not loop:
+            self._locks_loop = loop
+            self._tcp_lock, self._motion_lock = asyncio.Lock(), asyncio.Lock()
+
+    def _set_is_connected(self, state: bool):
+        self._is_connected = state
+        self._signals.is_connected.emit(state)
+
+    async def connect(self) -> None:
+        if self._is_connected:
+            return
+        self._bind_locks()
+        try:
+            self._reader, self._writer = await asyncio.open_connection(self.ip, self.port)
+            self._soft_limits = None
+            self._set_is_connected(True)
+            logger.info("Scanner is connected")
+        except OSError as e:
+            raise ScannerConnectionError from e
+
+    async def disconnect(self) -> None:
+        if not self.is_connected:
+            return
+        try:
+            self._writer.close()
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+        finally:
+            self._set_is_connected(False)
+            logger.info("Scanner is disconnected")
+
+    async def _send_cmd(self, cmd: str) -> str:
+        """
+        Принимает команду, отправляет на сканер и ждет ответа. Ответ возвращает.
+        Обмен защищен от отмены: иначе недочитанный ответ остался бы в сокете и сбил следующую команду.
+
+        :param cmd: команда
+        :return: ответ сканера
+        """
+        return await asyncio.shield(self._exchange(cmd))
+
+    async def _exchange(self, cmd: str) -> str:
+        if self._writer is None:
+            raise ScannerConnectionError
+        self._bind_locks()
+        waiting = time.perf_counter() if metrics.enabled else None
+        async with self._tcp_lock:
+            if waiting is not None:
+                started = time.perf_counter()
+                metrics.observe('lock_wait_seconds', started - waiting, lock='scanner.tcp')
+            try:
+                command = f"{cmd};"
+                logger.debug(">>> %s", command)
+                command_bytes = command.encode('ascii')
+                sent = time.perf_counter_ns() if self.recorder is not None else None
+                self._writer.write(command_bytes)
+                await self._writer.drain()
+
+                response = await self._reader.read(self.bufsize)
+                i = 1
+                while not response.endswith(b'>'):
+                    chunk = await self._reader.read(self.bufsize)
+                    if not chunk:
+                        raise ConnectionResetError('Connection closed by the scanner')
+                    response += chunk
+                    i += 1
+                    if i >= self.maxbufs:
+                        raise ScannerInternalError(f'maxbufs={self.maxbufs} limit is reached')
+                logger.debug("<<< %s", response)
+                if waiting is not None:
+                    metrics.command('scanner', cmd.split('=')[0], time.perf_counter() - started,
+                                    len(command_bytes), len(response))
+                if sent is not None:
+                    self.recorder.record(sent, time.perf_counter_ns(), command_bytes, response)
+                return parse_response(command, response)
+            except OSError as e:
+                self._set_is_connected(False)
+                raise ScannerConnectionError from e
+
+    async def _send_cmds(self, cmds: List[str]) -> List[str]:
+        """
+        Принимает список команд, отправляет их на сканер и ждет все ответы. Ответы возвращает.
+
+        :param cmds: список команд
+        :return: ответы на команды
+        """
+        if not self.pipeline or len(cmds) < 2:
+            return [await self._send_cmd(cmd) for cmd in cmds]
+        commands = [f"{cmd};" for cmd in cmds]
+        responses = await asyncio.shield(self._exchange_pipelined(commands))
+        # ответы разбираются после чтения всех, чтобы ошибка одной команды не оставила остальные в сокете
+        return [parse_response(command, response) for command, response in zip(commands, responses)]
+
+    async def _exchange_pipelined(self, commands: List[str]) -> List[bytes]:
+        if self._writer is None:
+            raise ScannerConnectionError
+        self._bind_locks()
+        async with self._tcp_lock:
+            try:
+                logger.debug(">>> %s", commands)
+                command_bytes = ''.join(commands).encode('ascii')
+                started = time.perf_counter() if metrics.enabled else None
+                sent = time.perf_counter_ns() if self.recorder is not None else None
+                self._writer.write(command_bytes)
+                await self._writer.drain()
+
+                responses = [await self._reader.readuntil(b'>') for _ in commands]
+                logger.debug("<<< %s", responses)
+                if started is not None:
+                    metrics.command('scanner', 'pipeline', time.perf_counter() - started,
+                                    len(command_bytes), sum(map(len, responses)))
+                if sent is not None:
+                    received = time.perf_counter_ns()
+                    for command, response in zip(commands, responses):
+                        self.recorder.record(sent, received, command.encode('ascii'), response)
+                return responses
+            except (OSError, asyncio.IncompleteReadError) as e:
+                self._set_is_connected(False)
+                raise ScannerConnectionError from e
+
+    async def set_settings(self, **settings) -> None:
+        """
+        Применить настройки. Параметры такие же, как у TRIMScanner.set_settings
+        """
+        cmds, parsed = settings_cmds(**settings)
+        await self._send_cmds(cmds)
+
+        if (position_par := parsed.get('position')) is not None:
+            self._signals.position[type(position_par)].emit(position_par)
+        if (velocity_par := parsed.get('velocity')) is not None:
+            self._signals.velocity[type(velocity_par)].emit(velocity_par)
+            for axis in fields(velocity_par):
+                axis_velocity = velocity_par.__getattribute__(axis.name)
+                if axis_velocity is not None:
+                    self._velocity.__setattr__(axis.name, axis_velocity)
+        if (acceleration_par := parsed.get('acceleration')) is not None:
+            self._signals.acceleration[type(acceleration_par)].emit(acceleration_par)
+        if (deceleration_par := parsed.get('deceleration')) is not None:
+            self._signals.deceleration[type(deceleration_par)].emit(deceleration_par)
+        logger.debug("Settings have been applied")
+
+    async def _is_stopped(self) -> bool:
+        res = await self._send_cmd('AMS')
+        return all([r == 0 for r in TRIMScanner._parse_A_res(res)])
+
+    async def _end_of_motion_reason(self) -> Iterable[int]:
+        res = await self._send_cmd('AEM')
+        return TRIMScanner._parse_A_res(res, scale=False)
+
+    async def _begin_motion_and_wait(self, cmds: List[str]) -> None:
+        """
+        Отправляет команды, а затем ждет завершение движения.
+        При отмене задачи останавливает сканер.
+
+        :param cmds: команды
+        """
+        try:
+            with tracer.span('motion command', 'scanner'):
+                await self._send_cmds(cmds)
+            polls = 0
+            with tracer.span('motion wait', 'scanner'):
+                while not await self._is_stopped():
+                    polls += 1
+                    await asyncio.sleep(self.poll_interval)
+            if metrics.enabled:
+                metrics.observe('motion_polls', polls, COUNT_BUCKETS, device='scanner')
+                metrics.observe('motion_poll_sleep_seconds', polls * self.poll_interval, device='scanner')
+        except asyncio.CancelledError:
+            logger.info('Motion was cancelled, stopping...')
+            await asyncio.shield(self._send_cmd('AST'))
+            raise
+
+    async def _encoder_position(self) -> Position:
+        res = await self._send_cmd('APS')
+        return Position(*TRIMScanner._parse_A_res(res))
+
+    async def _wait_settled(self, target: Optional[Position], axes: Iterable[str]) -> None:
+        """
+        Ждет успокоения осей axes по энкодерам, см. TRIMScanner._wait_settled
+        """
+        generation = self._stop_generation
+        wait = self.settle.start(None if target is None else quantize(restrict(target, axes)), time.monotonic())
+        with tracer.span('settle', 'scanner'):
+            while not wait.update(restrict(await self._encoder_position(), axes), time.monotonic()):
+                if generation != self._stop_generation:
+                    return
+                await asyncio.sleep(self.settle.poll_interval)
+        if wait.timed_out:
+            logger.warning(f'Scanner has not settled in {self.settle.timeout} s on axes {", ".join(axes)}')
+
+    @property
+    def settle_stats(self) -> SettleStats:
+        return self.settle.stats
+
+    def _set_is_moving(self, state: bool):
+        self._is_moving = state
+        self._signals.is_moving.emit(state)
+
+    async def _motion(self, coro_func, *args) -> None:
+        """
+        Выполняет движения по очереди. Если во время ожидания в очереди или во время движения
+        была вызвана остановка, движение завершается ScannerMotionError, как у TRIMScanner.
+        """
+        generation = self._stop_generation
+        self._bind_locks()
+        async with self._motion_lock:
+            if generation != self._stop_generation:
+                raise ScannerMotionError(f'During the motion STOP or ABORT was executed')
+            self._set_is_moving(True)
+            try:
+                await coro_func(*args)
+            finally:
+                self._set_is_moving(False)
+            if generation != self._stop_generation:
+                raise ScannerMotionError(f'During the motion STOP or ABORT was executed')
+
+    async def _goto(self, position: Position) -> None:
+        logger.debug('Moving to %s', position)
+        await self.set_settings(**PTP_MODE_SETTINGS)
+        cmds = cmds_from_axes(position, 'AP')
+        cmds += cmds_from_axes(position, 'BG', val=False, scale=False)
+        action_description = f'the motion to {position}'
+        await self._begin_motion_and_wait(cmds)
+        await self._wait_settled(position, axes_of(position))
+
+        stop_reasons = list(await self._end_of_motion_reason())
+        for i, field in enumerate(fields(BaseAxes)):
+            if position.__getattribute__(field.name) is not None and stop_reasons[i] != 1:
+                raise scanner_motion_error(action_description, stop_reasons)
+        logger.debug('Moved to %s', position)
+        await self.position()
+
+    async def goto(self, position: Position) -> None:
+        await self.check_positions(position)
+        with tracer.span('motion', 'scanner'):
+            await self._motion(self._goto, position)
+
+    async def _soft_limits_steps(self) -> Tuple[BaseAxes, BaseAxes]:
+        if self._soft_limits is None:
+            low = BaseAxes(*TRIMScanner._parse_A_res(await self._send_cmd('ALL'), scale=False))
+            high = BaseAxes(*TRIMScanner._parse_A_res(await self._send_cmd('AHL'), scale=False))
+            self._soft_limits = (low, high)
+        return self._soft_limits
+
+    async def soft_limits(self, refresh: bool = False) -> Tuple[Position, Position]:
+        """
+        Программные пределы сканера в мм, см. TRIMScanner.soft_limits
+        """
+        if refresh:
+            self._soft_limits = None
+        low, high = await self._soft_limits_steps()
+        return (
+            Position(*(v / scale for v, scale in zip(astuple(low), astuple(AXES_SCALE)))),
+            Position(*(v / scale for v, scale in zip(astuple(high), astuple(AXES_SCALE)))),
+        )
+
+    async def check_positions(self, positions) -> None:
+        """
+        Проверяет позиции по программным пределам без движения сканера, см. TRIMScanner.check_positions
+        """
+        indices = out_of_limits(positions, *await self._soft_limits_steps())
+        if len(indices):
+            low, high = await self.soft_limits()
+            shown = ', '.join(map(str, indices[:20])) + (', ...' if len(indices) > 20 else '')
+            raise ScannerLimitError(
+                f'{len(indices)} position(s) are outside of the software limits {low} - {high}: {shown}',
+                indices.tolist()
+            )
+
+    async def stop(self) -> None:
+        logger.info(f'Stopping...')
+        self._stop_generation += 1
+        await self._send_cmd('AST')
+
+    async def abort(self) -> None:
+        await self.stop()
+
+    async def position(self) -> Position:
+        res = await self._send_cmd('APS')
+        ans = Position(*TRIMScanner._parse_A_res(res))
+        self._signals.position.emit(ans)
+        return ans
+
+    async def velocity(self) -> Velocity:
+        self._signals.velocity.emit(self._velocity)
+        return self._velocity  # на данном сканере нельзя получить скорость
+
+    async def acceleration(self) -> Acceleration:
+        res = await self._send_cmd('AAC')
+        ans = Acceleration(*TRIMScanner._parse_A_res(res))
+        self._signals.acceleration.emit(ans)
+        return ans
+
+    async def deceleration(self) -> Deceleration:
+        res = await self._send_cmd('ADC')
+        ans = Deceleration(*TRIMScanner._parse_A_res(res))
+        self._signals.deceleration.emit(ans)
+        return ans
+
+    async def debug_info(self) -> str:
+        cmds = ['AAP', 'APS', 'AEM', 'AHL', 'ALL', 'AMM', 'ASM', 'AMO', 'AMS']
+        res = await self._send_cmds(cmds)
+        return "\n".join([f'{c}: {r}' for c, r in zip(cmds, res)])
+
+    @property
+    def is_connected(self) -> bool:
+        return self._is_connected
+
+    async def _home(self) -> None:
+        logger.info(f'Homing...')
+        old_velocity = await self.velocity()
+        await self.set_settings(velocity=old_velocity / 2)
+        await self.set_settings(**JOG_MODE_SETTINGS)
+
+        action_description = f'homing'
+        try:
+            await self._begin_motion_and_wait(['XBG', 'YBG', 'ZBG'])
+        finally:
+            await asyncio.shield(self.set_settings(velocity=old_velocity))
+            await asyncio.shield(self.set_settings(**PTP_MODE_SETTINGS))
+
+        await self._wait_settled(None, HOME_AXES)
+        stop_reasons = list(await self._end_of_motion_reason())
+        if not (stop_reasons[0] == stop_reasons[1] == stop_reasons[2] == 2):
+            raise scanner_motion_error(action_description, stop_reasons)
+
+    async def home(self) -> None:
+        await self._motion(self._home)
+
+    @property
+    def position_signal(self):
+        return self._signals.position
+
+    @property
+    def is_moving(self) -> bool:
+        return self._is_moving
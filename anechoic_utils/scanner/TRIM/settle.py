@@ -0,0 +1,109 @@
+"""
+Определение момента успокоения сканера после движения по показаниям энкодеров
+"""
+import math
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+from ..scanner import BaseAxes, Position
+
+
+@dataclass
+class SettleStats:
+    """
+    Статистика времени успокоения в секундах, отсчитывается от остановки двигателей (AMS=0)
+    """
+    count: int = 0
+    timeouts: int = 0
+    total_time: float = 0.
+    max_time: float = 0.
+    last_time: float = 0.
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.count if self.count else 0.
+
+    def add(self, settle_time: float, timeout: bool = False) -> None:
+        self.count += 1
+        self.timeouts += timeout
+        self.total_time += settle_time
+        self.max_time = max(self.max_time, settle_time)
+        self.last_time = settle_time
+
+
+@dataclass
+class SettleDetector:
+    """
+    Сканер считается успокоившимся, когда позиция энкодеров остается в пределах tolerance
+    от цели в течение window секунд. Если цель неизвестна (например, при парковке на концевики),
+    позиция сравнивается с предыдущим опросом, то есть ждется прекращение движения.
+
+    Детектор не опрашивает сканер сам: драйвер вызывает start, а затем update ожидания с каждым
+    новым показанием энкодеров, пока update не вернет True. Так одна логика используется
+    и в блокирующем, и в асинхронном драйвере, а одновременные движения разных осей
+    ждут успокоения независимо.
+    """
+    tolerance: BaseAxes = field(default_factory=lambda: BaseAxes(x=0.01, y=0.01, z=0.01, w=0.1))  # мм и градусы
+    window: float = 0.05
+    poll_interval: float = 0.01
+    timeout: float = 2.
+    stats: SettleStats = field(default_factory=SettleStats)
+
+    def start(self, target: Optional[BaseAxes], now: float) -> 'SettleWait':
+        """
+        Начать ожидание
+
+        :param target: заданная позиция, None -- ждать прекращения движения
+        :param now: время остановки двигателей, time.monotonic()
+        :return: ожидание
+        """
+        return SettleWait(self, target, now)
+
+
+class SettleWait:
+    """
+    Одно ожидание успокоения, создается SettleDetector.start
+    """
+    def __init__(self, detector: SettleDetector, target: Optional[BaseAxes], now: float):
+        self.detector = detector
+        self.target = target
+        self.started = now
+        self.timed_out = False
+        self._previous: Optional[BaseAxes] = None
+        self._inside_since: Optional[float] = None
+
+    def _inside(self, position: Position) -> bool:
+        reference = self.target if self.target is not None else self._previous
+        if reference is None:
+            return False
+        for axis in fields(BaseAxes):
+            ref, value = reference.__getattribute__(axis.name), position.__getattribute__(axis.name)
+            tolerance = self.detector.tolerance.__getattribute__(axis.name)
+            if ref is None or value is None or tolerance is None:
+                continue
+            if not math.fabs(value - ref) <= tolerance:
+                return False
+        return True
+
+    def update(self, position: Position, now: float) -> bool:
+        """
+        Учесть новое показание энкодеров
+
+        :param position: позиция энкодеров
+        :param now: время показания, time.monotonic()
+        :return: True, если сканер успокоился или истек timeout
+        """
+        inside = self._inside(position)
+        self._previous = position
+        if not inside:
+            self._inside_since = None
+        elif self._inside_since is None:
+            self._inside_since = now
+        if self._inside_since is not None and now - self._inside_since >= self.detector.window:
+            self.detector.stats.add(now - self.started)
+            return True
+        if now - self.started >= self.detector.timeout:
+            self.detector.stats.add(now - self.started, timeout=True)
+            self.timed_out = True
+            return True
+        return False
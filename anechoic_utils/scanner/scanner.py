@@ -5,7 +5,7 @@ import dataclasses
 from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass
 from numbers import Number
-from ..utils import EmptySignal
+from ..utils import Signal
 
 
 class ScannerConnectionError(Exception):
@@ -38,6 +38,16 @@ class ScannerMotionError(Exception):
         )
 
 
+class ScannerLimitError(ScannerMotionError):
+    """
+    Исключение, поднимаемое до начала движения, если позиции выходят за программные пределы сканера.
+    indices -- номера таких позиций
+    """
+    def __init__(self, message, indices=()):
+        self.indices = list(indices)
+        super().__init__(message)
+
+
 @dataclass
 class BaseAxes:
     """
@@ -134,42 +144,42 @@ class ScannerSignals(metaclass=ABCMeta):
 
     @property
     @abstractmethod
-    def position(self) -> EmptySignal:
+    def position(self) -> Signal:
         """
         Сигнал с позицией сканера
         """
 
     @property
     @abstractmethod
-    def velocity(self) -> EmptySignal:
+    def velocity(self) -> Signal:
         """
         Сигнал со скоростью сканера
         """
 
     @property
     @abstractmethod
-    def acceleration(self) -> EmptySignal:
+    def acceleration(self) -> Signal:
         """
         Сигнал с ускорением сканера
         """
 
     @property
     @abstractmethod
-    def deceleration(self) -> EmptySignal:
+    def deceleration(self) -> Signal:
         """
         Сигнал с замедлением сканера
         """
 
     @property
     @abstractmethod
-    def is_connected(self) -> EmptySignal:
+    def is_connected(self) -> Signal:
         """
         Сигнал с состоянием сканера
         """
 
     @property
     @abstractmethod
-    def is_moving(self) -> EmptySignal:
+    def is_moving(self) -> Signal:
         """
         Сигнал с состоянием сканера
         """
@@ -0,0 +1,195 @@
+"""
+Запись обмена с приборами и воспроизведение записи сервером, который отвечает как сканер или анализатор.
+
+Запись включается у драйвера: scanner.recorder = SessionRecorder('scanner.rec', 'trim').
+Воспроизведение:
+    python -m anechoic_utils.session scanner.rec --port 9000 --speed 1
+"""
+import argparse
+import socket
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+import logging
+logger = logging.getLogger('session')
+
+MAGIC = b'AUSESS'
+VERSION = 1
+# протокол -> разделитель команд
+PROTOCOLS = {'trim': b';', 'scpi': b'\n'}
+_HEADER = struct.Struct('<6sB4s')
+# время отправки от начала записи, длительность обмена (нс), длины команды и ответа
+_RECORD = struct.Struct('<qqII')
+
+
+@dataclass
+class Exchange:
+    """
+    Одна команда и ответ на нее
+    """
+    time: int  # нс от начала записи
+    duration: int  # нс от отправки команды до получения ответа
+    command: bytes
+    response: bytes
+
+
+class SessionRecorder:
+    """
+    Пишет каждую пару команда/ответ драйвера в компактный бинарный файл
+    """
+    def __init__(self, path: str, protocol: str):
+        """
+
+        :param path: файл записи
+        :param protocol: 'trim' для TRIMScanner, 'scpi' для SCPI анализаторов
+        """
+        if protocol not in PROTOCOLS:
+            raise ValueError(f'Unknown protocol {protocol}, expected one of {list(PROTOCOLS)}')
+        self.path, self.protocol = path, protocol
+        self._file: BinaryIO = open(path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, protocol.encode().ljust(4)))
+        self._lock = threading.Lock()
+        self._started = time.perf_counter_ns()
+        self.count = 0
+
+    def record(self, sent: int, received: int, command: bytes, response: bytes) -> None:
+        """
+        Записать обмен
+
+        :param sent: time.perf_counter_ns() перед отправкой команды
+        :param received: time.perf_counter_ns() после получения ответа
+        :param command: отправленные байты
+        :param response: полученные байты, пусто для команд без ответа
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(_RECORD.pack(sent - self._started, received - sent, len(command), len(response)))
+            self._file.write(command)
+            self._file.write(response)
+            self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def read_session(path: str) -> (str, List[Exchange]):
+    """
+    Прочитать запись
+
+    :return: протокол и список обменов
+    """
+    with open(path, 'rb') as f:
+        magic, version, protocol = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a session recording')
+        exchanges = []
+        while len(head := f.read(_RECORD.size)) == _RECORD.size:
+            t, duration, n_command, n_response = _RECORD.unpack(head)
+            command, response = f.read(n_command), f.read(n_response)
+            if len(command) != n_command or len(response) != n_response:
+                logger.warning(f'{path}: truncated record skipped')
+                break
+            exchanges.append(Exchange(t, duration, command, response))
+    return protocol.decode().strip(), exchanges
+
+
+class ReplayServer:
+    """
+    Отвечает на команды ответами из записи с исходными задержками, умноженными на speed.
+
+    Команды сопоставляются с записью по порядку. Если пришла не та команда, берется ближайшая
+    следующая такая же команда в записи, а если ее нет -- последний ответ на такую команду
+    (например, для лишних опросов AMS). Неизвестные команды получают ответ об ошибке ('?>' для TRIM)
+    или пустую строку для SCPI запросов. Расхождения считаются в mismatches.
+    """
+    def __init__(self, path: str, speed: float = 1.):
+        """
+
+        :param path: файл записи
+        :param speed: множитель задержек ответов, 0 -- отвечать сразу
+        """
+        self.protocol, self.exchanges = read_session(path)
+        self.separator = PROTOCOLS[self.protocol]
+        self.speed = speed
+        self.position = 0
+        self.mismatches = 0
+        self._last: Dict[bytes, Exchange] = {}
+
+    def _find(self, command: bytes) -> Optional[Exchange]:
+        for i in range(self.position, len(self.exchanges)):
+            if self.exchanges[i].command == command:
+                if i != self.position:
+                    self.mismatches += 1
+                for skipped in self.exchanges[self.position:i + 1]:
+                    self._last[skipped.command] = skipped
+                self.position = i + 1
+                return self.exchanges[i]
+        self.mismatches += 1
+        return self._last.get(command)
+
+    def respond(self, command: bytes) -> bytes:
+        """
+        Ответ на одну команду вместе с разделителем
+        """
+        exchange = self._find(command)
+        if exchange is None:
+            logger.warning(f'Command {command!r} is not in the recording')
+            if self.protocol == 'trim':
+                return command + b'?>'
+            return b'\n' if b'?' in command else b''
+        if self.speed:
+            time.sleep(exchange.duration * self.speed / 1e9)
+        return exchange.response
+
+    def commands(self, conn: socket.socket) -> Iterator[bytes]:
+        buffer = b''
+        while data := conn.recv(65536):
+            buffer += data
+            while (end := buffer.find(self.separator)) >= 0:
+                yield buffer[:end + 1]
+                buffer = buffer[end + 1:]
+
+    def serve(self, ip: str = '127.0.0.1', port: int = 9000) -> None:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((ip, port))
+            s.listen()
+            while True:
+                conn, addr = s.accept()
+                with conn:
+                    for command in self.commands(conn):
+                        if response := self.respond(command):
+                            conn.sendall(response)
+
+
+def run(path: str, blocking=True, ip='127.0.0.1', port=9000, speed: float = 1.) -> ReplayServer:
+    server = ReplayServer(path, speed)
+    server_thread = threading.Thread(target=server.serve, args=(ip, port), daemon=not blocking)
+    print(f'Replaying {len(server.exchanges)} {server.protocol} exchanges')
+    server_thread.start()
+    if blocking:
+        server_thread.join()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded scanner or analyzer session')
+    parser.add_argument('path')
+    parser.add_argument('--ip', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--speed', type=float, default=1., help='response delay multiplier, 0 for no delay')
+    args = parser.parse_args()
+    run(args.path, ip=args.ip, port=args.port, speed=args.speed)
@@ -0,0 +1,130 @@
+"""
+Трассировка точек скана: вложенные интервалы (span) в кольцевом буфере с экспортом в формат
+trace-event JSON для chrome://tracing и Perfetto.
+
+По умолчанию выключена, выключенный tracer.span возвращает пустой контекстный менеджер.
+"""
+import collections
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# дорожка (строка в просмотрщике) текущего кода, например имя камеры; по умолчанию -- поток
+_track: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('trace_track', default=None)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: Dict):
+        self.tracer, self.name, self.cat, self.args = tracer, name, cat, args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter_ns()
+        track = _track.get()
+        self.tracer._events.append((
+            self.name, self.cat, self.start, end - self.start,
+            track if track is not None else threading.get_ident(), self.args,
+        ))
+
+
+class Tracer:
+    """
+    Хранит последние capacity интервалов. Интервалы одной дорожки, вложенные по времени,
+    отображаются в просмотрщике вложенными
+    """
+    def __init__(self, capacity: int = 100_000):
+        self.enabled = False
+        self._events = collections.deque(maxlen=capacity)
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def clear(self) -> None:
+        self._events.clear()
+
+    @property
+    def capacity(self) -> int:
+        return self._events.maxlen
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def span(self, name: str, cat: str = 'scan', **args):
+        """
+        Интервал: with tracer.span('sweep', parameters=2): ...
+
+        :param name: имя интервала
+        :param cat: категория
+        :param args: дополнительные данные, видны в просмотрщике
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    @staticmethod
+    @contextmanager
+    def track(name: str):
+        """
+        Все интервалы внутри блока, в том числе в asyncio задачах и asyncio.to_thread, попадают на дорожку name
+        """
+        token = _track.set(name)
+        try:
+            yield
+        finally:
+            _track.reset(token)
+
+    def to_chrome(self) -> Dict:
+        """
+        События в формате trace-event JSON
+        """
+        events, tids = [], {}
+        pid = os.getpid()
+        for name, cat, start, duration, track, args in list(self._events):
+            if (tid := tids.get(track)) is None:
+                tid = tids[track] = len(tids) + 1
+                events.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                    'args': {'name': track if isinstance(track, str) else f'thread {track}'},
+                })
+            events.append({
+                'name': name, 'cat': cat, 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': start / 1000, 'dur': duration / 1000,
+                'args': {key: value if isinstance(value, (int, float, str, bool)) else repr(value)
+                         for key, value in args.items()},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome(self, path: str) -> None:
+        """
+        Сохранить трассировку, файл открывается в chrome://tracing или https://ui.perfetto.dev
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome(), f)
+
+
+tracer = Tracer()
@@ -1,5 +1,15 @@
+import asyncio
 import collections
+import heapq
+import itertools
+import logging
 import threading
+import time
+from typing import Callable, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger('utils')
 
 
 class EmptySignal:
@@ -19,13 +29,203 @@ class EmptySignal:
         return self
 
 
+class ThreadDispatcher:
+    """
+    Поток доставки сигналов. Подписчики вызываются в нем, а не в потоке, который вызвал emit,
+    поэтому медленный подписчик не задерживает движение сканера или измерение.
+    """
+    def __init__(self, name: str = 'signal-dispatcher'):
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, callback: Callable[[], None], delay: float = 0.) -> None:
+        """
+        Вызвать callback в потоке доставки не раньше, чем через delay секунд
+        """
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), callback))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._condition.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                _, _, callback = heapq.heappop(self._queue)
+            callback()
+
+
+class AsyncioDispatcher:
+    """
+    Доставка сигналов в event loop asyncio. emit можно вызывать из любого потока.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def schedule(self, callback: Callable[[], None], delay: float = 0.) -> None:
+        if delay > 0:
+            self.loop.call_soon_threadsafe(self.loop.call_later, delay, callback)
+        else:
+            self.loop.call_soon_threadsafe(callback)
+
+
+class _Subscription:
+    """
+    Подписчик сигнала со своей очередью значений
+    """
+    def __init__(self, slot: Callable, dispatcher, coalesce: bool, max_rate: Optional[float], maxlen: Optional[int]):
+        self.slot = slot
+        self.dispatcher = dispatcher
+        self.coalesce = coalesce
+        self.min_interval = 1 / max_rate if max_rate else 0.
+        self._pending = collections.deque(maxlen=1 if coalesce else maxlen)
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._last = -float('inf')
+        self._trailing = None
+        self._timer: threading.Timer = None
+
+    def push(self, args, kwargs):
+        now = time.monotonic()
+        if self.dispatcher is None:
+            with self._lock:
+                wait = self._last + self.min_interval - now
+                if wait > 0:
+                    # значение внутри окна не теряется: последнее из них доставляется в конце окна
+                    self._trailing = (args, kwargs)
+                    if self._timer is None:
+                        self._timer = threading.Timer(wait, self._deliver_trailing)
+                        self._timer.daemon = True
+                        self._timer.start()
+                    return
+                self._trailing = None
+                self._last = now
+            self.slot(*args, **kwargs)
+            return
+        with self._lock:
+            self._pending.append((args, kwargs))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.dispatcher.schedule(self._deliver, max(0., self._last + self.min_interval - now))
+
+    def _deliver_trailing(self):
+        with self._lock:
+            self._timer = None
+            item, self._trailing = self._trailing, None
+            if item is None:
+                return
+            self._last = time.monotonic()
+        args, kwargs = item
+        try:
+            self.slot(*args, **kwargs)
+        except Exception:
+            logger.exception(f'Error in signal subscriber {self.slot}')
+
+    def _deliver(self):
+        with self._lock:
+            items = list(self._pending)
+            self._pending.clear()
+            self._scheduled = False
+            self._last = time.monotonic()
+        for args, kwargs in items:
+            try:
+                self.slot(*args, **kwargs)
+            except Exception:
+                logger.exception(f'Error in signal subscriber {self.slot}')
+
+
+class Signal:
+    """
+    Сигнал с подписчиками. Интерфейс совпадает с EmptySignal.
+
+    Список подписчиков -- неизменяемый кортеж, который заменяется целиком при connect/disconnect,
+    поэтому emit не берет блокировок. Без dispatcher подписчики вызываются синхронно в потоке emit.
+    С ThreadDispatcher или AsyncioDispatcher emit только кладет значение в очередь подписчика.
+    coalesce=True оставляет в очереди только последнее значение (например, для позиции),
+    max_rate ограничивает частоту вызовов подписчика, последнее значение всегда доставляется.
+    """
+    def __init__(self, dispatcher=None):
+        """
+
+        :param dispatcher: доставщик по умолчанию для новых подписчиков
+        """
+        self.dispatcher = dispatcher
+        self._subscriptions = ()
+        self._write_lock = threading.Lock()
+
+    def connect(
+            self,
+            slot: Callable,
+            coalesce: bool = False,
+            max_rate: float = None,
+            maxlen: int = None,
+            dispatcher=...,
+    ) -> None:
+        """
+        Подписка на сигнал
+
+        :param slot: подписчик
+        :param coalesce: доставлять только последнее значение
+        :param max_rate: максимальная частота вызовов в Гц. Без доставщика из значений внутри окна
+            доставляется только последнее, в конце окна из потока таймера,
+            с доставщиком -- накапливаются и доставляются с задержкой
+        :param maxlen: максимальная длина очереди подписчика, старые значения отбрасываются
+        :param dispatcher: доставщик для этого подписчика, None -- синхронный вызов
+        """
+        if dispatcher is ...:
+            dispatcher = self.dispatcher
+        subscription = _Subscription(slot, dispatcher, coalesce, max_rate, maxlen)
+        with self._write_lock:
+            self._subscriptions = self._subscriptions + (subscription, )
+
+    def disconnect(self, slot: Callable = None) -> None:
+        """
+        Отписка. Без аргументов отписывает всех
+        """
+        with self._write_lock:
+            self._subscriptions = tuple(
+                s for s in self._subscriptions if slot is not None and s.slot != slot
+            )
+
+    def emit(self, *args, **kwargs) -> None:
+        for subscription in self._subscriptions:
+            subscription.push(args, kwargs)
+
+    def __getitem__(self, *args, **kwargs):
+        return self
+
+
+class InstanceSignal:
+    """
+    Дескриптор, который создает отдельный Signal для каждого экземпляра класса сигналов.
+    Используется вместо общего атрибута класса, чтобы сигналы разных приборов не смешивались.
+    """
+    def __init__(self, dispatcher=None):
+        self.dispatcher = dispatcher
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__.setdefault(self.name, Signal(self.dispatcher))
+
+
 class FIFOLock(object):
     """
     FIFO Lock, который гарантирует поочередное выполнение запросов
     https://gist.github.com/vitaliyp/6d54dd76ca2c3cdfc1149d33007dc34a
 
+    При включенных метриках время ожидания записывается в lock_wait_seconds{lock=name}
     """
-    def __init__(self):
+    def __init__(self, name: str = 'FIFOLock'):
+        self.name = name
         self._lock = threading.Lock()
         self._inner_lock = threading.Lock()
         self._pending_threads = collections.deque()
@@ -34,6 +234,8 @@ class FIFOLock(object):
         with self._inner_lock:
             lock_acquired = self._lock.acquire(False)
             if lock_acquired:
+                if metrics.enabled:
+                    metrics.observe('lock_wait_seconds', 0., lock=self.name)
                 return True
             elif not blocking:
                 return False
@@ -41,8 +243,12 @@ class FIFOLock(object):
             release_event = threading.Event()
             self._pending_threads.append(release_event)
 
+        started = time.perf_counter() if metrics.enabled else None
         release_event.wait()
-        return self._lock.acquire()
+        res = self._lock.acquire()
+        if started is not None:
+            metrics.observe('lock_wait_seconds', time.perf_counter() - started, lock=self.name)
+        return res
 
     def release(self):
         with self._inner_lock:
@@ -0,0 +1,18 @@
+import numpy as np
+
+from anechoic_utils.scan import Checkpoint, ScanPlan
+
+
+def test_mark_integer_grid(tmp_path):
+    plan = ScanPlan.grid(['S21'], x=np.arange(3), y=np.arange(2))
+    path = str(tmp_path / 'scan.checkpoint')
+    with Checkpoint(path, plan) as checkpoint:
+        for index, position in enumerate(plan):
+            if index < 4:
+                checkpoint.mark(index, position)
+
+    restored = Checkpoint(path, plan)
+    assert restored.completed == {0, 1, 2, 3}
+    assert restored.first_unfinished() == 4
+    assert restored.last_position.x == 1. and restored.last_position.y == 1.
+    assert restored.last_position.z is None
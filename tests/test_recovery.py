@@ -0,0 +1,89 @@
+import asyncio
+import socket
+import threading
+
+import numpy as np
+
+from anechoic_utils.analyzator.socket_analyzer import SocketAnalyzer, analyzer_emulator
+from anechoic_utils.scan import Chamber, Checkpoint, ScanPlan
+from anechoic_utils.scanner.TRIM import TRIMScanner, TRIM_emulator
+from conftest import free_port, wait_listening
+
+
+class Proxy:
+    """
+    TCP прокси до прибора, drop() рвет все текущие соединения, как при потере связи
+    """
+    def __init__(self, port: int):
+        self.target = ('127.0.0.1', port)
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.sockets = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client = self.server.accept()[0]
+            upstream = socket.create_connection(self.target)
+            self.sockets += [client, upstream]
+            threading.Thread(target=self._pipe, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(upstream, client), daemon=True).start()
+
+    @staticmethod
+    def _pipe(src: socket.socket, dst: socket.socket):
+        try:
+            while data := src.recv(65536):
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for s in (src, dst):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def drop(self):
+        for s in self.sockets:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            s.close()
+        self.sockets = []
+
+
+def test_scan_resumes_after_analyzer_connection_loss(tmp_path):
+    scanner_port, analyzer_port = free_port(), free_port()
+    TRIM_emulator.run(blocking=False, port=scanner_port, motion_time=0.05)
+    analyzer_emulator.run(blocking=False, port=analyzer_port)
+    wait_listening(scanner_port)
+    wait_listening(analyzer_port)
+    proxy = Proxy(analyzer_port)
+
+    plan = ScanPlan.grid(['S21'], x=np.arange(3), y=np.arange(2))
+    scanner = TRIMScanner('127.0.0.1', scanner_port)
+    analyzer = SocketAnalyzer('127.0.0.1', proxy.port)
+    measured = []
+
+    def on_point(chamber, index, position, result):
+        measured.append(index)
+        if index == 2:
+            proxy.drop()
+
+    chamber = Chamber('test', scanner, analyzer, plan, on_point=on_point,
+                      checkpoint=Checkpoint(str(tmp_path / 'scan.checkpoint'), plan), reconnect_delay=0.)
+
+    async def main():
+        await chamber.connect()
+        try:
+            return await chamber.run()
+        finally:
+            await chamber.disconnect()
+
+    stats = asyncio.run(main())
+    chamber.checkpoint.close()
+    assert stats.reconnects == 1
+    assert stats.points_done == len(plan)
+    assert measured == list(range(len(plan)))
+    assert Checkpoint(str(tmp_path / 'scan.checkpoint'), plan).finished
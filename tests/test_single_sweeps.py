@@ -0,0 +1,64 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from anechoic_utils.analyzator.averaging import HostAveraging
+from anechoic_utils.analyzator.ifbw import calibrate_ifbw
+from anechoic_utils.analyzator.socket_analyzer import AsyncSocketAnalyzer, SocketAnalyzer, analyzer_emulator
+from conftest import free_port, wait_listening
+
+
+@pytest.fixture(scope='module')
+def analyzer_port():
+    port = free_port()
+    analyzer_emulator.run(blocking=False, port=port)
+    wait_listening(port)
+    return port
+
+
+@pytest.fixture
+def analyzer(analyzer_port):
+    analyzer = SocketAnalyzer('127.0.0.1', analyzer_port)
+    analyzer.connect()
+    analyzer.set_settings(freq_num=21, bandwidth=1e5)
+    yield analyzer
+    analyzer.disconnect()
+
+
+def test_trace_defined_after_sweep_is_empty(analyzer):
+    # эмулятор ведет себя как прибор, иначе порядок команд не проверить
+    with analyzer.single_sweeps():
+        analyzer.trigger_sweep()
+        assert np.isnan(analyzer.get_scattering_parameters(['S21'])['S21']).all()
+
+
+def test_single_sweeps_defines_traces_before_sweep(analyzer):
+    with analyzer.single_sweeps(['S21', 'S11']):
+        analyzer.trigger_sweep()
+        result = analyzer.get_scattering_parameters(['S21', 'S11'])
+    assert np.isfinite(result['S21']).all() and np.isfinite(result['S11']).all()
+    assert analyzer._traces == {}
+    assert analyzer._send_cmd('INIT1:CONT?').strip() == '1'
+
+
+def test_host_averaging(analyzer):
+    result = HostAveraging(max_count=2).measure(analyzer, ['S21'])
+    assert result.count == 2
+    assert np.isfinite(result['S21']).all()
+
+
+def test_calibrate_ifbw(analyzer):
+    calibration = calibrate_ifbw(analyzer, ['S21'], bandwidths=(1e4, 1e5), sweeps=2)
+    assert np.isfinite(calibration.signal).all()
+    assert analyzer.bandwidth() == 1e5
+
+
+def test_host_averaging_async(analyzer_port):
+    async def main():
+        async with AsyncSocketAnalyzer('127.0.0.1', analyzer_port, cmd_delay=0.01) as analyzer:
+            await analyzer.set_settings(freq_num=21, bandwidth=1e5)
+            return await HostAveraging(max_count=2).measure_async(analyzer, ['S21'])
+
+    result = asyncio.run(main())
+    assert np.isfinite(result['S21']).all()